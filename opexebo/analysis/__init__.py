@@ -6,9 +6,13 @@ from .spatial_occupancy import spatial_occupancy
 from .rate_map import rate_map
 from .rate_map_stats import rate_map_stats
 from .rate_map_coherence import rate_map_coherence
-from .place_field import place_field
+from .place_field import place_field, place_field_map
+from .place_field_batch import place_field_batch
+from .place_field_1d import place_field_1d
 from .autocorrelation import autocorrelation
 from .grid_score import grid_score, grid_score_stats
+from .grid_score_batch import grid_score_batch
+from .grid_score_shuffle import grid_score_shuffle
 from .egocentric_occupancy import egocentric_occupancy
 
 # 1D angular functions : functional
@@ -27,7 +31,8 @@ from .border_score import border_score
 
 __all__ = ["calc_speed", 
         "spatial_occupancy", "rate_map", "rate_map_stats", "rate_map_coherence",
-        "grid_score", "grid_score_stats", "autocorrelation", "place_field", 
+        "grid_score", "grid_score_stats", "grid_score_batch", "grid_score_shuffle",
+        "autocorrelation", "place_field", "place_field_map", "place_field_batch", "place_field_1d",
         "egocentric_occupancy",
            "angular_occupancy", "tuning_curve", "tuning_curve_stats", 
            "population_vector_correlation", "theta_modulation_index",
@@ -9,7 +9,7 @@ import numpy as np
 import opexebo
 
 
-def autocorrelation(firing_map):
+def autocorrelation(firing_map, **kwargs):
     """Calculate 2D spatial autocorrelation of a firing map.
 
     Parameters
@@ -17,15 +17,30 @@ def autocorrelation(firing_map):
     firing_map: np.ndarray
         NxM matrix, smoothed firing map. map is not necessary a numpy array. 
         May contain NaNs.
+        A KxNxM stack of firing maps of the same shape may also be provided,
+        in which case all K autocorrelograms are calculated together
+
+    Other Parameters
+    ----------------
+    masked: bool
+        If True, NaN and masked bins are excluded from the correlation with
+        `opexebo.general.normxcorr2_masked`, rather than being replaced by
+        zero. This is the preferred approach for arenas in which many bins
+        are never visited, such as circular arenas, but values differ from
+        historical (BNT) autocorrelograms. Default False
+    workers: int
+        Number of threads used for the FFT. Default 1
 
     Returns
     -------
     acorr: np.ndarray
-        Resulting correlation matrix, which is a 2D numpy array.
+        Resulting correlation matrix, which is a 2D numpy array, or a 3D
+        stack of correlation matrices if a stack of firing maps is provided
 
     See Also
     --------
     opexebo.general.normxcorr2_general
+    opexebo.general.normxcorr2_masked
         
     Notes
     -----
@@ -39,24 +54,29 @@ def autocorrelation(firing_map):
     # do not what everyone to use their own overlap value.
     # Should be a value in range [0, 1]
     overlap_amount = 0.8
-    slices = []
+    masked = kwargs.pop("masked", False)
 
-    if type(firing_map) != np.ndarray:
+    if masked and isinstance(firing_map, np.ma.MaskedArray):
+        pass
+    elif type(firing_map) != np.ndarray:
         firing_map = np.array(firing_map)
 
     if firing_map.size == 0:
         return firing_map
 
-    # make sure there are no NaNs in the firing_map
-    firing_map = np.nan_to_num(firing_map)
-
     # get full autocorrelgramn
-    aCorr = opexebo.general.normxcorr2_general(firing_map)
+    if masked:
+        aCorr = opexebo.general.normxcorr2_masked(firing_map, **kwargs)
+    else:
+        # make sure there are no NaNs in the firing_map
+        firing_map = np.nan_to_num(firing_map)
+        aCorr = opexebo.general.normxcorr2_general(firing_map, **kwargs)
 
     # we are only interested in a portion of the autocorrelogram. Since the values
     # on edges are too noise (due to the fact that very small amount of elements
-    # are correlated).
-    for i in range(firing_map.ndim):
+    # are correlated). Only the map axes are cropped, not the stack axis
+    slices = [slice(None)] * (firing_map.ndim - 2)
+    for i in range(firing_map.ndim - 2, firing_map.ndim):
         new_size = np.round(firing_map.shape[i] + firing_map.shape[i] * overlap_amount)
         if new_size % 2 == 0:
             new_size = new_size - 1
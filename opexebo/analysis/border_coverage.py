@@ -1,6 +1,7 @@
 """Provide function for calculating a Border Score"""
 
 import numpy as np
+from scipy import ndimage
 from scipy.ndimage import distance_transform_edt
 
 import opexebo.defaults as default
@@ -27,8 +28,12 @@ def border_coverage(fields, arena_shape, **kwargs):
 
     Parameters
     ----------
-    fields: dict or list of dicts
-        One dictionary per field. Each dictionary must contain the keyword field_map
+    fields: dict or list of dicts, or np.ndarray
+        One dictionary per field. Each dictionary must contain the keyword field_map.
+        Alternatively, an array of integer labelled fields, such as `fields_map`
+        returned by `opexebo.analysis.place_field` (background = 0). In this
+        case, fields that do not lie within `search_width` of a wall are skipped
+        without evaluating their coverage of that wall
     arena_shape: {"square", "rect", "circle", "line"}
         Rectangular and square are equivalent. Elliptical or n!=4 polygons
         not currently supported.
@@ -91,15 +96,6 @@ def border_coverage(fields, arena_shape, **kwargs):
     else:
         raise NotImplementedError(f"Border coverage is not implemented for arena shape `{arena_shape}`")
     
-    if isinstance(fields, dict):
-        # Deal with the case of being passed a single field, instead of a list of fields
-        fields = [fields]
-    elif not isinstance(fields, (list, tuple, np.ndarray)):
-        raise ValueError(f"You must supply either a dictionary, or list of dictionaries, of fields. You provided type '{type(fields)}'")
-    for i, field in enumerate(fields):
-        if kw_field_map not in field.keys():
-            raise KeyError(f"field dictionary {i} does not have keyword '{kw_field_map}'.")
-
     # Extract keyword arguments or set defaults
     search_width = kwargs.get('search_width', default.search_width)
     walls = kwargs.get('walls', default.walls)
@@ -107,23 +103,71 @@ def border_coverage(fields, arena_shape, **kwargs):
     # Perform validation of the `walls` argument
     walls = _validate_keyword_walls(walls, arena_shape)
 
+    if isinstance(fields, dict):
+        # Deal with the case of being passed a single field, instead of a list of fields
+        fields = [fields]
+    if _is_label_map(fields):
+        field_maps = _fields_from_label_map(fields, walls, search_width, arena_shape)
+    elif isinstance(fields, (list, tuple, np.ndarray)):
+        for i, field in enumerate(fields):
+            if kw_field_map not in field.keys():
+                raise KeyError(f"field dictionary {i} does not have keyword '{kw_field_map}'.")
+        field_maps = [(field[kw_field_map], walls) for field in fields]
+    else:
+        raise ValueError(f"You must supply either a dictionary, or list of dictionaries, of fields. You provided type '{type(fields)}'")
+
     if debug:
         print("===== border_coverage =====")
         print(f"arena_shape: {arena_shape}")
         print(f"coverage method: {calculate_coverage}")
         print(f"walls: {walls}")
-        print(f"num fields: {len(fields)}")
+        print(f"num field maps: {len(field_maps)}")
 
     coverage = 0
-    for field in fields:
-        fmap = field[kw_field_map]
-        for wall in walls:
+    for fmap, field_walls in field_maps:
+        for wall in field_walls:
             c = calculate_coverage(fmap, wall, search_width, debug)
             coverage = max(coverage, c)
     
     return coverage
 
 
+def _fields_from_label_map(labels, walls, search_width, arena_shape):
+    '''
+    Convert an integer array of labelled fields to a list of `(field_map, walls)`
+    pairs: the binary map of a field (preserving any mask), and the walls
+    against which its coverage should be evaluated.
+
+    In rectangular arenas, the bounding box of each field is used to exclude
+    the walls that the field does not come within `search_width` of: the
+    coverage of such a wall is zero. For each remaining wall, the field map
+    is only built over the strip within `search_width` of that wall, which is
+    all that _calculate_coverage_rect() uses.
+    '''
+    mask = np.ma.getmask(labels)
+    data = np.ma.getdata(labels).astype(np.int64)
+    num_rows, num_cols = data.shape
+    strips = {"l": np.s_[:, :search_width], "r": np.s_[:, -search_width:],
+              "b": np.s_[:search_width, :], "t": np.s_[-search_width:, :]}
+    field_maps = []
+    for label, box in enumerate(ndimage.find_objects(data), start=1):
+        if box is None:
+            continue
+        if arena_shape in default.shapes_square:
+            rows, cols = box
+            near = {"l": cols.start < search_width, "r": cols.stop > num_cols - search_width,
+                    "b": rows.start < search_width, "t": rows.stop > num_rows - search_width}
+            regions = [(strips[wall], wall) for wall in walls if near[wall]]
+        else:
+            regions = [(np.s_[:, :], walls)]
+        for region, region_walls in regions:
+            fmap = (data[region] == label).astype(float)
+            if mask is not np.ma.nomask:
+                fmap = np.ma.masked_where(mask[region], fmap)
+            field_maps.append((fmap, region_walls))
+    return field_maps
+
+
 ###############################################################################
 ####            Helper functions : CIRCULAR arenas
 ###############################################################################
@@ -410,6 +454,20 @@ def _get_aux_map_rect(fmap, wall, search_width):
 ####            Helper functions : Misc
 ###############################################################################
 
+def _is_label_map(fields):
+    '''True if `fields` is a 2D array of labelled fields: either of integer
+    type, or of float type with only integer values, as `fields_map` is
+    returned by `opexebo.analysis.place_field`'''
+    if not (isinstance(fields, np.ndarray) and fields.ndim == 2):
+        return False
+    if fields.dtype.kind in "iu":
+        return True
+    if fields.dtype.kind == "f":
+        data = np.ma.getdata(fields)
+        return bool(np.all(np.isfinite(data)) and np.all(data == np.round(data)))
+    return False
+
+
 def _validate_keyword_walls(walls, shape):
     '''Parse the walls keyword to be sure that it is valid and conforms to requirements.
     Logic is complicated due to the wildly diverging approach of the square and circular arena shapes
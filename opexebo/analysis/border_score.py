@@ -51,10 +51,14 @@ def border_score(rate_map, fields_map, fields, arena_shape, **kwargs):
         Cells that are members of field have the value corresponding to field_id 
         (non-zero positive  unique integers. Not necessarily contiguous 
         (e.g. 1, 2, 3, 5)). Cells that are not members of fields have value zero
-    fields:  list of  dict
+    fields:  list of  dict, np.ndarray or None
         List of dictionaries of firing fields. 
         Each dictionary must, at least, contain the keyword "field_map", yielding a 
-        binary map of that field within the overall arena
+        binary map of that field within the overall arena.
+        Alternatively, the structured array of fields returned by
+        `opexebo.analysis.place_field` with `output="compact"`, in which case
+        only the listed fields of `fields_map` are considered; or None, in
+        which case every field of `fields_map` is considered
     arena_shape: {"square", "rect", "circle", "line"}
         Rectangular and square are equivalent. Elliptical or n!=4 polygons
         not currently supported.
@@ -118,6 +122,12 @@ def border_score(rate_map, fields_map, fields, arena_shape, **kwargs):
     fields_map_unlabelled = np.copy(fields_map)
     fields_map_unlabelled[fields_map> 1 ] = 1
 
+    if fields is None:
+        fields = np.ma.asarray(fields_map).astype(np.int64)
+    elif isinstance(fields, np.ndarray) and fields.dtype.names is not None:
+        # Compact field table: keep only the listed fields of the label map
+        keep = np.isin(np.ma.getdata(fields_map), fields["field"])
+        fields = np.ma.where(keep, fields_map, 0).astype(np.int64)
     coverage = border_coverage(fields, arena_shape, **kwargs)
 
     fields_rate_map = fields_map_unlabelled * rate_map
@@ -2,14 +2,18 @@
 Provide function for gridness score calculation.
 """
 
-import numpy as np
+import collections.abc
+import copy
+import functools
 
+import numpy as np
+from scipy import ndimage, sparse
 from scipy.spatial.distance import cdist
-from scipy.stats import pearsonr
-from skimage import transform
+from skimage import morphology
 import opexebo
 import opexebo.defaults as default
 import opexebo.errors as err
+from opexebo.analysis.place_field import _peak_fields
 
 
 # This is included as the return result of an invalid autocorrelogram
@@ -25,6 +29,14 @@ INVALID_OUTPUT = (np.nan, {'grid_spacings': np.array([np.nan, np.nan, np.nan]),
   'grid_ellipse_aspect_ratio': np.nan,
   'grid_ellipse_theta': np.nan})
 
+# Angles (in degrees) by which the autocorrelogram is rotated to evaluate the
+# gridness. Correlations at 60 and 120 degrees are expected to be high, and at
+# 30, 90 and 150 degrees to be low, for a hexagonal grid
+ROTATION_ANGLES = np.arange(30, 151, 30)  # 30, 60, 90, 120, 150
+
+# Radial resolution of the polar grid used by the polar rotation method [bins]
+_POLAR_RADIAL_STEP = 0.5
+
 
 def grid_score(aCorr, **kwargs):
     """Calculate gridness score for an autocorrelogram.
@@ -49,10 +61,25 @@ def grid_score(aCorr, **kwargs):
     min_orientation: int
         See function "grid_score_stats"
     search_method: str
-        Peak searching method, currently limited to either `default` or `sep`
+        Peak searching method, currently limited to `default`, `sep` or `ndimage`
     bin_width: float
         Size of the bins. Distance units will be returned in the same units
         If not provided, distance units will be retuned in units [bins]
+    rotation_method: str
+        How the rotated autocorrelograms are obtained. Default `cartesian`
+        * `cartesian`: the autocorrelogram is interpolated five times, once
+          for each rotation angle, on its original grid
+        * `polar`: the autocorrelogram is interpolated once onto a polar grid,
+          and each rotation is a circular shift along the angular axis. This
+          is considerably faster, but not numerically identical, see Notes
+    polar_angle_step: float
+        Angular resolution in [degrees] of the polar grid. Must divide 30.
+        Default 1
+    lazy_stats: bool
+        If True, `grid_stats` is returned as a read-only mapping whose values
+        are calculated on first access, rather than as a dictionary. This
+        avoids the cost of `grid_score_stats` where only the score is needed.
+        Default False
 
     Returns
     -------
@@ -93,93 +120,78 @@ def grid_score(aCorr, **kwargs):
     -----
     BNT.+analyses.gridnessScore
 
+    The `polar` rotation method differs from the `cartesian` method in three
+    ways: the autocorrelogram is sampled at points on a polar grid rather than
+    at bin centres, so the ring membership and interpolation errors differ;
+    the polar samples are weighted by their radius to account for the area
+    they represent; and rotations are exact within the polar grid, rather than
+    interpolated. For smooth autocorrelograms, scores typically agree to within
+    a few hundredths. Use the `cartesian` method for values comparable to
+    historical (BNT) values.
+
     Copyright (C) 2018 by Vadim Frolov, (C) 2019 by Simon Ball, Horst Obenhaus
     """
     debug = kwargs.get("debug", False)
+    rotation_method = _validate_rotation_method(**kwargs)
 
     # normalize aCorr in order to find contours
     aCorr = aCorr / aCorr.max()
     centre = -0.5 + np.array(aCorr.shape)/2 # centre : also [y, x]
-    cFieldRadius = int(np.floor(_findCentreRadius(aCorr, **kwargs)))
+    cFieldRadius = int(_centre_field_radii(aCorr[np.newaxis], **kwargs)[0])
 
     if cFieldRadius == 0:
         if debug:
             print("Terminating due to invalid cFieldRadius")
         return INVALID_OUTPUT
 
-    halfHeight = np.ceil(aCorr.shape[0]/2)
-    halfWidth  = np.ceil(aCorr.shape[1]/2)
-    heightIndices = np.arange(aCorr.shape[0])
-    widthIndices  = np.arange(aCorr.shape[1])
-
     # Define radii that will be iterated over for the gridness score
     # outer bound is defined by the minimum of autocorrelogram's dimensions
     # this is need for rectangular autocorrelograms.
-    outerBound = int(np.floor(np.min(np.array(aCorr.shape)/2)))
+    outerBound = _outer_bound(aCorr.shape)
     if outerBound < cFieldRadius:
         if debug:
             print("Terminating due to invalid outerBound"\
                   f" ({outerBound} < {cFieldRadius})")
         return INVALID_OUTPUT
-        
-    radii = np.linspace(max(3, cFieldRadius+1), outerBound, outerBound-cFieldRadius)
-    radii = radii.astype(int)
+
+    radii = _gridness_radii(cFieldRadius, outerBound)
     numSteps = len(radii)
     if numSteps < 1:
         if debug:
             print("Terminating due to invalud numSteps")
         return INVALID_OUTPUT
 
-    rotAngles_deg = np.arange(30, 151, 30)  # 30, 60, 90, 120, 150
-    rotatedACorr = np.zeros(
-            shape=(aCorr.shape[0], aCorr.shape[1], len(rotAngles_deg)),
-            dtype=float)
-    # we get rotated maps here as it is a heavy operation
-    for n, angle in enumerate(rotAngles_deg):
-        rotatedACorr[:, :, n] = transform.rotate(aCorr, angle,
-                                            preserve_range=True, clip=False)
-    rr, cc = np.meshgrid(widthIndices, heightIndices, sparse=False)
-    # This is needed for compatibility with Matlab's code
-    rr += 1
-    cc += 1
-    mainCircle = np.sqrt(np.power((rr - halfWidth), 2) + np.power(cc-halfHeight, 2))
-    innerCircle = mainCircle > cFieldRadius
-
-
+    rotAngles_deg = ROTATION_ANGLES
+    if rotation_method == "polar":
+        angle_step = kwargs.get("polar_angle_step", default.polar_angle_step)
+        rotCorr = _polar_ring_correlations(aCorr[np.newaxis], np.array([cFieldRadius]),
+                                           radii, angle_step)[0]
+    else:
+        # The rotation operator and distance map depend only on the shape of
+        # the autocorrelogram, and are cached between calls
+        operator, mainCircle = _rotation_operator(aCorr.shape, tuple(rotAngles_deg), 1)
+        rotatedACorr = (operator @ aCorr.ravel()).reshape(len(rotAngles_deg), -1)
+
+        # Correlation of the original and rotated maps within the ring
+        # cFieldRadius < distance < radius, for every radius in a single pass
+        rotCorr = _ring_correlations(aCorr.reshape(1, -1), rotatedACorr[np.newaxis],
+                                     mainCircle, np.array([cFieldRadius]), radii)[0]
     GNS = np.zeros(shape=(numSteps, 2), dtype=float)
-    for i, radius in enumerate(radii):
-        mask = innerCircle & (mainCircle < radius)
-        aCorrValues = aCorr[mask]
-
-        rotCorr = np.zeros_like(rotAngles_deg).astype(float)
-        for j, angle in enumerate(rotAngles_deg):
-            rotatedValues = rotatedACorr[mask, j]
-            r, _ = pearsonr(aCorrValues, rotatedValues)
-            rotCorr[j] = r
-        GNS[i, 0] = np.min(rotCorr[[1, 3]]) - np.max(rotCorr[[0, 2, 4]])
-        GNS[i, 1] = radius
+    GNS[:, 0] = _gridness(rotCorr)
+    GNS[:, 1] = radii
 
     # find the greatest gridness score value and radius
     gscoreInd = np.argmax(GNS[:,0])
-
-    numGridnessRadii = 3
-    numStep = max(numSteps - numGridnessRadii, 1) # minimum value 1
-
-    if numStep == 1:
-        gscore = np.mean(GNS, axis=0)[0]
-    else:
-        meanGridness = np.zeros(numStep)
-        for ii in range(numStep):
-            meanGridness[ii] = np.nanmean(GNS[ii:ii+numGridnessRadii, 0])
-        gscore = np.max(meanGridness)
+    gscore = _sliding_gridness(GNS[:, 0])
 
     '''Then calculate stats about the autocorrelogram'''
     # Mask center field and fringes of autocorrelogram > best grid score radius
-    mask_outwards = _circular_mask(aCorr, radii[gscoreInd]*1.25, 'outwards', centre)
-    mask_center   = _circular_mask(aCorr, cFieldRadius*1.5, 'inwards', centre)
-    mask = mask_outwards + mask_center
+    mask = _stats_mask(aCorr, radii[gscoreInd], cFieldRadius, centre)
 
-    grid_stats = grid_score_stats(aCorr, mask, centre, **kwargs)
+    if kwargs.get("lazy_stats", False):
+        grid_stats = LazyGridStats(aCorr, mask, centre, **kwargs)
+    else:
+        grid_stats = grid_score_stats(aCorr, mask, centre, **kwargs)
 
     return gscore, grid_stats
 
@@ -188,14 +200,58 @@ def grid_score(aCorr, **kwargs):
 #########################################################
 
 
+class LazyGridStats(collections.abc.Mapping):
+    '''Read-only mapping of grid statistics, calculated on first access
+
+    Holds the arguments to `grid_score_stats` and calls it the first time
+    any value is requested. The result is memoized, so the calculation is
+    done at most once. Behaves as the dictionary returned by
+    `grid_score_stats` in all other respects.
+    '''
+    def __init__(self, aCorr, mask, centre, **kwargs):
+        self._args = (aCorr, mask, centre)
+        self._kwargs = kwargs
+        self._stats = None
+
+    @property
+    def evaluated(self):
+        '''True if the statistics have been calculated'''
+        return self._stats is not None
+
+    def _evaluate(self):
+        if self._stats is None:
+            self._stats = grid_score_stats(*self._args, **self._kwargs)
+            self._args = self._kwargs = None
+        return self._stats
+
+    def __getitem__(self, key):
+        return self._evaluate()[key]
+
+    def __iter__(self):
+        return iter(self._evaluate())
+
+    def __len__(self):
+        return len(self._evaluate())
+
+    def __repr__(self):
+        if self._stats is None:
+            return f"{type(self).__name__}(<not evaluated>)"
+        return f"{type(self).__name__}({self._stats!r})"
+
+
 def grid_score_stats(aCorr, mask, centre, **kwargs):
     '''
     Calculate spatial characteristics of grid based on 2D autocorr
 
+    The fields of a stack of autocorrelograms are found together (see
+    `opexebo.general.peak_search`), and the selection of the six fields
+    closest to the centre and the statistics derived from them are evaluated
+    for the whole stack as array operations.
+
     Parameters
     ----------
     aCorr : np.array
-        2D Autocorrelation
+        2D Autocorrelation, or (N, H, W) stack of autocorrelograms
     mask : np.array
         Mask (masked=True) of shape aCorr for masking center field and
         fringes of aCorr above best grid score radius
@@ -208,7 +264,7 @@ def grid_score_stats(aCorr, mask, centre, **kwargs):
             below this threshold, discard the field that has larger
             distance from center
         search_method : str
-            Peak searching method, currently limited to either `default` or `sep`
+            Peak searching method, currently limited to `default`, `sep` or `ndimage`
         bin_width : float
             Size of the bins. Distance units will be returned in the same units
             If not provided, distance units will be retuned in units [bins]
@@ -237,6 +293,10 @@ def grid_score_stats(aCorr, mask, centre, **kwargs):
             Ellipse aspect ratio (major radius / minor radius)
         grid_ellipse_theta          : float
             Ellipse theta (corrected according to previous BNT standard) in [degrees]
+
+        For a stack, each value is an array whose first dimension is N, as
+        returned by `grid_score_batch`. `grid_positions` is (N, 6, 2) and
+        `grid_ellipse` is (N, 5). Missing values are NaN
     '''
 
     # Get kwargs
@@ -250,19 +310,15 @@ def grid_score_stats(aCorr, mask, centre, **kwargs):
         print('Min orientation: {} degrees'.format(np.degrees(min_orientation)))
     
 
-    # Initialise default output in case stats are uncalculable
-    gs_ellipse_theta    = np.nan
-    gs_ellipse          = np.nan
-    gs_aspect_ratio     = np.nan
-    gs_orientations_std = np.nan
-    gs_orientation      = np.nan
-    gs_positions        = np.full(6, fill_value = np.nan, dtype=float)
-    gs_orientations     = np.full(3, fill_value = np.nan, dtype=float)
-    gs_spacings         = np.full(3, fill_value = np.nan, dtype=float)
+    stack = np.ndim(aCorr) == 3
 
     # Find fields in autocorrelogram
     all_coords = opexebo.general.peak_search(aCorr, mask=mask, search_method=search_method,
                                              null_background=True, threshold=0.1, get_maxima=True)
+    if stack:
+        coords, valid = _candidate_table(all_coords, aCorr.shape[0])
+        return _grid_stats_from_candidates(coords, valid, centre, min_orientation, bin_width)
+
     if debug:
         import matplotlib.pyplot as plt
         plt.figure()
@@ -272,114 +328,373 @@ def grid_score_stats(aCorr, mask, centre, **kwargs):
             plt.scatter(coord[1], coord[0], s=300, marker='x', color='red')
             plt.text(coord[1]+3, coord[0], field_no, label='Center')
         plt.title("All local maxima in acorr")
-        
-        
 
-    if all_coords.shape[0] >= 6:
-        # Calculate orientation and distance of all local maxima to center
-        # np.arctan2 gives angles in radians relative to the horizontal axis in the range [-pi, pi]
-        # A vector along the horizontal axis from (0,0) to (0,-1) has angle pi.
-        # np.arctan2 - accepts arguments (y, x), and gives the angles in each case from (0,0) to (xi, yi)
-        orientation = np.arctan2(all_coords[:,0] - centre[0], all_coords[:,1] - centre[1]) # in radians
-        distance = np.sqrt(np.square(all_coords[:,0]-centre[0]) + np.square(all_coords[:,1]-centre[1]))
-
-        # Where two fields have a very similar orientation, discard the more distant one
-        orient_distsq = np.abs(_circ_dist2(orientation))
-        close_fields = orient_distsq < min_orientation
-        close_fields = np.triu(close_fields, 1) # Upper triangle only - set lower triangle to zero
-                                                # k=1: +1 offset from diagonal: set diagonal to zero too
-        to_del = []
-        for row,col in np.argwhere(close_fields):
-            if distance[row] > distance[col]:
-                to_del.append(row)
-            else:
-                to_del.append(col)
-
-        distance    = np.delete(distance, to_del)
-        orientation = np.delete(orientation, to_del)
-        all_coords  = np.delete(all_coords, to_del, axis=0)
-
-        # First sort by distance and take first 6 fields
-        sorted_ids_dist = np.argsort(distance)[:6] # 6 closest fields
-        positions = all_coords[sorted_ids_dist]
-        distance = distance[sorted_ids_dist]
-        orientation = orientation[sorted_ids_dist]
-        
-        # ... then re-sort remaining fields by angle
-        sorted_ids_ang = np.argsort(orientation)
+    stats = _grid_stats_from_candidates(all_coords[np.newaxis].astype(float),
+                                        np.ones((1, all_coords.shape[0]), dtype=bool),
+                                        centre, min_orientation, bin_width)
+    num_fields = stats.pop("num_fields")[0]
+    if num_fields == 0:
+        if debug:
+            print('Not enough fields detected ({})'.format(len(all_coords)))
+        return copy.deepcopy(INVALID_OUTPUT[1])
+
+    # Fewer than six fields may remain after discarding fields that are too
+    # close together
+    grid_stats = {key: value[0] for key, value in stats.items()}
+    for key in ('grid_spacings', 'grid_orientations'):
+        grid_stats[key] = grid_stats[key][:min(num_fields, 3)]
+    grid_stats['grid_positions'] = grid_stats['grid_positions'][:num_fields]
+    if np.isnan(grid_stats['grid_ellipse']).all():
+        grid_stats['grid_ellipse'] = np.nan
+    else:
+        grid_stats['grid_ellipse'] = tuple(grid_stats['grid_ellipse'])
+
+    if debug:
+        import matplotlib.pyplot as plt
+        aCorr_masked = np.ma.masked_where(mask, aCorr.copy())
+        plt.figure()
+        plt.imshow(aCorr_masked)
+        plt.scatter(centre[1],centre[0], s=600, marker='x', color='black')
+        for field_no, coord in enumerate(grid_stats['grid_positions']):
+            plt.scatter(coord[1], coord[0], s=300, marker='x', color='red')
+            plt.text(coord[1]+3, coord[0], field_no, label='Center')
+        plt.title('Masked autocorr + 6 remaining fields')
+
+    return grid_stats
 
-        ################# GATHER OUTPUT #################
-        gs_positions = positions[sorted_ids_ang]
-        # For grid orientation and spacing take only 3 out of 6 neighbouring fields
-        # Convert from distance in bins to distance in units
-        gs_spacings = distance[sorted_ids_ang][:3] * bin_width
-        gs_orientations = np.degrees(orientation[sorted_ids_ang][:3]) % 180
-        # Work out mean orientation of grid. Take standard deviation as quality marker
-        gs_orientation, gs_orientations_std = _extract_grid_orientation(gs_orientations)
 
+def _outer_bound(shape):
+    '''Largest radius that fits within an autocorrelogram of the given shape'''
+    return int(np.floor(np.min(np.array(shape)/2)))
 
-        if debug:
-            import matplotlib.pyplot as plt
-            aCorr_masked = np.ma.masked_where(mask, aCorr.copy())
-            plt.figure()
-            plt.imshow(aCorr_masked)
-            plt.scatter(centre[1],centre[0], s=600, marker='x', color='black')
-            for field_no, coord in enumerate(gs_positions):
-                plt.scatter(coord[1], coord[0], s=300, marker='x', color='red')
-                plt.text(coord[1]+3, coord[0], field_no, label='Center')
-            plt.title('Masked autocorr + 6 remaining fields')
-
-        # Fit an ellipse to those remaining fields:
-        if len(gs_positions) > 2:
-            try:
-                gs_ellipse =  opexebo.general.fit_ellipse(gs_positions[:,1], gs_positions[:,0])
-                gs_ellipse_theta = np.degrees(gs_ellipse[4]+np.pi)%360
-                # The +pi term was included in the original BNT, I have kept it to
-                # maintain consistency with past results.
-                gs_aspect_ratio = gs_ellipse[2]/gs_ellipse[3] # Major radius / Minor radius
-            except np.linalg.LinAlgError as e:
-                print(f"LinAlgError: {e}")
-                print(f"Retuning NaN ellipse stats")
 
+def _gridness_radii(cFieldRadius, outerBound):
+    '''Radii of the expanding circle over which the gridness is evaluated'''
+    radii = np.linspace(max(3, cFieldRadius+1), outerBound, outerBound-cFieldRadius)
+    return radii.astype(int)
+
+
+def _distance_map(shape):
+    '''Distance of each bin from the centre of an autocorrelogram
+
+    The centre is offset by one bin compared to `centre` in `grid_score` for
+    compatibility with BNT (Matlab)
+    '''
+    halfHeight = np.ceil(shape[0]/2)
+    halfWidth  = np.ceil(shape[1]/2)
+    rr, cc = np.meshgrid(np.arange(shape[1]), np.arange(shape[0]), sparse=False)
+    # This is needed for compatibility with Matlab's code
+    rr += 1
+    cc += 1
+    return np.sqrt(np.power((rr - halfWidth), 2) + np.power(cc-halfHeight, 2))
+
+
+def _sliding_gridness(gridness):
+    '''Gridness score as the maximum over a sliding mean of the per-radius
+    gridness values. This keeps the score in line with historical (BNT) values.
+    The radius is the last axis, so several units can be scored at once'''
+    numGridnessRadii = 3
+    numStep = max(gridness.shape[-1] - numGridnessRadii, 1) # minimum value 1
+
+    if numStep == 1:
+        gscore = np.mean(gridness, axis=-1)
     else:
-        if debug: 
-            print('Not enough fields detected ({})'.format(len(all_coords)))
-            
-
-    grid_stats = {'grid_spacings': gs_spacings,
-                  'grid_spacing': np.nanmean(gs_spacings),
-                  'grid_orientations': gs_orientations,
-                  'grid_orientations_std': gs_orientations_std,
-                  'grid_orientation': gs_orientation,
-                  'grid_positions': gs_positions,
-                  'grid_ellipse': gs_ellipse,
-                  'grid_ellipse_aspect_ratio': gs_aspect_ratio,
-                  'grid_ellipse_theta': gs_ellipse_theta}
-    return grid_stats
+        windows = np.lib.stride_tricks.sliding_window_view(gridness, numGridnessRadii,
+                                                           axis=-1)[..., :numStep, :]
+        meanGridness = np.nanmean(windows, axis=-1)
+        gscore = np.max(meanGridness, axis=-1)
+    return gscore
+
+
+def _stats_mask(aCorr, best_radius, cFieldRadius, centre):
+    '''Mask the centre field and the fringes of the autocorrelogram beyond
+    the best gridness radius, prior to calculating grid statistics.
+    If `best_radius` and `cFieldRadius` are (n, ) arrays, an (n, H, W) stack
+    of masks is returned'''
+    h, w = np.shape(aCorr)[-2:]
+    Y, X = np.ogrid[:h, :w]
+    dist_from_center = np.sqrt(np.power(X - centre[1],2) + np.power(Y-centre[0],2))
+    outer = np.asarray(best_radius*1.25)[..., np.newaxis, np.newaxis]
+    inner = np.asarray(cFieldRadius*1.5)[..., np.newaxis, np.newaxis]
+    return (dist_from_center >= outer) | (dist_from_center <= inner)
+
+
+def _ring_correlations(maps, rotated, distance, inner_radii, radii):
+    '''Pearson correlation between maps and their rotated versions within a
+    ring around the centre, for every radius of an expanding circle
+
+    The ring for radius `r` includes all bins with `inner < distance < r`.
+    Rather than building a mask for every radius, the bins are sorted once by
+    their distance from the centre, and running sums of x, y, xy, x^2, y^2 are
+    accumulated. The sums within any ring are then the difference between two
+    entries of the running sums, so all radii are evaluated in a single pass.
+
+    Parameters
+    ----------
+    maps : np.ndarray
+        (n, P) maps, flattened
+    rotated : np.ndarray
+        (n, A, P) rotated versions of each map, flattened
+    distance : np.ndarray
+        (P, ) distance of each bin from the centre
+    inner_radii : np.ndarray
+        (n, ) inner radius of the ring for each map
+    radii : np.ndarray
+        (R, ) outer radii of the ring
+
+    Returns
+    -------
+    correlations : np.ndarray
+        (n, A, R) Pearson correlation coefficients. NaN where either map is
+        constant within the ring
+    '''
+    order = np.argsort(distance, kind="stable")
+    sorted_distance = distance[order]
+    # Correlations are invariant to an offset. Removing the mean of each map
+    # reduces round-off error in the running sums
+    x = maps[:, order]
+    x = x - x.mean(axis=1, keepdims=True)
+    y = rotated[:, :, order]
+    y = y - y.mean(axis=2, keepdims=True)
+
+    def running_sum(values):
+        out = np.zeros(values.shape[:-1] + (values.shape[-1]+1,))
+        np.cumsum(values, axis=-1, out=out[..., 1:])
+        return out
+
+    # Index into the running sums: the ring is the half-open range [lo, hi)
+    hi = np.searchsorted(sorted_distance, radii, side="left")
+    lo = np.searchsorted(sorted_distance, inner_radii, side="right")
+    rows = np.arange(maps.shape[0])[:, np.newaxis]
+
+    def ring_sum(values):
+        cs = running_sum(values)
+        if cs.ndim == 2:
+            return (cs[:, hi] - cs[rows, lo[:, np.newaxis]])[:, np.newaxis, :]
+        return cs[:, :, hi] - cs[rows, :, lo[:, np.newaxis]].transpose(0, 2, 1)
+
+    n = np.maximum(hi[np.newaxis, :] - lo[:, np.newaxis], 0)[:, np.newaxis, :]
+    sx = ring_sum(x)
+    sxx = ring_sum(x*x)
+    sy = ring_sum(y)
+    syy = ring_sum(y*y)
+    sxy = ring_sum(x[:, np.newaxis, :]*y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_x = np.maximum(n*sxx - sx*sx, 0)
+        var_y = np.maximum(n*syy - sy*sy, 0)
+        correlations = (n*sxy - sx*sy) / np.sqrt(var_x * var_y)
+    return np.clip(correlations, -1, 1)
+
+
+def _polar_ring_correlations(maps, inner_radii, radii, angle_step):
+    '''Correlation between maps and their rotated versions within a ring
+    around the centre, using a polar resampling of each map
+
+    Each map is interpolated once onto a polar grid centred on the rotation
+    centre, with an angular resolution `angle_step` that divides 30 degrees.
+    Rotating the map by any multiple of 30 degrees is then a circular shift of
+    whole columns of the polar grid, with no further interpolation.
+
+    As rotations only permute values within a ring, the sums of y and y^2 of
+    the rotated map are equal to those of x and x^2 of the original. Only the
+    cross term xy must be evaluated per angle. Samples are weighted by their
+    radius to account for the area of the arena that they represent.
+
+    Parameters
+    ----------
+    maps : np.ndarray
+        (n, H, W) maps
+    inner_radii : np.ndarray
+        (n, ) inner radius of the ring for each map
+    radii : np.ndarray
+        (R, ) outer radii of the ring
+    angle_step : float
+        Angular resolution in [degrees] of the polar grid
+
+    Returns
+    -------
+    correlations : np.ndarray
+        (n, A, R) weighted Pearson correlation coefficients
+    '''
+    num_maps = maps.shape[0]
+    num_angles = int(round(360 / angle_step))
+    shifts = np.round(ROTATION_ANGLES / angle_step).astype(int)
+    operator, rho = _polar_operator(maps.shape[1:], angle_step, 1)
+
+    # (n, rho, theta) polar maps, with the mean removed to limit round-off
+    polar = (operator @ maps.reshape(num_maps, -1).T).T.reshape(num_maps, rho.size, num_angles)
+    polar -= polar.mean(axis=(1, 2), keepdims=True)
+
+    # Per-ring sums, weighted by radius
+    w = rho * num_angles
+    sx = rho * polar.sum(axis=2)
+    sxx = rho * np.square(polar).sum(axis=2)
+    sxy = np.stack([rho * (polar * np.roll(polar, shift, axis=2)).sum(axis=2)
+                    for shift in shifts], axis=1)
+
+    def running_sum(values):
+        out = np.zeros(values.shape[:-1] + (values.shape[-1]+1,))
+        np.cumsum(values, axis=-1, out=out[..., 1:])
+        return out
+
+    # Rings are the half-open range [lo, hi) of polar rows
+    hi = np.searchsorted(rho, radii, side="left")
+    lo = np.searchsorted(rho, inner_radii, side="right")
+    rows_idx = np.arange(num_maps)
+
+    def ring_sum(values):
+        cs = running_sum(values)
+        return cs[..., hi] - cs[rows_idx, ..., lo][..., np.newaxis]
+
+    n = running_sum(w)
+    n = (n[hi][np.newaxis, :] - n[lo][:, np.newaxis])[:, np.newaxis, :]
+    sx = ring_sum(sx)[:, np.newaxis, :]
+    sxx = ring_sum(sxx)[:, np.newaxis, :]
+    sxy = ring_sum(sxy)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = np.maximum(n*sxx - sx*sx, 0)
+        correlations = (n*sxy - sx*sx) / var
+    return np.clip(correlations, -1, 1)
+
+
+def _validate_rotation_method(**kwargs):
+    '''Check the `rotation_method` and `polar_angle_step` keywords'''
+    rotation_method = kwargs.get("rotation_method", default.grid_rotation_method)
+    if rotation_method not in default.grid_rotation_methods:
+        raise err.ArgumentError("Keyword 'rotation_method' must be one of"\
+                                f" {default.grid_rotation_methods}. You provided"\
+                                f" '{rotation_method}'")
+    angle_step = kwargs.get("polar_angle_step", default.polar_angle_step)
+    if not angle_step > 0 or not np.isclose((30 / angle_step) % 1, 0):
+        raise err.ArgumentError("Keyword 'polar_angle_step' must divide 30 degrees."\
+                                f" You provided {angle_step}")
+    return rotation_method
+
+
+def _gridness(correlations):
+    '''Gridness from the correlations at 30, 60, 90, 120, 150 degrees (the
+    second-to-last axis of `correlations`)'''
+    return (np.min(correlations[..., [1, 3], :], axis=-2)
+            - np.max(correlations[..., [0, 2, 4], :], axis=-2))
+
+
+def _interpolation_matrix(shape, y, x, order):
+    '''Sparse matrix that samples an image of `shape` at the points (y, x)
+
+    Equivalent to `skimage.transform.warp` with constant (zero) padding: the
+    samples are given by `matrix @ image.ravel()`. Neighbours falling outside
+    the image contribute zero.
+
+    Parameters
+    ----------
+    shape : tuple
+        (rows, columns) of the image
+    y, x : np.ndarray
+        Co-ordinates at which to sample the image, in [bins]
+    order : int
+        Interpolation order: 0 (nearest neighbour) or 1 (bilinear)
+
+    Returns
+    -------
+    matrix : scipy.sparse.csr_matrix
+        (y.size, rows*columns) interpolation matrix
+    '''
+    rows, cols = shape
+    y = np.ravel(y)
+    x = np.ravel(x)
+    if order == 0:
+        neighbours = ((np.floor(y + 0.5).astype(int), np.floor(x + 0.5).astype(int),
+                       np.ones(y.size)),)
+    elif order == 1:
+        r0 = np.floor(y).astype(int)
+        c0 = np.floor(x).astype(int)
+        dr = y - r0
+        dc = x - c0
+        neighbours = ((r0, c0, (1-dr)*(1-dc)), (r0, c0+1, (1-dr)*dc),
+                      (r0+1, c0, dr*(1-dc)), (r0+1, c0+1, dr*dc))
+    else:
+        raise err.ArgumentError(f"Interpolation order must be 0 or 1. You provided {order}")
+    sample = np.arange(y.size)
+    row_idx, col_idx, data = [], [], []
+    for r, c, w in neighbours:
+        keep = (r >= 0) & (r < rows) & (c >= 0) & (c < cols) & (w != 0)
+        row_idx.append(sample[keep])
+        col_idx.append(r[keep]*cols + c[keep])
+        data.append(w[keep])
+    return sparse.csr_matrix((np.concatenate(data),
+                              (np.concatenate(row_idx), np.concatenate(col_idx))),
+                             shape=(y.size, rows*cols))
+
+
+@functools.lru_cache(maxsize=default.grid_operator_cache_size)
+def _rotation_operator(shape, angles, order):
+    '''Rotation operator and distance map for autocorrelograms of `shape`
+
+    All autocorrelograms in a session typically share the same shape, so the
+    interpolation set-up is cached (least-recently-used) keyed on the shape,
+    angles and interpolation order.
+
+    The operator reproduces `skimage.transform.rotate(image, angle, order,
+    preserve_range=True, clip=False)`, i.e. counter-clockwise rotation about
+    the image centre with constant (zero) padding.
+
+    Parameters
+    ----------
+    shape : tuple
+        (rows, columns) of the autocorrelogram
+    angles : tuple
+        Rotation angles in [degrees]
+    order : int
+        Interpolation order: 0 (nearest neighbour) or 1 (bilinear)
+
+    Returns
+    -------
+    operator : scipy.sparse.csr_matrix
+        (angles*rows*columns, rows*columns) matrix. The rotated images are
+        `(operator @ image.ravel()).reshape(len(angles), -1)`
+    distance : np.ndarray
+        (rows*columns, ) distance of each bin from the centre, see `_distance_map`
+    '''
+    rows, cols = shape
+    cy = rows / 2 - 0.5
+    cx = cols / 2 - 0.5
+    yy, xx = np.mgrid[:rows, :cols].astype(float)
+    y_in, x_in = [], []
+    for angle in np.deg2rad(angles):
+        # Inverse mapping: location in the input image of each output pixel
+        x_in.append(np.cos(angle)*(xx-cx) - np.sin(angle)*(yy-cy) + cx)
+        y_in.append(np.sin(angle)*(xx-cx) + np.cos(angle)*(yy-cy) + cy)
+    operator = _interpolation_matrix(shape, np.array(y_in), np.array(x_in), order)
+    distance = _distance_map(shape).ravel()
+    distance.setflags(write=False)
+    return operator, distance
+
+
+@functools.lru_cache(maxsize=default.grid_operator_cache_size)
+def _polar_operator(shape, angle_step, order):
+    '''Operator resampling autocorrelograms of `shape` onto a polar grid
+
+    The grid is centred on the rotation centre of the autocorrelogram, and
+    extends to the largest radius that fits within it. Cached in the same way
+    as `_rotation_operator`.
 
+    Returns
+    -------
+    operator : scipy.sparse.csr_matrix
+        (radii*angles, rows*columns) matrix. The polar image is
+        `(operator @ image.ravel()).reshape(rho.size, -1)`
+    rho : np.ndarray
+        Radii of the rows of the polar image, in [bins]
+    '''
+    rows, cols = shape
+    num_angles = int(round(360 / angle_step))
+    rho = np.arange(1, int(_outer_bound(shape) / _POLAR_RADIAL_STEP) + 1) * _POLAR_RADIAL_STEP
+    theta = np.deg2rad(np.arange(num_angles) * angle_step)
+    y = rho[:, np.newaxis] * np.sin(theta) + (rows/2 - 0.5)
+    x = rho[:, np.newaxis] * np.cos(theta) + (cols/2 - 0.5)
+    rho.setflags(write=False)
+    return _interpolation_matrix(shape, y, x, order), rho
 
-def _circular_mask(image, radius, polarity='outwards', center=None):
-        '''
-        Given height and width, create circular mask around point with defined radius
-        Polarity:
-            'inwards' : True inside,  False outside
-            'outwards': True outside, False inside
-        '''
-        h = image.shape[0]
-        w = image.shape[1]
-
-        if center is None:
-            center = [int(h/2), int(w/2)]
-
-        Y, X = np.ogrid[:h, :w]
-        dist_from_center = np.sqrt(np.power(X - center[1],2) + np.power(Y-center[0],2))
-        if polarity.lower() == 'inwards':
-            mask = dist_from_center <= radius
-        elif polarity.lower() == 'outwards':
-            mask = dist_from_center >= radius
-        else:
-            raise err.ArgumentError('Polarity "{}" not defined'.format(polarity))
-        return mask
 
 def _draw_ellipse(x, y, rl, rs, theta):
     import matplotlib.pyplot as plt
@@ -423,6 +738,132 @@ def _plotContours(img, contours):
 
 
 
+def _candidate_table(peak_coords, num_maps):
+    '''Convert a (K, 3) table of [n, y, x] peaks into an (N, K_max, 2) array
+    of [y, x] candidate fields per map, padded with NaN, and the (N, K_max)
+    mask of valid candidates'''
+    counts = np.bincount(peak_coords[:, 0], minlength=num_maps)
+    order = np.argsort(peak_coords[:, 0], kind="stable")
+    peak_coords = peak_coords[order]
+    slot = np.arange(peak_coords.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    coords = np.full((num_maps, max(counts.max(initial=0), 1), 2), np.nan)
+    coords[peak_coords[:, 0], slot] = peak_coords[:, 1:]
+    valid = np.zeros(coords.shape[:2], dtype=bool)
+    valid[peak_coords[:, 0], slot] = True
+    return coords, valid
+
+
+def _grid_stats_from_candidates(coords, valid, centre, min_orientation, bin_width):
+    '''Grid statistics of many autocorrelograms from their candidate fields
+
+    Maps with fewer than six candidates are not evaluated. Where two
+    candidates have a similar orientation (closer than `min_orientation`),
+    the more distant one is discarded. Every pair is considered at once, so a
+    discarded candidate may still cause another to be discarded, as in BNT.
+    The six closest remaining candidates are then sorted by orientation.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        (N, K, 2) [y, x] co-ordinates of candidate fields
+    valid : np.ndarray
+        (N, K) mask, True where a candidate exists
+    centre : np.ndarray
+        Centre coordinate [y,x]
+    min_orientation : float
+        Minimum difference in orientation between fields [radians]
+    bin_width : float
+        Size of the bins
+
+    Returns
+    -------
+    grid_stats : dict
+        As for a stack in `grid_score_stats`, plus `num_fields`: the (N, )
+        number of fields remaining, at most six. Zero where there are too
+        few candidates
+    '''
+    num_maps = valid.shape[0]
+    stats = {'grid_spacings': np.full((num_maps, 3), np.nan),
+             'grid_spacing': np.full(num_maps, np.nan),
+             'grid_orientations': np.full((num_maps, 3), np.nan),
+             'grid_orientations_std': np.full(num_maps, np.nan),
+             'grid_orientation': np.full(num_maps, np.nan),
+             'grid_positions': np.full((num_maps, 6, 2), np.nan),
+             'grid_ellipse': np.full((num_maps, 5), np.nan),
+             'grid_ellipse_aspect_ratio': np.full(num_maps, np.nan),
+             'grid_ellipse_theta': np.full(num_maps, np.nan),
+             'num_fields': np.zeros(num_maps, dtype=int)}
+    maps = np.flatnonzero(np.count_nonzero(valid, axis=1) >= 6)
+    if maps.size == 0:
+        return stats
+    coords = coords[maps]
+    keep = valid[maps]
+
+    # Calculate orientation and distance of all local maxima to center
+    # np.arctan2 gives angles in radians relative to the horizontal axis in the range [-pi, pi]
+    orientation = np.arctan2(coords[..., 0] - centre[0], coords[..., 1] - centre[1])
+    distance = np.sqrt(np.square(coords[..., 0]-centre[0]) + np.square(coords[..., 1]-centre[1]))
+
+    # Candidates are compared pairwise, so maps are grouped by their number of
+    # candidates rather than all padded to the largest number
+    buckets = np.ceil(np.log2(np.count_nonzero(keep, axis=1))).astype(int)
+    for bucket in np.unique(buckets):
+        group = np.ix_(buckets == bucket, np.any(keep[buckets == bucket], axis=0))
+        keep[group] = _discard_close_fields(orientation[group], distance[group],
+                                            keep[group], min_orientation)
+    num_fields = np.minimum(np.count_nonzero(keep, axis=1), 6)
+
+    # First sort by distance and take first 6 fields, then re-sort those by angle
+    by_distance = np.argsort(np.where(keep, distance, np.inf), axis=1, kind="stable")[:, :6]
+    is_field = np.arange(6) < num_fields[:, np.newaxis]
+    by_angle = np.argsort(np.where(is_field, np.take_along_axis(orientation, by_distance, axis=1),
+                                   np.inf), axis=1, kind="stable")
+    selected = np.take_along_axis(by_distance, by_angle, axis=1)
+    positions = np.take_along_axis(coords, selected[..., np.newaxis], axis=1)
+    positions[~is_field] = np.nan
+    distance = np.where(is_field, np.take_along_axis(distance, selected, axis=1), np.nan)
+    orientation = np.where(is_field, np.take_along_axis(orientation, selected, axis=1), np.nan)
+
+    ################# GATHER OUTPUT #################
+    stats['num_fields'][maps] = num_fields
+    stats['grid_positions'][maps] = positions
+    # For grid orientation and spacing take only 3 out of 6 neighbouring fields
+    # Convert from distance in bins to distance in units
+    spacings = distance[:, :3] * bin_width
+    orientations = np.degrees(orientation[:, :3]) % 180
+    stats['grid_spacings'][maps] = spacings
+    stats['grid_spacing'][maps] = np.nanmean(spacings, axis=1)
+    stats['grid_orientations'][maps] = orientations
+    # Work out mean orientation of grid. Take standard deviation as quality marker
+    stats['grid_orientation'][maps], stats['grid_orientations_std'][maps] = \
+        _extract_grid_orientation(orientations)
+
+    # Fit an ellipse to those remaining fields. Failed fits are NaN
+    fit = num_fields > 2
+    ellipse = opexebo.general.fit_ellipse_batch(positions[fit, :, 1], positions[fit, :, 0],
+                                                is_field[fit])
+    stats['grid_ellipse'][maps[fit]] = np.column_stack(ellipse)
+    ellipse = stats['grid_ellipse']
+    # The +pi term was included in the original BNT, I have kept it to
+    # maintain consistency with past results.
+    stats['grid_ellipse_theta'] = np.degrees(ellipse[:, 4]+np.pi)%360
+    stats['grid_ellipse_aspect_ratio'] = ellipse[:, 2]/ellipse[:, 3] # Major radius / Minor radius
+    return stats
+
+
+def _discard_close_fields(orientation, distance, keep, min_orientation):
+    '''Where two fields have a very similar orientation, discard the more
+    distant one. Returns the updated (N, K) mask `keep`'''
+    num_candidates = keep.shape[1]
+    # Pairs (i, j) are taken from the upper triangle, i < j
+    phase = np.exp(1j*np.where(keep, orientation, 0))
+    close = np.abs(np.angle(phase[:, :, np.newaxis] / phase[:, np.newaxis, :])) < min_orientation
+    close &= np.triu(np.ones((num_candidates, num_candidates), dtype=bool), 1)
+    close &= keep[:, :, np.newaxis] & keep[:, np.newaxis, :]
+    row_further = distance[:, :, np.newaxis] > distance[:, np.newaxis, :]
+    return keep & ~(np.any(close & row_further, axis=2) | np.any(close & ~row_further, axis=1))
+
+
 def _extract_grid_orientation(orientations):
     '''
     Extract grid orientation based on angular difference
@@ -431,57 +872,40 @@ def _extract_grid_orientation(orientations):
     Parameter
     ---------
     orientations      : np.array
-                        (Raw) aCorr field angles in degrees 
+                        (N, 3) (Raw) aCorr field angles in degrees, NaN
+                        where there is no field
 
     Returns
     -------
-    orientation       : float
-                        Grid orientation in degrees (average)
-    orientation_std   : float
-                        Standard deviation over grid field
+    orientation       : np.array
+                        (N, ) Grid orientation in degrees (average)
+    orientation_std   : np.array
+                        (N, ) Standard deviation over grid field
                         orientations
     '''
-
-
-    orientations = orientations % 60 
-    corr_orientations = []
-    for orient in orientations: 
-        # For every angle extract min to 60 deg
-        diff_60 = orient - 60 
-        if np.abs(diff_60) < np.abs(orient): 
-            corr_orientations.append(diff_60)
-        else:
-            corr_orientations.append(orient)
-
-    corr_orientations = np.array(corr_orientations)
-    # Check 30 degree flips 
-    if np.mean(np.abs(np.abs(corr_orientations) - 30)) < np.mean(np.abs(corr_orientations)):
-        # Yes, angles close to 30 degrees (flipping axis)
-        # Try to reach consensus
-        if np.median(corr_orientations) < 0: # Make everything negative
-            corr_orientations = np.negative(corr_orientations, where=corr_orientations>0, out=corr_orientations)
-        else: # Make everything positive
-            corr_orientations = np.negative(corr_orientations, where=corr_orientations<0, out=corr_orientations)
+    orientations = orientations % 60
+    # For every angle extract min to 60 deg
+    diff_60 = orientations - 60
+    corr_orientations = np.where(np.abs(diff_60) < np.abs(orientations), diff_60, orientations)
+
+    # Check 30 degree flips: angles close to 30 degrees (flipping axis)
+    # Try to reach consensus, making everything negative or positive
+    flip = (np.nanmean(np.abs(np.abs(corr_orientations) - 30), axis=1)
+            < np.nanmean(np.abs(corr_orientations), axis=1))
+    negative = (np.nanmedian(corr_orientations, axis=1) < 0)[:, np.newaxis]
+    flip = flip[:, np.newaxis] & np.where(negative, corr_orientations > 0, corr_orientations < 0)
+    corr_orientations = np.where(flip, -corr_orientations, corr_orientations)
 
     # Extract average and standard deviation
-    orientation     = np.nanmean(corr_orientations)
-    orientation_std = np.nanstd(corr_orientations)
+    orientation     = np.nanmean(corr_orientations, axis=1)
+    orientation_std = np.nanstd(corr_orientations, axis=1)
 
     # Test / correct orientation 
-    if np.argmin([np.abs(orientation-60), np.abs(orientation)]) == 0:
-        orientation -= 60
-
+    orientation = np.where(np.abs(orientation-60) <= np.abs(orientation), orientation - 60,
+                           orientation)
     return orientation, orientation_std
 
 
-def _circ_dist2(X):
-    '''Given a 1D array of angles, find the 2D array of pairwise differences
-    Based on https://github.com/circstat/circstat-matlab/blob/master/circ_dist2.m'''
-    x = np.outer(np.exp(1j*X), np.ones(X.size)) # similar to meshgrid, but simpler to implement
-    y = np.transpose(x)
-    return np.angle(x/y)
-
-
 
 def _polyArea(x, y):
     '''Polygon area, from 
@@ -503,7 +927,7 @@ def _findCentreRadius(aCorr, **kwargs):
     search_method = kwargs.get("search_method", default.search_method)
     halfHeight = np.ceil(aCorr.shape[0]/2)
     halfWidth = np.ceil(aCorr.shape[1]/2)
-    peak_coords = np.ones(shape=(1, 2), dtype=np.int)
+    peak_coords = np.ones(shape=(1, 2), dtype=int)
     peak_coords[0, 0] = halfHeight-1
     peak_coords[0, 1] = halfWidth-1
     fields = opexebo.analysis.place_field(aCorr, min_bins=5, min_peak=0, min_mean=0, init_thresh=.95, \
@@ -517,8 +941,8 @@ def _findCentreRadius(aCorr, **kwargs):
     else:
         pass
 
-    peak_coords = np.ndarray(shape=(len(fields), 2), dtype=np.integer)
-    areas = np.ndarray(shape=(len(fields), 1), dtype=np.integer)
+    peak_coords = np.ndarray(shape=(len(fields), 2), dtype=np.int64)
+    areas = np.ndarray(shape=(len(fields), 1), dtype=np.int64)
     for i, field in enumerate(fields):
         peak_rc = field['peak_coords']
         peak_coords[i, 0] = peak_rc[0]
@@ -555,3 +979,68 @@ def _findCentreRadius(aCorr, **kwargs):
     return radius
 
 
+def _centre_field_radii(acorr_stack, **kwargs):
+    '''Radius of the centre field of each of a stack of normalised
+    autocorrelograms. Identical to _findCentreRadius() on each
+
+    _findCentreRadius() finds the field at the centre with place_field(),
+    which first opens the whole map by reconstruction. Only the opened value
+    of the centre bin is needed, however: at or below that value, the region
+    of the opened map that contains the centre is the same as the region of
+    the autocorrelogram itself. The opened value is found from the small
+    region around the centre, and the field is then expanded over the
+    autocorrelogram with the same adaptive thresholding as place_field(). The
+    erosion is done once for the whole stack.
+
+    Autocorrelograms for which this does not hold (NaN values, a centre bin
+    that is not positive, or more than one field found) are passed to
+    _findCentreRadius()
+
+    Returns
+    -------
+    radii : np.ndarray
+        (N, ) radius of the centre field, zero if there is none
+    '''
+    init_thresh = 0.95
+    min_bins = 5
+    shape = acorr_stack.shape[1:]
+    centre = (int(np.ceil(shape[0]/2)) - 1, int(np.ceil(shape[1]/2)) - 1)
+    eroded = morphology.erosion(acorr_stack, morphology.disk(1)[np.newaxis])
+    radii = np.zeros(acorr_stack.shape[0])
+    for i, aCorr in enumerate(acorr_stack):
+        peak = np.nan
+        if not np.isnan(aCorr).any() and aCorr[centre] > 0:
+            peak = _opened_value(aCorr, eroded[i], centre)
+        fields = []
+        if peak > 0:
+            image = aCorr.copy()
+            image[centre] = peak
+            tracker = opexebo.general.RegionTracker(image, centre,
+                                                    floor=peak * (init_thresh - 0.2))
+            fields = _peak_fields(image, np.zeros(shape, dtype=bool), np.array(centre),
+                                  init_thresh, [], aCorr.max() * 1.5, tracker=tracker)
+        if len(fields) != 1:
+            radii[i] = np.floor(_findCentreRadius(aCorr, **kwargs))
+            continue
+        pixels = fields[0]
+        area = len(pixels[0]) if len(pixels) > 0 else 0
+        if area >= min_bins and np.mean(aCorr[pixels]) >= 0:
+            radii[i] = np.floor(np.sqrt(area / np.pi))
+    return radii
+
+
+def _opened_value(image, eroded, pixel):
+    '''Value of `pixel` in the opening by reconstruction of `image`, i.e.
+    morphology.reconstruction(eroded, image)[pixel]
+
+    The opened value is at least the eroded value at the pixel. Only pixels
+    connected to it through values at least as high can raise it further, so
+    the reconstruction is evaluated over that region alone'''
+    level = eroded[pixel]
+    labels, _ = ndimage.label(image >= level, structure=np.ones((3, 3)))
+    region = labels == labels[pixel]
+    window = ndimage.find_objects(region.astype(int))[0]
+    marker = np.full(region[window].shape, level)
+    marker[pixel[0] - window[0].start, pixel[1] - window[1].start] = image[pixel]
+    opened = morphology.reconstruction(marker, np.where(region[window], image[window], level))
+    return np.max(np.minimum(opened, eroded[window]))
@@ -0,0 +1,162 @@
+"""
+Provide function for gridness score calculation over a stack of autocorrelograms
+"""
+
+import numpy as np
+
+import opexebo.defaults as default
+import opexebo.errors as err
+from opexebo.analysis.grid_score import (grid_score_stats,
+    _grid_stats_from_candidates, ROTATION_ANGLES, _centre_field_radii, _outer_bound, _gridness_radii,
+    _sliding_gridness, _stats_mask, _rotation_operator,
+    _ring_correlations, _polar_ring_correlations, _gridness,
+    _validate_rotation_method)
+
+
+def grid_score_batch(acorr_stack, **kwargs):
+    """Calculate gridness scores for a stack of autocorrelograms.
+
+    Equivalent to calling `opexebo.analysis.grid_score` on each
+    autocorrelogram in turn, but the rotation of the autocorrelograms and the
+    correlation of the rotated and original maps over the expanding circle,
+    and the grid statistics, are evaluated for many autocorrelograms at once
+    as array operations. All
+    autocorrelograms must have the same shape, as is the case for all units
+    analysed with the same arena and binning.
+
+    Parameters
+    ----------
+    acorr_stack: np.ndarray
+        (N, H, W) stack of N 2D autocorrelograms
+
+    Other Parameters
+    ----------------
+    chunk_size: int
+        Number of autocorrelograms processed simultaneously. Larger values are
+        faster at the cost of memory. Default 64
+    min_orientation: int
+        See function "grid_score_stats"
+    search_method: str
+        Peak searching method, currently limited to `default`, `sep` or `ndimage`
+    bin_width: float
+        Size of the bins. Distance units will be returned in the same units
+        If not provided, distance units will be retuned in units [bins]
+    rotation_method: str
+        `cartesian` or `polar`, see function "grid_score". Default `cartesian`
+    polar_angle_step: float
+        See function "grid_score"
+
+    Returns
+    -------
+    grid_scores: np.ndarray
+        N-length array of gridness scores. NaN where the gridness score cannot
+        be calculated
+    grid_stats: dictionary
+        The same keys as returned by `grid_score`, where each value is an
+        array whose first dimension is N. `grid_positions` is (N, 6, 2) and
+        `grid_ellipse` is (N, 5). Missing values are NaN
+
+    See Also
+    --------
+    opexebo.analysis.grid_score
+
+    Notes
+    -----
+    BNT.+analyses.gridnessScore
+
+    Copyright (C) 2021 by Simon Ball
+    """
+    debug = kwargs.get("debug", False)
+    chunk_size = kwargs.get("chunk_size", default.batch_chunk_size)
+    rotation_method = _validate_rotation_method(**kwargs)
+    angle_step = kwargs.get("polar_angle_step", default.polar_angle_step)
+
+    acorr_stack = np.asarray(acorr_stack, dtype=float)
+    if acorr_stack.ndim != 3:
+        raise err.ArgumentError("acorr_stack must be an (N, H, W) array of"\
+                                f" autocorrelograms. You provided a {acorr_stack.ndim}"\
+                                " dimensional array")
+    num_units = acorr_stack.shape[0]
+    shape = acorr_stack.shape[1:]
+    centre = -0.5 + np.array(shape)/2
+
+    # normalize aCorr in order to find contours
+    maxima = acorr_stack.reshape(num_units, -1).max(axis=1)
+    acorr_stack = acorr_stack / maxima[:, np.newaxis, np.newaxis]
+
+    outerBound = _outer_bound(shape)
+    cFieldRadii = _centre_field_radii(acorr_stack, **kwargs).astype(int)
+    valid = (cFieldRadii > 0) & (outerBound > cFieldRadii)
+    if debug:
+        print(f"{np.count_nonzero(valid)} of {num_units} autocorrelograms are valid")
+
+    grid_scores = np.full(num_units, np.nan)
+    grid_stats = _grid_stats_from_candidates(np.zeros((num_units, 0, 2)),
+                                             np.zeros((num_units, 0), dtype=bool),
+                                             centre, 0, 1)
+    del grid_stats["num_fields"]
+    valid_units = np.flatnonzero(valid)
+    if valid_units.size == 0:
+        return grid_scores, grid_stats
+
+    # Gridness is evaluated for every integer radius that any unit requires
+    first_radius = max(3, np.min(cFieldRadii[valid]) + 1)
+    all_radii = np.arange(first_radius, outerBound + 1)
+    operator, distance = _rotation_operator(shape, tuple(ROTATION_ANGLES), 1)
+
+    for start in range(0, valid_units.size, chunk_size):
+        units = valid_units[start:start+chunk_size]
+        if rotation_method == "polar":
+            gridness = _gridness(_polar_ring_correlations(acorr_stack[units], cFieldRadii[units],
+                                                          all_radii, angle_step))
+        else:
+            gridness = _gridness_per_radius(acorr_stack[units].reshape(units.size, -1),
+                                            cFieldRadii[units], all_radii, distance,
+                                            operator)
+        # Units with the same centre field radius share the same gridness radii
+        best_radii = np.zeros(units.size)
+        for cFieldRadius in np.unique(cFieldRadii[units]):
+            group = cFieldRadii[units] == cFieldRadius
+            radii = _gridness_radii(cFieldRadius, outerBound)
+            GNS = gridness[group][:, radii - first_radius]
+            grid_scores[units[group]] = _sliding_gridness(GNS)
+            best_radii[group] = radii[np.argmax(GNS, axis=1)]
+        masks = _stats_mask(acorr_stack[units], best_radii, cFieldRadii[units], centre)
+        stats = grid_score_stats(acorr_stack[units], masks, centre, **kwargs)
+        for key, value in grid_stats.items():
+            value[units] = stats[key]
+
+    return grid_scores, grid_stats
+
+
+#########################################################
+################        Helper Functions
+#########################################################
+
+
+def _gridness_per_radius(maps, cFieldRadii, radii, distance, operator):
+    '''Gridness of several autocorrelograms for each radius of the expanding
+    circle
+
+    Parameters
+    ----------
+    maps : np.ndarray
+        (n, P) normalised autocorrelograms, flattened
+    cFieldRadii : np.ndarray
+        (n, ) radius of the centre field of each autocorrelogram
+    radii : np.ndarray
+        (R, ) radii of the expanding circle
+    distance : np.ndarray
+        (P, ) distance of each bin from the centre
+    operator : scipy.sparse.csr_matrix
+        Rotation operator, see `grid_score._rotation_operator`
+
+    Returns
+    -------
+    gridness : np.ndarray
+        (n, R) min(r60, r120) - max(r30, r90, r150) for each radius
+    '''
+    # (n, angles, P) rotated maps
+    rotated = (operator @ maps.T).T.reshape(maps.shape[0], -1, maps.shape[1])
+    correlations = _ring_correlations(maps, rotated, distance, cFieldRadii, radii)
+    return _gridness(correlations)
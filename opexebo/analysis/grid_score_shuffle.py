@@ -0,0 +1,157 @@
+"""
+Provide function for the null distribution of gridness scores of a unit by
+shuffling its spike train
+"""
+
+import numpy as np
+
+import opexebo
+import opexebo.defaults as default
+import opexebo.errors as err
+from opexebo.analysis.grid_score_batch import grid_score_batch
+
+
+def grid_score_shuffle(spike_times, tracking_times, positions, speeds, arena_size, **kwargs):
+    """Calculate the null distribution of gridness scores for a single unit.
+
+    The spike train is shifted in time by a random offset (see
+    `opexebo.general.shuffle`), destroying the relationship between firing and
+    position, and the gridness score of each shifted spike train is calculated.
+    The percentiles of the resulting distribution are the thresholds above
+    which the gridness score of the unshifted spike train is considered
+    significant.
+
+    Everything that does not depend on the spike times is calculated once and
+    shared between iterations: the occupancy map, the bin of each tracking
+    frame and the masking of unvisited bins. Spike maps for all iterations are
+    then built in a single histogram operation, and the autocorrelograms are
+    calculated and scored together as stacks.
+
+    Each spike is assigned the position and speed of the nearest tracking
+    frame.
+
+    Parameters
+    ----------
+    spike_times: np.ndarray
+        1D array of spike times of the unit [s]
+    tracking_times: np.ndarray
+        1D array of timestamps of the tracking data [s]
+    positions: np.ndarray
+        (2, T) array of [x, y] positions at each timestamp
+    speeds: np.ndarray
+        1D array of speeds at each timestamp
+    arena_size: float or tuple of floats
+        Dimensions of arena (in cm)
+
+    Other Parameters
+    ----------------
+    iterations: int
+        Number of shuffled spike trains. Default 100
+    offset_lim: float
+        Minimum time shift of the spike train [s], see
+        `opexebo.general.shuffle`. Default 20
+    percentiles: tuple of float
+        Percentiles of the null distribution to return. Default (95, 99)
+    sigma: float
+        Standard deviation of the Gaussian kernel used to smooth the rate
+        maps [bins]. Default 2
+    speed_cutoff: float
+        Timestamps and spikes with instantaneous speed beneath this value are
+        ignored. Default 0
+    chunk_size: int
+        Number of shuffled spike trains processed simultaneously. Default 64
+    seed: int
+        Seed of the random time shifts, see `opexebo.general.shuffle`. Default
+        None, a new seed on every call
+    bin_width, bin_number, bin_edges, limits, arena_shape:
+        See `opexebo.analysis.spatial_occupancy`
+    min_orientation, search_method, rotation_method, polar_angle_step:
+        See `opexebo.analysis.grid_score`
+
+    Returns
+    -------
+    null_distribution: np.ndarray
+        Gridness score of each shuffled spike train. NaN where the gridness
+        score cannot be calculated
+    thresholds: dict
+        Percentiles of the null distribution, keyed by percentile. NaN values
+        are ignored
+
+    See Also
+    --------
+    opexebo.general.shuffle
+    opexebo.analysis.grid_score
+    opexebo.analysis.grid_score_batch
+
+    Notes
+    -----
+    BNT.+scripts.shuffling
+
+    Copyright (C) 2021 by Simon Ball
+    """
+    iterations = kwargs.get("iterations", default.shuffle_iterations)
+    offset_lim = kwargs.get("offset_lim", default.shuffle_offset_lim)
+    percentiles = kwargs.get("percentiles", default.shuffle_percentiles)
+    sigma = kwargs.get("sigma", default.sigma)
+    speed_cutoff = kwargs.get("speed_cutoff", default.speed_cutoff)
+    chunk_size = kwargs.get("chunk_size", default.batch_chunk_size)
+    seed = kwargs.get("seed", None)
+
+    spike_times = np.asarray(spike_times, dtype=float)
+    tracking_times = np.asarray(tracking_times, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    speeds = np.asarray(speeds, dtype=float)
+    if positions.ndim != 2 or positions.shape[0] != 2:
+        raise err.ArgumentError("positions must be a (2, T) array of [x, y]"\
+                                f" positions. You provided shape {positions.shape}")
+    if not (tracking_times.size == speeds.size == positions.shape[1]):
+        raise err.DimensionMismatchError("tracking_times, positions and speeds must"\
+                                         " have the same number of samples")
+
+    # Shared between all iterations: occupancy, and the bin of each frame
+    occupancy, _, bin_edges = opexebo.analysis.spatial_occupancy(tracking_times,
+                                        positions, speeds, arena_size, **kwargs)
+    frame_bins = opexebo.general.spatial_bin_index(positions, bin_edges)
+    frame_bins[~(speeds > speed_cutoff)] = -1
+    num_bins = occupancy.size
+
+    shuffled_times, _ = opexebo.general.shuffle(spike_times, offset_lim, iterations,
+                                                tracking_range=tracking_times, seed=seed)
+
+    null_distribution = np.full(iterations, np.nan)
+    for start in range(0, iterations, chunk_size):
+        times = shuffled_times[start:start+chunk_size]
+        spike_bins = frame_bins[_nearest_frame(tracking_times, times)]
+        # Spike maps of all iterations in the chunk in a single histogram, by
+        # offsetting the bins of each iteration
+        offsets = np.arange(times.shape[0])[:, np.newaxis] * num_bins
+        valid = spike_bins >= 0
+        spike_maps = np.bincount((spike_bins + offsets)[valid],
+                                 minlength=times.shape[0]*num_bins)
+        spike_maps = spike_maps.reshape((times.shape[0], ) + occupancy.shape)
+
+        unvisited = np.broadcast_to(np.ma.getmaskarray(occupancy), spike_maps.shape)
+        rmaps = np.ma.masked_where(unvisited, spike_maps / (occupancy.data + np.spacing(1)))
+        rmaps = opexebo.general.smooth(rmaps, sigma, axes=(1, 2))
+        acorrs = opexebo.analysis.autocorrelation(np.array(rmaps))
+        scores, _ = grid_score_batch(acorrs, **kwargs)
+        null_distribution[start:start+times.shape[0]] = scores
+
+    if np.all(np.isnan(null_distribution)):
+        thresholds = {p: np.nan for p in percentiles}
+    else:
+        thresholds = {p: np.nanpercentile(null_distribution, p) for p in percentiles}
+    return null_distribution, thresholds
+
+
+#########################################################
+################        Helper Functions
+#########################################################
+
+
+def _nearest_frame(tracking_times, times):
+    '''Index of the tracking frame closest in time to each of `times`'''
+    after = np.clip(np.searchsorted(tracking_times, times), 1, tracking_times.size - 1)
+    before = after - 1
+    use_before = (times - tracking_times[before]) <= (tracking_times[after] - times)
+    return np.where(use_before, before, after)
@@ -3,12 +3,14 @@ Provide function for 2D placefield detection.
 """
 
 import numpy as np
-from scipy import ndimage
+from scipy import ndimage, sparse
+from scipy.sparse import csgraph
 from skimage import measure, morphology
 
 import opexebo
 import opexebo.defaults as default
 import opexebo.errors as err
+from opexebo.general.field_stats import FIELD_DTYPE
 
 
 def place_field(firing_map, **kwargs):
@@ -49,6 +51,29 @@ def place_field(firing_map, **kwargs):
     peak_coords: array-like
         List of peak co-ordinates to consider instead of auto detection. [y, x].
         Default None
+    field_method: str
+        How the area of a field is evaluated at each threshold. Default `threshold`
+        * `threshold`: the rate map is thresholded and labelled at every
+          threshold considered
+        * `max_tree`: the areas of the fields at all thresholds are taken from
+          a single component tree (max-tree) of the rate map. Building the
+          tree has a fixed cost of several milliseconds, so this is only
+          faster for maps with many peaks. The same result, see Notes
+        * `incremental`: the area, pixels and holes of each field at all
+          thresholds are found at once for each peak, over the pixels near
+          the field, with a single `opexebo.general.RegionTracker` per map.
+          The same result, and faster than `threshold` for maps with many
+          peaks
+    output: str
+        Form of the returned fields. Default `dict`
+        * `dict`: a list of dictionaries, one per field, as described below
+        * `compact`: a structured array with one row per field, holding
+          only the scalar properties (`field`, `area`, `peak_coords`,
+          `centroid_coords`, `bbox`, `mean_rate`, `peak_rate`), and a label
+          map of the smallest sufficient unsigned integer type. `field` is
+          the label of the field in `fields_map`. The coordinates and binary
+          map of a field can be recovered from `fields_map`, see
+          `place_field_map`. Unlike the `dict` output, `area` is an integer
 
     Returns
     -------
@@ -59,7 +84,7 @@ def place_field(firing_map, **kwargs):
             Coordinates peak firing rate [y,x]
         centroid_coords: np.ndarray
             Coordinates of centroid (decimal) [y,x]
-        area: int
+        area: float
             Number of bins in firing field. [bins]
         bbox: tuple
             Coordinates of bounding box including the firing field
@@ -73,6 +98,7 @@ def place_field(firing_map, **kwargs):
             other cells have value 0
     fields_map : np.ndarray
         labelled integer image (i.e. background = 0, field1 = 1, field2 = 2, etc.)
+        With `output="compact"`, of type uint8 or uint16
 
     Raises
     ------
@@ -87,6 +113,15 @@ def place_field(firing_map, **kwargs):
 
     https://se.mathworks.com/help/images/understanding-morphological-reconstruction.html
 
+    With `field_method="max_tree"`, holes in a field are detected from the
+    Euler number of each node of the component tree, and confirmed by
+    thresholding, so that holes consisting only of unvisited bins are ignored
+    as in the `threshold` method. Fields that border on previously found
+    fields are also evaluated by thresholding. With `field_method="incremental"`,
+    a hole is any group of bins enclosed by the field that contains a visited
+    bin, as in the `threshold` method. All methods therefore return the same
+    fields.
+
     Copyright (C) 2018 by Vadim Frolov, (C) 2019 by Simon Ball, Horst Obenhaus
     '''
     ##########################################################################
@@ -98,6 +133,8 @@ def place_field(firing_map, **kwargs):
     init_thresh = kwargs.get("init_thresh", default.initial_search_threshold)
     search_method = kwargs.get("search_method", default.search_method)
     peak_coords = kwargs.get("peak_coords", None)
+    field_method = kwargs.get("field_method", default.field_method)
+    output = kwargs.get("output", default.field_output)
     debug = kwargs.get("debug", False)
 
     if not 0 < init_thresh <= 1:
@@ -112,11 +149,21 @@ def place_field(firing_map, **kwargs):
         raise err.ArgumentError("Keyword 'search_method' must be left blank or given a"\
                          f" value from the following list: {default.all_methods}."\
                          f" You provided '{search_method}'.")
+    if field_method not in default.field_methods:
+        raise err.ArgumentError("Keyword 'field_method' must be left blank or given a"\
+                         f" value from the following list: {default.field_methods}."\
+                         f" You provided '{field_method}'.")
+    if output not in default.field_outputs:
+        raise err.ArgumentError("Keyword 'output' must be left blank or given a"\
+                         f" value from the following list: {default.field_outputs}."\
+                         f" You provided '{output}'.")
 
     global_peak = np.nanmax(firing_map)
     if np.isnan(global_peak) or global_peak == 0:
         if debug:
             print(f"Terminating due to invalid global peak: {global_peak}")
+        if output == "compact":
+            return np.zeros(0, dtype=FIELD_DTYPE), np.zeros(np.shape(firing_map), dtype=np.uint8)
         return [], np.zeros_like(firing_map)
 
     # Construct a mask of bins that the animal never visited (never visited -> true)
@@ -152,7 +199,7 @@ def place_field(firing_map, **kwargs):
     if peak_coords is None:
         if search_method == default.search_method:
             peak_coords = opexebo.general.peak_search(fmap, **kwargs)
-        elif search_method == "sep":
+        elif search_method in ("sep", "ndimage"):
             #fmap = finite_firing_map
             peak_coords = opexebo.general.peak_search(fmap, **kwargs)
         else:
@@ -179,10 +226,19 @@ def place_field(firing_map, **kwargs):
     # this can be confusing, but this variable is just an index for the vector
     # peak_linear_ind
     peaks_index = np.arange(len(peak_coords))
-    fields_map = np.zeros(fmap.shape, dtype=np.integer)
+    fields_map = np.zeros(fmap.shape, dtype=np.int64)
     field_id = 1
+    tree = None
+    tracker = None
+    if field_method == "max_tree":
+        tree = _component_tree(fmap)
+    elif field_method == "incremental" and len(peak_coords) > 0:
+        tracker = opexebo.general.RegionTracker(fmap, peak_coords[0],
+                                                ignore=occupancy_mask)
     for i, peak_rc in enumerate(peak_coords):
         # peak_rc == [row, col]
+        if tracker is not None:
+            tracker.reseed(peak_rc, floor=fmap[peak_rc[0], peak_rc[1]] * (init_thresh - 0.2))
 
         # select all peaks except the current one
         other_fields = peak_coords[peaks_index != i]
@@ -193,105 +249,91 @@ def place_field(firing_map, **kwargs):
         else:
             other_fields_linear = []
 
-        used_th = init_thresh
-        res = _area_change(fmap, occupancy_mask, peak_rc, used_th,
-                           used_th-0.02, other_fields_linear)
-        initial_change = res['acceleration']
-        area2 = res['area2']
-        first_pixels = np.nan
-        if np.isnan(initial_change):
-            for j in np.linspace(used_th+0.01, 1., 4):
-                # Thresholds get higher, area should tend downwards to 1
-                # (i.e. only including the actual peak)
-                res = _area_change(fmap, occupancy_mask, peak_rc, j, j-0.01, other_fields_linear)
-                initial_change = res['acceleration']
-                area1 = res['area1']
-                area2 = res['area2']
-                # initial_change is the change from area1 to area 2
-                # area2>area1 -> initial_change > 1
-                # area2<area1 -> initial_change < 1
-                # area 2 is calculated with lower threshold - should usually be larger
-                first_pixels = res['first_pixels']
-                if not np.isnan(initial_change) and initial_change > 0:
-                    # True is both area1 and area2 are valid
-                    # Weird conditonal from Vadim - initial change will EITHER:
-                    # be greater than zero (can't get a negative area to give negative % change)
-                    # OR be NaN (which will always yield false when compared to a number)
-                    used_th = j - 0.01
-                    break
-
-            if np.isnan(initial_change) and not np.isnan(area1):
-                # For the final change
-                pixels = np.unravel_index(first_pixels, fmap.shape, 'F')
-                fmap[pixels] = max_value * 1.5
-                fields_map[pixels] = field_id
-                field_id = field_id + 1
-
-            if np.isnan(initial_change):
-                # failed to extract the field
-                # Do nothing and continue for-loop
-                pass
-
-        pixel_list = _expand_field(fmap, occupancy_mask, peak_rc, initial_change, area2,
-                                   other_fields_linear, used_th)
-        if np.any(np.isnan(pixel_list)):
-            _, pixel_list, _ = _area_for_threshold(fmap, occupancy_mask,
-                                                   peak_rc, used_th+0.01,
-                                                   other_fields_linear)
-        if len(pixel_list) > 0:
-            pixels = np.unravel_index(pixel_list, fmap.shape, 'F')
-        else:
-            pixels = []
-
-        fmap[pixels] = max_value * 1.5
-        fields_map[pixels] = field_id
-        field_id = field_id + 1
+        for pixels in _peak_fields(fmap, occupancy_mask, peak_rc, init_thresh,
+                                   other_fields_linear, max_value * 1.5, tree, tracker):
+            fields_map[pixels] = field_id
+            field_id = field_id + 1
 
 
     ##########################################################################
     #####     Part 4: Determine which, if any, fields meet filtering criteria
-    regions = measure.regionprops(fields_map)
+    stats = opexebo.general.field_stats(finite_firing_map, fields_map)
+    good = (stats["area"] >= min_bins) & (stats["mean_rate"] >= min_mean)
+    if debug:
+        # Print out some information about *why* the field failed
+        for row in stats[~good]:
+            if row["area"] < min_bins:
+                print("Field size too small (%d)" % row["area"])
+            if row["mean_rate"] < min_mean:
+                print("Field mean rate too low (%.2f Hz)" % row["mean_rate"])
+    stats = stats[good]
+
+    # void it as we can eliminate some fields, and relabel from 1
+    relabel = np.zeros(max(fields_map.max(), 0) + 1, dtype=np.int64)
+    relabel[stats["field"]] = np.arange(1, stats.size + 1)
+    stats["field"] = np.arange(1, stats.size + 1)
+    fields_map = relabel[fields_map].astype(float)
+
+    if output == "compact":
+        fields = stats
+    else:
+        # Co-ordinates of each field, in row-major order
+        flat = fields_map.ravel().astype(np.int64)
+        members = np.argsort(flat, kind="stable")[np.count_nonzero(flat == 0):]
+        coords = np.split(np.column_stack(np.unravel_index(members, fields_map.shape)),
+                          np.cumsum(stats["area"])[:-1])
+        fields = []
+        for row, field_coords in zip(stats, coords):
+            field = {}
+            field['coords'] = field_coords
+            field['peak_coords'] = row['peak_coords']
+            field['area'] = float(row['area'])
+            field['bbox'] = tuple(row['bbox'])
+            field['centroid_coords'] = tuple(row['centroid_coords'])
+            field['mean_rate'] = row['mean_rate']
+            field['peak_rate'] = row['peak_rate']
+            field['map'] = (fields_map == row['field']).astype(float)
+            fields.append(field)
+    #fields_map = np.ma.masked_where(occupancy_mask, fields_map)
+    if output == "compact":
+        label_type = np.uint8 if len(fields) <= np.iinfo(np.uint8).max else np.uint16
+        fields_map = fields_map.astype(label_type)
+    return (fields, fields_map)
 
-    fields = []
-    fields_map = np.zeros(finite_firing_map.shape)  # void it as we can eliminate some fields
 
-    for region in regions:
-        field_map = finite_firing_map[region.coords[:, 0], region.coords[:, 1]]
-        mean_rate = np.nanmean(field_map)
-        num_bins = len(region.coords)
+def place_field_map(fields_map, field):
+    '''
+    Reconstruct the binary map of a single field from a labelled field map.
 
-        peak_rate = np.nanmax(field_map)
-        peak_relative_index = np.argmax(field_map)
-        peak_coords = region.coords[peak_relative_index, :]
+    Used with the compact output of `place_field` and `place_field_batch`,
+    which store only a label map, rather than a binary map and list of
+    coordinates per field.
 
-        if num_bins >= min_bins and mean_rate >= min_mean:
-            field = {}
-            field['coords'] = region.coords
-            field['peak_coords'] = peak_coords
-            field['area'] = region.area
-            field['bbox'] = region.bbox
-            field['centroid_coords'] = region.centroid
-            field['mean_rate'] = mean_rate
-            field['peak_rate'] = peak_rate
-            mask = np.zeros(finite_firing_map.shape)
-            mask[region.coords[:, 0], region.coords[:, 1]] = 1
-            field['map'] = mask
+    Parameters
+    ----------
+    fields_map: np.ndarray
+        labelled integer image, as returned by `place_field`
+    field: int or np.void
+        Label of the field, or its row in the structured array of fields
 
-            fields.append(field)
+    Returns
+    -------
+    map: np.ndarray
+        Binary map of arena. Cells inside firing field have value 1, all
+        other cells have value 0. Identical to the `map` entry returned by
+        `place_field` with `output="dict"`
+    coords: np.ndarray
+        Coordinates of all bins in the firing field, identical to the
+        `coords` entry returned by `place_field` with `output="dict"`
 
-            fields_map[region.coords[:, 0], region.coords[:, 1]] = len(fields)
-        elif debug:
-            # Print out some information about *why* the field failed
-            if num_bins < min_bins:
-                print("Field size too small (%d)" % num_bins)
-            if mean_rate < min_mean:
-                print("Field mean rate too low (%.2f Hz)" % mean_rate)
-        else:
-            # Field too small and debugging information not needed
-            # Do nothing
-            pass
-    #fields_map = np.ma.masked_where(occupancy_mask, fields_map)
-    return (fields, fields_map)
+    Notes
+    -----
+    Copyright (C) 2021 by Simon Ball
+    '''
+    if isinstance(field, np.void):
+        field = field["field"]
+    in_field = np.asarray(fields_map) == field
+    return in_field.astype(float), np.argwhere(in_field)
 
 
 
@@ -300,8 +342,91 @@ def place_field(firing_map, **kwargs):
 #########################################################
 
 
+def _peak_fields(fmap, occupancy_mask, peak_rc, init_thresh, other_fields_linear,
+                 raised, tree=None, tracker=None):
+    '''
+    Find the field(s) of a single peak by adaptive thresholding, see
+    _expand_field()
+
+    The pixels of each field found are raised to `raised` in `fmap` (and the
+    tree or tracker, if provided), so that they are not found again. Usually
+    a single field is found. If no threshold near the peak gives a valid
+    initial change in area, the pixels at the highest valid threshold are
+    taken as a field first
+
+    Returns
+    -------
+    fields : list
+        Pixels (as a tuple of row and column indices) of each field. The
+        last may be empty
+    '''
+    fields = []
+    used_th = init_thresh
+    res = _area_change(fmap, occupancy_mask, peak_rc, used_th,
+                       used_th-0.02, other_fields_linear, tree, tracker)
+    initial_change = res['acceleration']
+    area2 = res['area2']
+    first_pixels = np.nan
+    if np.isnan(initial_change):
+        for j in np.linspace(used_th+0.01, 1., 4):
+            # Thresholds get higher, area should tend downwards to 1
+            # (i.e. only including the actual peak)
+            res = _area_change(fmap, occupancy_mask, peak_rc, j, j-0.01,
+                               other_fields_linear, tree, tracker)
+            initial_change = res['acceleration']
+            area1 = res['area1']
+            area2 = res['area2']
+            # initial_change is the change from area1 to area 2
+            # area2>area1 -> initial_change > 1
+            # area2<area1 -> initial_change < 1
+            # area 2 is calculated with lower threshold - should usually be larger
+            first_pixels = res['first_pixels']
+            if not np.isnan(initial_change) and initial_change > 0:
+                # True is both area1 and area2 are valid
+                # Weird conditonal from Vadim - initial change will EITHER:
+                # be greater than zero (can't get a negative area to give negative % change)
+                # OR be NaN (which will always yield false when compared to a number)
+                used_th = j - 0.01
+                break
+
+        if np.isnan(initial_change) and not np.isnan(area1):
+            # For the final change
+            pixels = np.unravel_index(first_pixels, fmap.shape, 'F')
+            fmap[pixels] = raised
+            fields.append(pixels)
+            if tree is not None:
+                _claim_pixels(tree, pixels)
+            if tracker is not None:
+                tracker.update(pixels, raised)
+
+        if np.isnan(initial_change):
+            # failed to extract the field
+            # Do nothing, and expand the field from the initial threshold
+            pass
+
+    pixel_list = _expand_field(fmap, occupancy_mask, peak_rc, initial_change, area2,
+                               other_fields_linear, used_th, tree, tracker)
+    if np.any(np.isnan(pixel_list)):
+        _, pixel_list, _ = _area_for_threshold(fmap, occupancy_mask,
+                                               peak_rc, used_th+0.01,
+                                               other_fields_linear, tree, tracker)
+    if len(pixel_list) > 0:
+        pixels = np.unravel_index(pixel_list, fmap.shape, 'F')
+    else:
+        pixels = []
+
+    fmap[pixels] = raised
+    fields.append(pixels)
+    if tree is not None and len(pixels) > 0:
+        _claim_pixels(tree, pixels)
+    if tracker is not None and len(pixels) > 0:
+        tracker.update(pixels, raised)
+    return fields
+
+
 def _expand_field(image, occupancy_mask, peak_rc, initial_change,
-                  initial_area, other_fields_linear, initial_th):
+                  initial_area, other_fields_linear, initial_th, tree=None,
+                  tracker=None):
     '''
     Adaptive placefield detection:
         Start with a threshold around 80%, step down in ~0.02
@@ -324,7 +449,8 @@ def _expand_field(image, occupancy_mask, peak_rc, initial_change,
         threshold = np.round(threshold, 2)
 
         area, pixels, is_bad = _area_for_threshold(image, occupancy_mask, peak_rc,
-                                                   threshold, other_fields_linear)
+                                                   threshold, other_fields_linear, tree,
+                                                   tracker)
         if np.isnan(area) or is_bad:
             pixel_list = last_pixels
             break
@@ -358,7 +484,8 @@ def _expand_field(image, occupancy_mask, peak_rc, initial_change,
     return pixel_list
 
 
-def _area_change(image, occupancy_mask, peak_rc, first, second, other_fields_linear):
+def _area_change(image, occupancy_mask, peak_rc, first, second, other_fields_linear,
+                 tree=None, tracker=None):
     ''' Compare the change in field area based on two threshold values
 
     If either threshold results in an invalid field (based on criteria in
@@ -381,18 +508,22 @@ def _area_change(image, occupancy_mask, peak_rc, first, second, other_fields_lin
         second threshold
     other_fields_linear : np.ndarray
         All other local maxima except the ony under consideration
+    tree : dict, optional
+        Component tree of image, see _component_tree()
+    tracker : opexebo.general.RegionTracker, optional
+        Region tracker of image, seeded at peak_rc
     '''
     results = {'acceleration': np.nan, 'area1': np.nan, 'area2': np.nan,
                'first_pixels': np.nan,
                'second_pixels': np.nan}
 
     area1, first_pixels, is_bad1 = _area_for_threshold(image, occupancy_mask, peak_rc, first,
-                                                       other_fields_linear)
+                                                       other_fields_linear, tree, tracker)
     if np.isnan(area1) or is_bad1:
         return results
 
     area2, second_pixels, is_bad2 = _area_for_threshold(image, occupancy_mask, peak_rc, second,
-                                                        other_fields_linear)
+                                                        other_fields_linear, tree, tracker)
     if np.isnan(area2) or is_bad2:
         return results
 
@@ -406,7 +537,8 @@ def _area_change(image, occupancy_mask, peak_rc, first, second, other_fields_lin
     return results
 
 
-def _area_for_threshold(image, occupancy_mask, peak_rc, threshold, other_fields_linear):
+def _area_for_threshold(image, occupancy_mask, peak_rc, threshold, other_fields_linear,
+                        tree=None, tracker=None):
     '''Calculate the area of the field defined by the local maxima 'peak_rc' and
     the relative thresholding value 'threshold'
 
@@ -430,7 +562,17 @@ def _area_for_threshold(image, occupancy_mask, peak_rc, threshold, other_fields_
         indicies of all cells within field if field is valid
     is_bad : bool
         True IF field includes a second local maxima or IF field contains holes
+
+    If the component tree of the image is provided, the field is looked up in
+    the tree instead, see _tree_area_for_threshold(). Likewise if a region
+    tracker is provided, see _tracker_area_for_threshold()
     '''
+    if tracker is not None:
+        return _tracker_area_for_threshold(tracker, image, occupancy_mask, peak_rc,
+                                           threshold, other_fields_linear)
+    if tree is not None:
+        return _tree_area_for_threshold(tree, image, occupancy_mask, peak_rc,
+                                        threshold, other_fields_linear)
     area = np.nan
     # Field is bad if it contains any other peak
     is_bad = False
@@ -455,8 +597,8 @@ def _area_for_threshold(image, occupancy_mask, peak_rc, threshold, other_fields_
 
     # calclate euler_number by hand rather than by regionprops
     # This yields results that are more similar to Matlab's regionprops
-    # NOTE - this uses scipy.ndimage.morphology, while most else uses skimage.morphology
-    filled_image = ndimage.morphology.binary_fill_holes(labeled_img)
+    # NOTE - this uses scipy.ndimage, while most else uses skimage.morphology
+    filled_image = ndimage.binary_fill_holes(labeled_img)
     euler_array = (filled_image != labeled_img)  # True where holes were filled in
 
     euler_array = np.maximum((euler_array*1) - (occupancy_mask*1), 0)
@@ -481,3 +623,268 @@ def _area_for_threshold(image, occupancy_mask, peak_rc, threshold, other_fields_
         is_bad = len(np.intersect1d(area_linear_indices, other_fields_linear)) > 0 # True if any other local maxima occur within this field
 
     return (area, area_linear_indices, is_bad)
+
+
+def _component_tree(image):
+    '''Build the component tree (max-tree) of an image, with the attributes
+    needed to evaluate fields at any threshold
+
+    place_field() raises the pixels of each field it finds above the rest of
+    the image. Rather than rebuilding the tree, these pixels are recorded with
+    _claim_pixels(), and any component that contains, or borders on, a
+    raised pixel is evaluated by thresholding the modified image instead.
+
+    Every node of the tree is a connected component (connectivity=1) of the
+    set of pixels with value greater than or equal to the level of the node.
+    Each node is represented by a canonical pixel. The following attributes
+    are calculated for every node:
+        * area : number of pixels in the component
+        * euler : Euler number of the component, i.e. 1 - number of holes
+        * tin : position of the canonical pixel in a pre-order traversal of
+          the tree. The pixels of the component are
+          `order[tin : tin + area]`
+
+    The Euler number is calculated as vertices - edges + faces of the cubical
+    complex of the component. Each edge (pair of 4-neighbours) and face (2x2
+    square) belongs to every component that contains its lowest valued pixel,
+    so can be assigned to that pixel. As every component occupies a
+    contiguous range of the pre-order, the area and Euler number of all
+    components are then differences of cumulative sums over the pre-order.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        2D image without NaN values
+
+    Returns
+    -------
+    tree : dict
+        parent, node, area, euler, tin, order : np.ndarray, indexed by pixel
+        (C-order linear index). `node` is the canonical pixel of the node
+        that each pixel belongs to
+        nodes : np.ndarray
+            The canonical pixels
+        chains : dict
+            Cache of the canonical pixels from each peak to the root
+        near : np.ndarray
+            Boolean image, True at pixels raised since the tree was built, and
+            their 4-neighbours
+        touching : np.ndarray
+            Running count, in pre-order, of pixels that are claimed or
+            4-neighbours of claimed pixels
+    '''
+    parent, _ = morphology.max_tree(image, connectivity=1)
+    parent = parent.ravel()
+    values = image.ravel()
+    num_pixels = values.size
+    index = np.arange(num_pixels)
+    canonical = (parent == index) | (values[parent] != values)
+    node = np.where(canonical, index, parent)
+
+    # Pre-order of the tree of nodes. The other pixels of each node, which
+    # have no children, follow their canonical pixel
+    nodes = np.flatnonzero(canonical)
+    rank = np.cumsum(canonical) - 1
+    node_tin, node_size, node_order, jumps = _tree_ranges(rank[parent[nodes]])
+    members = np.bincount(rank[node], minlength=nodes.size)
+    offset = np.concatenate(([0], np.cumsum(members[node_order])))
+    order = np.argsort(2 * offset[node_tin[rank[node]]] + ~canonical, kind="stable")
+    tin = np.empty(num_pixels, dtype=np.int64)
+    tin[order] = index
+    area = np.ones(num_pixels, dtype=np.int64)
+    area[nodes] = offset[node_tin + node_size] - offset[node_tin]
+
+    # Euler number contributions. The complex has a vertex for every pixel,
+    # an edge for every pair of 8-neighbours, and a triangle (tetrahedron) for
+    # every 3 (4) pixels of a 2x2 square, such that holes are counted with a
+    # 4-connected background, as in binary_fill_holes. Each element belongs to
+    # every component containing all of its pixels. Except for some diagonal
+    # edges, these pixels are 4-connected through pixels of the element, so the
+    # element can be assigned to its lowest valued pixel
+    grid = index.reshape(image.shape)
+    owners = [index]
+    signs = [1]
+    for a, b in ((grid[:, :-1], grid[:, 1:]), (grid[:-1, :], grid[1:, :])):
+        a = a.ravel()
+        b = b.ravel()
+        owners.append(np.where(values[a] <= values[b], a, b))
+        signs.append(-1)
+    corners = np.stack([grid[:-1, :-1].ravel(), grid[:-1, 1:].ravel(),
+                        grid[1:, 1:].ravel(), grid[1:, :-1].ravel()])
+    squares = np.arange(corners.shape[1])
+    corner_values = values[corners]
+    # Tetrahedra
+    owners.append(corners[np.argmin(corner_values, axis=0), squares])
+    signs.append(-1)
+    # Triangles: the three corners other than corner k
+    for k in range(4):
+        others = np.delete(np.arange(4), k)
+        owners.append(corners[others[np.argmin(corner_values[others], axis=0)], squares])
+        signs.append(1)
+    # Diagonal edges: the two ends are 4-connected at the level of the lower
+    # end if either of the other corners is at least as high. Otherwise, the
+    # edge belongs to the smallest component that contains both ends
+    for k in range(2):
+        a, b = corners[k], corners[k+2]
+        low = np.minimum(values[a], values[b])
+        local = np.maximum(values[corners[k+1]], values[corners[(k+3) % 4]]) >= low
+        owners.append(np.where(values[a] <= values[b], a, b)[local])
+        signs.append(-1)
+        saddle = _common_ancestor(node_tin, node_size, jumps, rank[node[a[~local]]],
+                                  rank[node[b[~local]]])
+        owners.append(nodes[saddle])
+        signs.append(-1)
+    euler = np.bincount(np.concatenate(owners), minlength=num_pixels,
+                        weights=np.repeat(signs, [owner.size for owner in owners]))
+
+    # Accumulate the Euler number over each component
+    running = np.concatenate(([0], np.cumsum(euler[order])))
+    euler[nodes] = running[tin[nodes] + area[nodes]] - running[tin[nodes]]
+
+    return {"parent": parent, "node": node, "nodes": nodes, "area": area,
+            "euler": euler, "tin": tin, "order": order, "chains": {},
+            "near": np.zeros(image.shape, dtype=bool),
+            "touching": np.zeros(num_pixels + 1, dtype=int)}
+
+
+def _tree_ranges(parent):
+    '''Pre-order traversal of a tree, given the parent of each vertex (the
+    root is its own parent)
+
+    Returns
+    -------
+    tin : np.ndarray
+        Position of each vertex in the pre-order. The subtree of vertex v is
+        `order[tin[v] : tin[v] + size[v]]`
+    size : np.ndarray
+        Number of vertices in the subtree of each vertex
+    order : np.ndarray
+        The vertices, in pre-order
+    jumps : list of np.ndarray
+        `jumps[k][v]` is the ancestor 2**k generations above v, or the root
+    '''
+    num = parent.size
+    index = np.arange(num)
+    is_child = parent != index
+    root = int(np.flatnonzero(~is_child)[0])
+
+    # Pre-order, visiting children in increasing and in decreasing order. The
+    # position of a vertex is its depth plus the number of vertices to its
+    # left (or right) that are neither its ancestors nor descendants
+    orders = []
+    positions = []
+    for label in (index, index[::-1]):
+        graph = sparse.csr_matrix((np.ones(num - 1), (label[parent[is_child]],
+                                   label[is_child])), shape=(num, num))
+        orders.append(label[csgraph.depth_first_order(graph, label[root],
+                                                      return_predecessors=False)])
+        positions.append(np.empty(num, dtype=np.int64))
+        positions[-1][orders[-1]] = index
+
+    # Depth of each vertex, by pointer jumping
+    jumps = [parent]
+    depth = is_child.astype(np.int64)
+    while np.any(jumps[-1] != root):
+        depth = depth + depth[jumps[-1]]
+        jumps.append(jumps[-1][jumps[-1]])
+    size = num - positions[0] - positions[1] + depth
+    return positions[0], size, orders[0], jumps
+
+
+def _claim_pixels(tree, pixels):
+    '''Record that the values of `pixels` have been raised above the rest of
+    the image since the tree was built'''
+    rows, cols = pixels
+    top, left = max(np.min(rows) - 1, 0), max(np.min(cols) - 1, 0)
+    window = (slice(top, np.max(rows) + 2), slice(left, np.max(cols) + 2))
+    claimed = np.zeros(tree["near"][window].shape, dtype=bool)
+    claimed[rows - top, cols - left] = True
+    tree["near"][window] |= ndimage.binary_dilation(claimed)
+    np.cumsum(tree["near"].ravel()[tree["order"]], out=tree["touching"][1:])
+
+
+def _common_ancestor(tin, size, jumps, a, b):
+    '''Smallest common ancestors of the vertices a and b, by binary lifting'''
+    def contains(u, v):
+        return (tin[u] <= tin[v]) & (tin[v] < tin[u] + size[u])
+    a = a.copy()
+    for up in reversed(jumps):
+        lift = ~contains(up[a], b)
+        a[lift] = up[a[lift]]
+    return np.where(contains(a, b), a, jumps[0][a])
+
+
+def _tree_area_for_threshold(tree, image, occupancy_mask, peak_rc, threshold,
+                             other_fields_linear):
+    '''Equivalent of _area_for_threshold(), using the component tree
+
+    The field is the node containing the peak with the lowest level that is
+    still above the threshold value. Nodes whose Euler number indicates a hole
+    are re-evaluated with _area_for_threshold(), which accounts for holes due
+    to unvisited bins. So are nodes that contain or border on pixels that have
+    been raised since the tree was built, as the component would differ in
+    the modified image.
+    '''
+    peak = np.ravel_multi_index((peak_rc[0], peak_rc[1]), image.shape)
+    threshold_value = image[peak_rc[0], peak_rc[1]] * threshold
+    values = image.ravel()
+
+    if peak not in tree["chains"]:
+        # The nodes containing the peak, from the smallest up
+        nodes = tree["nodes"]
+        start = tree["tin"][tree["node"][peak]]
+        chain = nodes[(tree["tin"][nodes] <= start) & (start < tree["tin"][nodes] + tree["area"][nodes])]
+        chain = chain[np.argsort(tree["area"][chain])]
+        tree["chains"][peak] = (chain, values[chain])
+    chain, levels = tree["chains"][peak]
+
+    # levels decrease along the chain
+    num_above = np.count_nonzero(levels >= threshold_value)
+    if num_above == 0:
+        return _area_for_threshold(image, occupancy_mask, peak_rc, threshold,
+                                   other_fields_linear)
+    field_node = chain[num_above - 1]
+    area = tree["area"][field_node]
+    start = tree["tin"][field_node]
+    touching = tree["touching"][start+area] - tree["touching"][start]
+    if tree["euler"][field_node] < 1 or touching > 0:
+        return _area_for_threshold(image, occupancy_mask, peak_rc, threshold,
+                                   other_fields_linear)
+
+    pixels = tree["order"][start:start+area]
+    area_linear_indices = np.ravel_multi_index(np.unravel_index(pixels, image.shape),
+                                               dims=image.shape, order='F')
+    is_bad = False
+    if len(other_fields_linear) > 0:
+        others = np.ravel_multi_index(np.unravel_index(other_fields_linear, image.shape, order='F'),
+                                      dims=image.shape)
+        others_tin = tree["tin"][others]
+        is_bad = np.any((others_tin >= start) & (others_tin < start + area))
+    return (area, area_linear_indices, is_bad)
+
+
+def _tracker_area_for_threshold(tracker, image, occupancy_mask, peak_rc, threshold,
+                                other_fields_linear):
+    '''Equivalent of _area_for_threshold(), using the region tracker of the
+    peak. Holes consisting only of unvisited bins are ignored by the tracker.
+    If the threshold value is above the peak (i.e. the peak is negative), the
+    field is evaluated by thresholding instead, as is done for the tree'''
+    peak_value = image[peak_rc[0], peak_rc[1]]
+    threshold_value = peak_value * threshold
+    if threshold_value > peak_value:
+        return _area_for_threshold(image, occupancy_mask, peak_rc, threshold,
+                                   other_fields_linear)
+    if threshold_value < tracker.floor:
+        # Most fields are found well above the lowest threshold, so the
+        # region is tracked down to a lower floor only when needed
+        tracker.reseed(peak_rc, floor=min(threshold_value, peak_value * (threshold - 0.2)))
+    if tracker.holes(threshold_value) > 0:
+        return (np.nan, [], True)
+
+    pixels = tracker.pixels(threshold_value)
+    area_linear_indices = np.ravel_multi_index(np.unravel_index(pixels, image.shape),
+                                               dims=image.shape, order='F')
+    is_bad = False
+    if len(other_fields_linear) > 0:
+        is_bad = len(np.intersect1d(area_linear_indices, other_fields_linear)) > 0
+    return (pixels.size, area_linear_indices, is_bad)
@@ -0,0 +1,230 @@
+"""
+Provide function for 1D placefield detection.
+"""
+
+import numpy as np
+from scipy import signal
+
+import opexebo.defaults as default
+import opexebo.errors as err
+
+
+#: Columns of the structured array of fields returned by place_field_1d
+FIELD_1D_DTYPE = np.dtype([("unit", np.int64),
+                           ("field", np.int64),
+                           ("area", np.int64),
+                           ("peak_coords", np.int64),
+                           ("centroid_coords", np.float64),
+                           ("bbox", np.int64, (2, )),
+                           ("mean_rate", np.float64),
+                           ("peak_rate", np.float64)])
+
+
+def place_field_1d(rate_maps, **kwargs):
+    '''
+    Locate place fields on 1D (linear track) firing maps.
+
+    A field is a run of consecutive visited bins around a peak, in which the
+    firing rate is at least `threshold` times the firing rate of that peak.
+    Each field is thresholded relative to its own peak, so a weak field is
+    found alongside a much stronger one. Fields that are too short, or fire
+    too weakly, are discarded.
+
+    Every local maximum is a candidate peak. A peak is split from the field of
+    a higher peak if its region above the saddle between them (and above
+    `threshold` of its own rate) has at least `min_bins` bins and a rate of at
+    least `min_peak`. Two such fields are then separated at the lowest bin
+    between them, even if that valley is above `threshold`. Smaller peaks, such
+    as noise on the flank of a field, are part of the field of a neighbour.
+
+    The peaks of every map are found at once, in a single signal joining the
+    maps, and the runs around all peaks are found together by extending them
+    over windows of decreasing power-of-two length. The runs are described with
+    `np.add.reduceat` and `np.maximum.reduceat` over their boundaries. Many
+    units (or laps) can therefore be processed together, without a loop over
+    maps or fields.
+
+    Parameters
+    ----------
+    rate_maps: np.ndarray or np.ma.MaskedArray
+        Smoothed 1D rate map of shape (T, ), or a stack of N maps, (N, T).
+        If supplied as an np.ndarray, it is assumed that the maps take values
+        of np.nan at locations of zero occupancy. If supplied as an
+        np.ma.MaskedArray, it is assumed that the maps are masked at locations
+        of zero occupancy. Unvisited bins are never part of a field
+
+    Other Parameters
+    ----------------
+    threshold: float
+        Fraction of the peak firing rate of each field above which bins are
+        part of that field. Must be in the range (0, 1]. Default 0.2
+    min_bins: int
+        Fields containing fewer than this many bins will be discarded. Default 9
+    min_peak: float
+        Fields with a peak firing rate lower than this absolute value will
+        be discarded. Default 1 Hz
+    min_mean: float
+        Fields with a mean firing rate lower than this absolute value will
+        be discarded. Default 0.1 Hz
+
+    Returns
+    -------
+    fields: np.ndarray
+        Structured array with one row per field, with columns
+        unit: int
+            Index of the map in `rate_maps`. Zero for a single map
+        field: int
+            Label of the field in `fields_map`, starting from 1 in each map
+        area: int
+            Number of bins in firing field. [bins]
+        peak_coords: int
+            Bin of peak firing rate. The first, if the peak is not unique
+        centroid_coords: float
+            Centre of the field (decimal)
+        bbox: np.ndarray
+            (start, stop) bins of the field, where stop is exclusive
+        mean_rate: float
+            mean firing rate [Hz]
+        peak_rate: float
+            peak firing rate [Hz]
+    fields_map: np.ndarray
+        uint16 array of the same shape as `rate_maps` of labelled fields
+        (background = 0, field1 = 1, field2 = 2, etc.)
+
+    See Also
+    --------
+    opexebo.analysis.place_field
+
+    Notes
+    -----
+    Copyright (C) 2021 by Simon Ball
+    '''
+    threshold = kwargs.get("threshold", default.field_1d_threshold)
+    min_bins = kwargs.get("min_bins", default.firing_field_min_bins)
+    min_peak = kwargs.get("min_peak", default.firing_field_min_peak)
+    min_mean = kwargs.get("min_mean", default.firing_field_min_mean)
+
+    if not 0 < threshold <= 1:
+        raise err.ArgumentError("Keyword 'threshold' must be in the range (0, 1]."\
+                                f" You provided {threshold}")
+    invalid = np.ma.getmaskarray(rate_maps)
+    rates = np.asarray(np.ma.getdata(rate_maps), dtype=float)
+    if rates.ndim not in (1, 2):
+        raise err.ArgumentError("rate_maps must be a (T, ) or (N, T) array."\
+                                f" You provided a {rates.ndim} dimensional array")
+    shape = rates.shape
+    rates = np.atleast_2d(rates)
+    invalid = np.atleast_2d(invalid) | np.isnan(rates)
+    num_maps, num_bins = rates.shape
+
+    # The maps are joined into a single signal, in which every unvisited bin,
+    # and a bin between each pair of maps, is lower than every rate. No run
+    # of bins that are higher than some level can include these bins
+    rates = np.where(invalid, 0, rates)
+    low = rates[~invalid].min(initial=0) - 1
+    joined = np.full((num_maps, num_bins + 1), low)
+    joined[:, 1:] = np.where(invalid, low, rates)
+    joined = np.append(joined.ravel(), low)
+    minima = _window_minima(joined)
+
+    # Every local maximum is a candidate peak. Its saddle is the level at which
+    # its region joins that of a higher peak (`low` if there is none)
+    peaks, _ = signal.find_peaks(joined)
+    _, left_base, right_base = signal.peak_prominences(joined, peaks)
+    saddle = np.maximum(joined[left_base], joined[right_base])
+    level = threshold * joined[peaks]
+
+    # A peak is split from the field of a higher peak if its own region, above
+    # both the saddle and `threshold` of the peak, is large and strong enough
+    above = np.maximum(level, np.nextafter(saddle, np.inf))
+    area = _run_stop(minima, peaks, above) - _run_start(minima, peaks, above)
+    split = (saddle == low) | ((area >= min_bins) & (joined[peaks] >= min_peak))
+    peaks, level = peaks[split], level[split]
+    if peaks.size == 0:
+        return np.zeros(0, dtype=FIELD_1D_DTYPE), np.zeros(shape, dtype=np.uint16)
+
+    # The field of each peak is the run of bins at `threshold` of its own peak,
+    # ending before the lowest bin between it and the neighbouring peaks
+    valley = np.nextafter(np.minimum.reduceat(joined, peaks)[:-1], np.inf)
+    bound = np.nextafter(low, np.inf)
+    start = _run_start(minima, peaks, np.maximum(level, np.append(bound, valley)))
+    stop = _run_stop(minima, peaks, np.maximum(level, np.append(valley, bound)))
+    unit = start // (num_bins + 1)
+    start = start - unit * (num_bins + 1) - 1
+    stop = stop - unit * (num_bins + 1) - 1
+
+    offset = unit * num_bins
+    bounds = np.column_stack((offset + start, offset + stop)).ravel()
+    flat = np.append(rates.ravel(), 0)
+    area = stop - start
+    mean_rate = np.add.reduceat(flat, bounds)[::2] / area
+    peak_rate = np.maximum.reduceat(flat, bounds)[::2]
+
+    keep = (area >= min_bins) & (peak_rate >= min_peak) & (mean_rate >= min_mean)
+    unit, start, stop = unit[keep], start[keep], stop[keep]
+    fields = np.zeros(unit.size, dtype=FIELD_1D_DTYPE)
+    fields["unit"] = unit
+    fields["area"] = area[keep]
+    fields["centroid_coords"] = (start + stop - 1) / 2
+    fields["bbox"] = np.column_stack((start, stop))
+    fields["mean_rate"] = mean_rate[keep]
+    fields["peak_rate"] = peak_rate[keep]
+    # Number the fields from 1 within each map
+    first = np.searchsorted(unit, unit, side="left")
+    fields["field"] = np.arange(unit.size) - first + 1
+
+    # Label map, built from the run boundaries: each label is added at the
+    # start of its field and removed at the stop
+    offset = unit * num_bins
+    steps = np.zeros(flat.size, dtype=np.int64)
+    np.add.at(steps, offset + start, fields["field"])
+    np.add.at(steps, offset + stop, -fields["field"])
+    fields_map = np.cumsum(steps)[:-1].reshape(num_maps, num_bins)
+
+    # Peak bin: the first bin of each field at the field's peak rate
+    in_field = np.flatnonzero(fields_map)
+    run = np.repeat(np.arange(unit.size), fields["area"])
+    at_peak = flat[in_field] == fields["peak_rate"][run]
+    first_peak = in_field[at_peak][np.unique(run[at_peak], return_index=True)[1]]
+    fields["peak_coords"] = first_peak - offset
+
+    return fields, fields_map.astype(np.uint16).reshape(shape)
+
+
+#########################################################
+################        Helper Functions
+#########################################################
+
+
+def _window_minima(values):
+    '''Minimum of every window of `values` of each power-of-two length: the
+    n-th array holds the minimum of `values[i:i + 2**n]` at `i`'''
+    minima = [values]
+    width = 1
+    while 2 * width <= values.size:
+        minima.append(np.minimum(minima[-1][:-width], minima[-1][width:]))
+        width *= 2
+    return minima
+
+
+def _run_start(minima, index, level):
+    '''First bin of the run of bins no lower than `level` that includes each
+    of `index`, extended by decreasing powers of two'''
+    start = index.copy()
+    for power in reversed(range(len(minima))):
+        cand = start - 2**power
+        ok = cand >= 0
+        ok[ok] = minima[power][cand[ok]] >= level[ok]
+        start[ok] = cand[ok]
+    return start
+
+
+def _run_stop(minima, index, level):
+    '''Bin after the end of the run of bins no lower than `level` that
+    includes each of `index`'''
+    stop = index + 1
+    for power in reversed(range(len(minima))):
+        ok = stop + 2**power <= minima[0].size
+        ok[ok] = minima[power][stop[ok]] >= level[ok]
+        stop[ok] += 2**power
+    return stop
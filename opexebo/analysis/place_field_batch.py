@@ -0,0 +1,129 @@
+"""
+Provide function for place field detection over a stack of rate maps
+"""
+
+import concurrent.futures
+
+import numpy as np
+
+import opexebo.defaults as default
+import opexebo.errors as err
+from opexebo.analysis.place_field import place_field, FIELD_DTYPE
+
+
+#: Columns of the field table returned by place_field_batch
+FIELD_TABLE_DTYPE = np.dtype([("unit", np.int64)] + FIELD_DTYPE.descr)
+
+
+def place_field_batch(stack, **kwargs):
+    """Locate place fields on a stack of firing maps.
+
+    Equivalent to calling `opexebo.analysis.place_field` on each firing map
+    in turn. The maps are divided into chunks, which are distributed over a
+    pool of workers, and the results are returned in a compact, columnar,
+    form: a single table of fields, and a single volume of field labels,
+    rather than a list of dictionaries per map.
+
+    Parameters
+    ----------
+    stack: np.ndarray or np.ma.MaskedArray
+        (N, H, W) stack of N smoothed rate maps. See `place_field` for the
+        treatment of unvisited bins
+
+    Other Parameters
+    ----------------
+    workers: int
+        Number of workers. If 1, the maps are processed in the calling
+        thread. Default 1
+    pool: str
+        `thread` or `process`. Threads have the lowest overhead, processes
+        avoid contention for the interpreter. Default `thread`
+    chunk_size: int
+        Number of maps processed by a worker at a time. Default 64
+    **kwargs:
+        All other keywords are passed to `place_field`, except `output`
+
+    Returns
+    -------
+    fields: np.ndarray
+        Structured array with one row per field, with columns
+        unit: int
+            Index of the map in `stack`
+        field: int
+            Label of the field in `fields_map`, starting from 1 in each map
+        area, peak_coords, centroid_coords, bbox, mean_rate, peak_rate:
+            As returned by `place_field` with `output="compact"`
+    fields_map: np.ndarray
+        (N, H, W) uint16 array of labelled fields, as returned by
+        `place_field` for each map
+
+    See Also
+    --------
+    opexebo.analysis.place_field
+    opexebo.analysis.place_field_map
+
+    Notes
+    -----
+    Copyright (C) 2021 by Simon Ball
+    """
+    workers = kwargs.pop("workers", default.batch_workers)
+    pool = kwargs.pop("pool", default.batch_pool)
+    chunk_size = kwargs.pop("chunk_size", default.batch_chunk_size)
+    kwargs["output"] = "compact"
+
+    if not isinstance(stack, np.ma.MaskedArray):
+        stack = np.asarray(stack)
+    if stack.ndim != 3:
+        raise err.ArgumentError("stack must be an (N, H, W) array of rate maps."\
+                                f" You provided a {stack.ndim} dimensional array")
+    if pool not in default.batch_pools:
+        raise err.ArgumentError(f"Keyword 'pool' must be one of {default.batch_pools}."\
+                                f" You provided '{pool}'")
+
+    starts = range(0, stack.shape[0], chunk_size)
+    chunks = [stack[start:start+chunk_size] for start in starts]
+    if workers == 1 or len(chunks) == 1:
+        results = [_place_field_chunk(chunk, kwargs) for chunk in chunks]
+    else:
+        if pool == "process":
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            results = list(executor.map(_place_field_chunk, chunks,
+                                         [kwargs] * len(chunks)))
+
+    tables = [np.zeros(0, dtype=FIELD_TABLE_DTYPE)]
+    fields_map = np.zeros(stack.shape, dtype=np.uint16)
+    for start, (table, labels) in zip(starts, results):
+        table["unit"] += start
+        tables.append(table)
+        fields_map[start:start+labels.shape[0]] = labels
+    return np.concatenate(tables), fields_map
+
+
+#########################################################
+################        Helper Functions
+#########################################################
+
+
+def _place_field_chunk(maps, kwargs):
+    '''Run place_field on each map of a chunk, and tabulate the output
+
+    Returns
+    -------
+    table : np.ndarray
+        Structured array of FIELD_TABLE_DTYPE. `unit` is relative to the chunk
+    labels : np.ndarray
+        (n, H, W) integer array of labelled fields
+    '''
+    tables = [np.zeros(0, dtype=FIELD_TABLE_DTYPE)]
+    labels = np.zeros(maps.shape, dtype=np.uint16)
+    for i, firing_map in enumerate(maps):
+        fields, labels[i] = place_field(firing_map, **kwargs)
+        table = np.zeros(fields.size, dtype=FIELD_TABLE_DTYPE)
+        table["unit"] = i
+        for name in FIELD_DTYPE.names:
+            table[name] = fields[name]
+        tables.append(table)
+    return np.concatenate(tables), labels
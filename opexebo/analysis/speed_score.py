@@ -124,8 +124,8 @@ def speed_score(spike_times, tracking_times, tracking_speeds, **kwargs):
 
     # Apply smoothing
     # Smoothing expects to be given a sigma in units [bins], so convert from real units to bins
-    tracking_speeds_smoothed = opexebo.general.smooth(tracking_speeds, sigma_time * sampling_rate)
-    firing_rate_smoothed = opexebo.general.smooth(firing_rate, sigma_time * sampling_rate)
+    tracking_speeds_smoothed, firing_rate_smoothed = opexebo.general.smooth(
+        np.vstack((tracking_speeds, firing_rate)), sigma_time * sampling_rate, axes=1)
 
     # Calculate the bandpass filter
     if debug:
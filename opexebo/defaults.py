@@ -37,6 +37,22 @@ sigma_time = 0.4
 #: Replacement value for masked values when smoothing. Use np.nan to interpolate through masked values instead of use fixed value
 mask_fill = 0
 
+#: How the convolution is calculated when smoothing
+smooth_method = "auto"
+smooth_methods = ("direct", "separable", "fft", smooth_method)
+
+#: Number of kernels of each type that smooth keeps for reuse
+smooth_cache_size = 32
+
+
+
+'''Correlation'''
+#: Number of threads used by scipy.fft in correlations and smoothing. -1 uses all CPUs
+fft_workers = 1
+
+#: Number of array shapes for which FFT sizes and overlap counts are cached
+fft_setup_cache_size = 16
+
 
 
 '''LFP related'''
@@ -68,7 +84,27 @@ firing_field_min_mean = 0.1
 search_method = 'default'
 
 #: All implemented means of finding local maxima. Use lower case. 
-all_methods = (search_method, "sep", "not implemented")    
+all_methods = (search_method, "sep", "ndimage", "not implemented")    
+
+#: Number of thresholds used to deblend local maxima (ndimage search method)
+deblend_nthresh = 32
+
+#: Minimum fraction of flux for a branch to be deblended (ndimage search method)
+deblend_cont = 0.005
+
+#: Minimum number of bins of an object containing local maxima (ndimage search method)
+peak_min_area = 5
+
+#: The method used to evaluate the area of a firing field at each threshold
+field_method = "threshold"
+field_methods = (field_method, "max_tree", "incremental")
+
+#: Form of the fields returned by place_field
+field_output = "dict"
+field_outputs = (field_output, "compact")
+
+#: Relative threshold, in range (0, 1], of the peak firing rate of a 1D field for a bin to be part of it
+field_1d_threshold = 0.2
 
 
 
@@ -80,6 +116,35 @@ hd_percentile = 0.95
 #: minimum angular separation between fields in acorr considered for grid ellipse [degrees]
 min_orientation = 15
 
+#: Method for rotating autocorrelograms in the gridness score
+grid_rotation_method = "cartesian"
+grid_rotation_methods = (grid_rotation_method, "polar")
+
+#: Angular resolution of the polar grid used by the polar rotation method [degrees]. Must divide 30
+polar_angle_step = 1
+
+#: Number of autocorrelogram shapes for which rotation operators are cached
+grid_operator_cache_size = 8
+
+#: Number of autocorrelograms or rate maps processed together by batched calculations
+batch_chunk_size = 64
+
+#: Number of workers used by batched calculations
+batch_workers = 1
+
+#: Type of worker pool used by batched calculations
+batch_pool = "thread"
+batch_pools = (batch_pool, "process")
+
+#: Number of shuffled spike trains used for significance thresholds
+shuffle_iterations = 100
+
+#: Minimum time shift of a shuffled spike train [s]
+shuffle_offset_lim = 20
+
+#: Percentiles of the shuffled distribution returned as significance thresholds
+shuffle_percentiles = (95, 99)
+
 #: The default speed bandwidth for adaptive bandpassing [cm/s]
 speed_bandwidth = 2
 #: The default lower edge of the bandpass filter used for speedscore [cm/s]
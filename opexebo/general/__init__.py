@@ -1,19 +1,23 @@
 from .validate_keyword import validatekeyword__arena_size, validate_keyword_arena_shape
-from .normxcorr2_general import normxcorr2_general
-from .smooth import smooth
+from .normxcorr2_general import normxcorr2_general, normxcorr2_pairwise
+from .normxcorr2_masked import normxcorr2_masked
+from .smooth import smooth, smooth_cache_info
 from .shuffle import shuffle
-from .fit_ellipse import fit_ellipse
+from .fit_ellipse import fit_ellipse, fit_ellipse_batch
 from .upsample import upsample
 from .bin_width_2_num import bin_width_to_bin_number
 from .circular_mask import circular_mask
-from .accumulate_spatial import accumulate_spatial
+from .accumulate_spatial import accumulate_spatial, spatial_bin_index
 from .peak_search import peak_search
+from .region_tracker import RegionTracker
+from .field_stats import field_stats
 from .power_spectrum import power_spectrum
 from .spatial_cross_correlation import spatial_cross_correlation
 
 
-__all__ = ['normxcorr2_general', 'smooth', 'accumulate_spatial', 'shuffle',
+__all__ = ['normxcorr2_general', 'normxcorr2_pairwise', 'normxcorr2_masked',
+           'smooth', 'smooth_cache_info', 'accumulate_spatial', 'spatial_bin_index', 'shuffle',
            'validatekeyword__arena_size', 'validate_keyword_arena_shape',
-           'fit_ellipse', 'peak_search',
+           'fit_ellipse', 'fit_ellipse_batch', 'peak_search', 'RegionTracker', 'field_stats',
            'power_spectrum', 'spatial_cross_correlation', 'bin_width_to_bin_number',
            'circular_mask', 'upsample']
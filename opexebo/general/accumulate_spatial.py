@@ -56,6 +56,12 @@ def accumulate_spatial(pos, arena_size, **kwargs):
         to generate default limits.
         As is standard in python, acceptable values include the lower bound
         and exclude the upper bound
+    return_index: bool
+        If True, also return the flat index of the bin of each observation,
+        as described in `opexebo.general.spatial_bin_index`, with the index
+        -1 for observations outside `limits`. Histograms of any subset of the
+        observations can then be made without searching for bins again.
+        Default False
 
     Returns
     -------
@@ -67,6 +73,11 @@ def accumulate_spatial(pos, arena_size, **kwargs):
     edges: list-like
         `x`, or (`x`, `y`), where `x`, `y` are 1d np.ndarrays
         Here `x`, `y` correspond to the output histogram
+    index: np.ndarray
+        Only if `return_index`. Flat index of the bin of each observation, into
+        the flattened histogram, or -1 if the observation is not counted.
+        `np.bincount(index[index >= 0], minlength=hist.size).reshape(hist.shape)`
+        reproduces `hist`
     """
 
     # Check correct inputs
@@ -84,6 +95,7 @@ def accumulate_spatial(pos, arena_size, **kwargs):
     # Get kwargs values
     debug = kwargs.get("debug", False)
     limits = kwargs.get("limits", None)
+    return_index = kwargs.get("return_index", False)
     if not isinstance(limits, (tuple, list, np.ndarray, type(None))):
         raise ValueError("You must provide an array-like 'limits' value, e.g."\
           " (x_min, x_max, y_min, y_max). You provided type %s" % type(limits))
@@ -123,7 +135,10 @@ def accumulate_spatial(pos, arena_size, **kwargs):
         else:
             if not isinstance(bin_edges, np.ndarray):
                 raise ValueError("Keyword 'bin_edges' must be a numpy array for a 1D histogram")
-        bins = (bin_edges[1], bin_edges[0])
+        if is_2d:
+            bins = (bin_edges[1], bin_edges[0])
+        else:
+            bins = bin_edges
         debug_bin_type = "bin_edges"
 
     elif bool(bin_width):
@@ -163,6 +178,9 @@ def accumulate_spatial(pos, arena_size, **kwargs):
 
     ###########################################################################
     ###### Make the histogram
+    # The bin of each observation is found once, by spatial_bin_index, and the
+    # histogram counted with np.bincount. The bins and counts are the same as
+    # np.histogram and np.histogram2d
     if is_2d:
         x = pos[0]
         y = pos[1]
@@ -187,48 +205,12 @@ def accumulate_spatial(pos, arena_size, **kwargs):
         # As of 2019, it does actually behave correctly (NaN is invalid and so
         # is removed), but I would prefer to be explicit
 
-        in_range_x = x[in_range]
-        in_range_y = y[in_range]
-        if debug:
-            print(f"data points : {len(in_range_x)}")
-
-        '''
-        A brief word on the documentation for np.histogram2d()
-        https://docs.scipy.org/doc/numpy/reference/generated/numpy.histogram2d.html
-        
-        The documentation is subtlely misleading in the use of `x` and `y`. 
-        
-        The NumPy standard notation is (almost) invariably to call (y, x), and, e.g.,
-        in a 2D array, you would create an array with 5 rows and 2 columns like follows:
-            np.zeros((5, 2))
-        
-        We would normally describe this as an array with a height (corresponding to y)
-        of 5, and a width (corresponding to x) of 2.
-        
-        The documentation for histogram2d gives the signature as:
-            numpy.histogram2d(x, y, bins=10, range=None, normed=None, weights=None, density=None)
-        
-            Returns:
-                H : ndarray, shape(nx, ny)
-                    The bi-dimensional histogram of samples x and y. Values in x are 
-                    histogrammed along the first dimension and values in y are histogrammed 
-                    along the second dimension.
-                xedges : ndarray, shape(nx+1,)
-                    The bin edges along the first dimension.
-                yedges : ndarray, shape(ny+1,)
-                    The bin edges along the second dimension.
-        
-        Note the order in the Returns section: data given as `x` is histogrammed along the
-        _first_ dimension, which in NumPy parlance, would _usually_ be labelled `y`.
-        The use of `x`, `y` is self-consistent within this page, but misleading
-        in the context of other NumPy functions. 
-        
-        By invoking `y` as the first axis, and then returning edges as [xedges, yedges],
-        we are internally consistent with the mathematical notation that I have used throughout
-        opexebo (i.e. to call x, then y)
-        '''
-        hist, yedges, xedges = np.histogram2d(in_range_y, in_range_x, bins=bins, range=limits)
-        edges = [xedges, yedges]
+        # Note that, as in np.histogram2d, the output is (y, x), and bins given
+        # as a single integer apply to both axes
+        if isinstance(bins, (int, np.integer)):
+            bins = (bins, bins)
+        edges = [_bin_edges(x, bins[1], limits[1]), _bin_edges(y, bins[0], limits[0])]
+        shape = (edges[1].size - 1, edges[0].size - 1)
 
     else: # is not 2d
         x = pos
@@ -239,10 +221,121 @@ def accumulate_spatial(pos, arena_size, **kwargs):
                              " 1D map. You provided %d elements" % len(limits))
         in_range = np.logical_and(np.greater_equal(x, limits[0]),
                                   np.less(x, limits[1]))
-        in_range_x = x[in_range]
-        if debug:
-            print(f"data points : {len(in_range_x)}")
+        edges = _bin_edges(x, bins, limits)
+        shape = (edges.size - 1, )
 
-        hist, edges = np.histogram(in_range_x, bins=bins, range=limits)
+    index = spatial_bin_index(np.ma.getdata(pos), edges)
+    index[~np.ma.getdata(in_range)] = -1
+    if debug:
+        print(f"data points : {np.count_nonzero(np.ma.getdata(in_range))}")
+    hist = np.bincount(index[index >= 0], minlength=int(np.prod(shape))).reshape(shape)
+    if is_2d:
+        # np.histogram2d returns floating point counts
+        hist = hist.astype(float)
 
+    if return_index:
+        return hist, edges, index
     return hist, edges
+
+
+def spatial_bin_index(pos, bin_edges):
+    """
+    Find the flat index of the histogram bin containing each position.
+
+    The bins are the same as those of `np.histogram` and `np.histogram2d`:
+    each bin includes its lower edge, and the last bin also includes its upper
+    edge. Positions outside the edges, or NaN, are given the index -1.
+
+    Where the edges are evenly spaced, as those generated by
+    `accumulate_spatial` from `bin_width` or `bin_number`, the bin is found
+    arithmetically, and only checked against the neighbouring edges, rather
+    than by searching the edges. The index can be calculated once per
+    session, and reused to make maps of any subset of the positions (e.g.
+    spikes, or shuffled spikes) with `np.bincount`.
+
+    Parameters
+    ----------
+    pos: np.ndarray
+        1D array of positions, or 2D array of positions in row-major format,
+        i.e. `x` = pos[0], `y` = pos[1]
+    bin_edges: np.ndarray or list of np.ndarray
+        Edges of the bins, `x` or (`x`, `y`), as returned by
+        `opexebo.general.accumulate_spatial`. Each must be 1D, with at least
+        two strictly increasing values
+
+    Returns
+    -------
+    index: np.ndarray
+        Flat index of each position into the histogram, i.e. for 2D, the
+        (`y`, `x`) array of shape (`y`.size-1, `x`.size-1)
+
+    See Also
+    --------
+    opexebo.general.accumulate_spatial
+
+    Notes
+    -----
+    Copyright (C) 2021 by Simon Ball
+    """
+    pos = np.asarray(pos)
+    if pos.ndim == 1:
+        return _axis_bin_index(pos, np.asarray(bin_edges))
+    if pos.ndim != 2 or pos.shape[0] != len(bin_edges):
+        raise ValueError("pos must be a 1D array, or a 2D array with one row per"\
+                         f" set of bin_edges. You provided shape {pos.shape} and"\
+                         f" {len(bin_edges)} sets of bin_edges")
+    x_edges, y_edges = (np.asarray(edges) for edges in bin_edges)
+    x_idx = _axis_bin_index(pos[0], x_edges)
+    y_idx = _axis_bin_index(pos[1], y_edges)
+    index = y_idx * (x_edges.size - 1) + x_idx
+    index[(x_idx < 0) | (y_idx < 0)] = -1
+    return index
+
+
+###############################################################################
+####            Helper functions
+###############################################################################
+
+
+def _bin_edges(values, bins, limits):
+    '''Bin edges as used by np.histogram, given either a number of bins
+    between `limits`, or the edges themselves'''
+    if isinstance(bins, (int, np.integer)):
+        return np.histogram_bin_edges(np.ma.getdata(values), bins=bins, range=limits)
+    return _validate_edges(bins)
+
+
+def _validate_edges(edges):
+    '''Bin edges as an array, which must be 1D, with at least two strictly
+    increasing values'''
+    edges = np.asarray(edges)
+    if edges.ndim != 1 or edges.size < 2 or not np.all(edges[1:] > edges[:-1]):
+        raise ValueError("Bin edges must be a 1D array of at least 2 strictly"\
+                         f" increasing values. You provided {edges!r}")
+    return edges
+
+
+def _axis_bin_index(values, edges):
+    '''Index of the bin containing each value along a single axis, -1 outside
+    the edges. Evenly spaced edges are handled arithmetically, with a check
+    against the neighbouring edges in the same manner as np.histogram'''
+    edges = _validate_edges(edges)
+    num_bins = edges.size - 1
+    first, last = edges[0], edges[-1]
+    valid = (values >= first) & (values <= last)
+    width = (last - first) / num_bins if num_bins > 0 else 0
+    uniform = width > 0 and np.all(np.abs(edges - np.linspace(first, last, num_bins + 1))
+                                   <= 1e-6 * width)
+    if uniform:
+        values = np.where(valid, values, first)
+        index = ((values - first) / width).astype(np.int64)
+        np.clip(index, 0, num_bins - 1, out=index)
+        # Floating point error may put a value one bin out: correct against
+        # the edges themselves
+        index[values < edges[index]] -= 1
+        index[(values >= edges[index + 1]) & (index != num_bins - 1)] += 1
+    else:
+        index = np.searchsorted(edges, values, side="right") - 1
+        index[values == last] = num_bins - 1
+    index[~valid] = -1
+    return index
@@ -0,0 +1,125 @@
+"""Provide function for the statistics of labelled fields"""
+
+import numpy as np
+from scipy import ndimage
+
+
+#: Columns of the structured array of fields returned by field_stats
+FIELD_DTYPE = np.dtype([("field", np.int64),
+                        ("area", np.int64),
+                        ("peak_coords", np.int64, (2, )),
+                        ("centroid_coords", np.float64, (2, )),
+                        ("bbox", np.int64, (4, )),
+                        ("mean_rate", np.float64),
+                        ("peak_rate", np.float64)])
+
+
+def field_stats(rate_map, labels, **kwargs):
+    '''
+    Calculate the statistics of every field in a labelled field map.
+
+    All fields are evaluated together with `np.bincount` and labelled
+    `scipy.ndimage` reductions, rather than by building a mask or list of
+    co-ordinates per field.
+
+    Parameters
+    ----------
+    rate_map: np.ndarray or np.ma.MaskedArray
+        NxM rate map. Bins that are NaN or masked are excluded from the mean
+        and peak rate, but are included in the area, centroid and bounding box
+    labels: np.ndarray
+        NxM integer array of labelled fields (background = 0, field1 = 1,
+        field2 = 2, etc.), such as `fields_map` returned by
+        `opexebo.analysis.place_field`. Labels need not be consecutive
+
+    Other Parameters
+    ----------------
+    index: array-like
+        Labels of the fields to evaluate, each of which must be present in
+        `labels`. Default: every non-zero label, in increasing order
+
+    Returns
+    -------
+    fields: np.ndarray
+        Structured array with one row per field, with columns
+        field: int
+            Label of the field
+        area: int
+            Number of bins in firing field. [bins]
+        peak_coords: np.ndarray
+            Coordinates peak firing rate [y,x]. The first in row-major order,
+            if the peak is not unique
+        centroid_coords: np.ndarray
+            Coordinates of centroid (decimal) [y,x]
+        bbox: np.ndarray
+            Coordinates of bounding box including the firing field
+            (y_min, x_min, y_max, x_max), where the maxima are exclusive
+        mean_rate: float
+            mean firing rate [Hz]
+        peak_rate: float
+            peak firing rate [Hz]
+
+    See Also
+    --------
+    opexebo.analysis.place_field
+
+    Notes
+    -----
+    Copyright (C) 2021 by Simon Ball
+    '''
+    labels = np.asarray(np.ma.getdata(labels))
+    if isinstance(rate_map, np.ma.MaskedArray):
+        invalid = np.ma.getmaskarray(rate_map)
+        rate_map = rate_map.data
+    else:
+        rate_map = np.asarray(rate_map)
+        invalid = np.zeros(rate_map.shape, dtype=bool)
+    if labels.shape != rate_map.shape or labels.ndim != 2:
+        raise ValueError("rate_map and labels must be 2D arrays of the same shape."\
+                         f" You provided {rate_map.shape} and {labels.shape}")
+    if labels.size and labels.min() < 0:
+        raise ValueError("labels must be non-negative integers")
+    labels = labels.astype(np.int64)
+    index = kwargs.get("index", None)
+    if index is None:
+        index = np.unique(labels)
+        index = index[index > 0]
+    index = np.asarray(index, dtype=np.int64)
+
+    fields = np.zeros(index.size, dtype=FIELD_DTYPE)
+    fields["field"] = index
+    if index.size == 0:
+        return fields
+
+    flat = labels.ravel()
+    rate = rate_map.ravel().astype(float)
+    valid = ~(invalid.ravel() | np.isnan(rate))
+    rows, cols = (coords.ravel() for coords in np.indices(labels.shape))
+    minlength = flat.max() + 1
+
+    area = np.bincount(flat, minlength=minlength)[index]
+    fields["area"] = area
+    fields["centroid_coords"] = np.column_stack(
+        [np.bincount(flat, weights=coords, minlength=minlength)[index] / area
+         for coords in (rows, cols)])
+    fields["bbox"] = np.column_stack([ndimage.minimum(rows, flat, index),
+                                      ndimage.minimum(cols, flat, index),
+                                      ndimage.maximum(rows, flat, index) + 1,
+                                      ndimage.maximum(cols, flat, index) + 1])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fields["mean_rate"] = (np.bincount(flat, weights=np.where(valid, rate, 0), minlength=minlength)
+                               / np.bincount(flat, weights=valid, minlength=minlength))[index]
+    masked_rate = np.where(valid, rate, -np.inf)
+    peak_rate = np.full(minlength, -np.inf)
+    peak_rate[index] = ndimage.maximum(masked_rate, flat, index)
+    # First bin (row-major) of each field at its peak rate. Where the field
+    # has no valid bins, the first bin of the field
+    in_field = np.zeros(minlength, dtype=bool)
+    in_field[index] = True
+    at_peak = np.flatnonzero(in_field[flat] & (masked_rate == peak_rate[flat]))
+    field_labels, first = np.unique(flat[at_peak], return_index=True)
+    peak = at_peak[first][np.searchsorted(field_labels, index)]
+    fields["peak_coords"] = np.column_stack((rows[peak], cols[peak]))
+    fields["peak_rate"] = np.where(np.isfinite(peak_rate[index]), peak_rate[index], np.nan)
+    return fields
@@ -48,6 +48,7 @@ def fit_ellipse(X, Y):
     theta_rad : float
         Ellipse orientation (in radians)
 
+    All values are NaN if the problem is singular, see `fit_ellipse_batch`
 
     Notes
     --------
@@ -71,26 +72,90 @@ def fit_ellipse(X, Y):
     if not np.isfinite(Y).all():
         raise ValueError("X cannot contain values that are nan or inf."\
                          f" You provided {Y}")
-    # Normalise the data and move it to the origin
-    mx = np.mean(X)
-    my = np.mean(Y)
+    # A single set of points is a batch of one
+    return tuple(value[0] for value in fit_ellipse_batch(np.reshape(X, (1, -1)),
+                                                         np.reshape(Y, (1, -1))))
+
+
+def fit_ellipse_batch(X, Y, valid=None):
+    '''
+    Fit an ellipse to each of many sets of X, Y co-ordinates
+
+    Equivalent to calling `fit_ellipse` on each set of points in turn, but
+    all of the least-squares and eigenvalue problems are solved together with
+    stacked `numpy.linalg` calls. Sets of points may have different numbers
+    of points: the co-ordinates are padded to a common length, and the padding
+    is excluded with `valid`.
 
-    sx = 0.5 * (np.max(X) - np.min(X))
-    sy = 0.5 * (np.max(Y) - np.min(Y))
+    Parameters
+    ----------
+    X - np.ndarray
+        (N, K) x co-ordinates of N sets of up to K points
+    Y - np.ndarray
+        (N, K) y co-ordinates of points
+    valid - np.ndarray, optional
+        (N, K) boolean array, True for the points included in each set.
+        Default: all points that are finite in both X and Y
 
-    x = (X - mx) / sx
-    y = (Y - my) / sy
+    Returns
+    -------
+    x_centre : np.ndarray
+        (N, ) Centre of ellipse
+    y_centre : np.ndarray
+        (N, ) Centre of ellipse
+    Ru : np.ndarray
+        (N, ) Major radius
+    Rv : np.ndarray
+        (N, ) Minor radius
+    theta_rad : np.ndarray
+        (N, ) Ellipse orientation (in radians)
+
+    All values are NaN for sets of points for which `fit_ellipse` would
+    fail, such as those for which the problem is singular. As with
+    `fit_ellipse`, fits to fewer than six points are underdetermined, and
+    sensitive to round-off
+
+    See Also
+    --------
+    fit_ellipse
 
-    # Construct design matrix and scatter matrix
-    D = np.zeros((X.size, 6))
-    D[:, 0] = x*x
-    D[:, 1] = x*y
-    D[:, 2] = y*y
-    D[:, 3] = x
-    D[:, 4] = y
-    D[:, 5] = np.ones(X.size)
+    Notes
+    --------
+    Copyright (C) 2021 by Simon Ball
+    '''
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if X.shape != Y.shape or X.ndim != 2:
+        raise ValueError("X and Y must be (N, K) arrays of the same shape. You"\
+                         f" provided {X.shape} and {Y.shape}")
+    finite = np.isfinite(X) & np.isfinite(Y)
+    if valid is None:
+        valid = finite
+    else:
+        valid = np.asarray(valid, dtype=bool)
+        if valid.shape != X.shape:
+            raise ValueError("valid must have the same shape as X. You provided"\
+                             f" {valid.shape} and {X.shape}")
+        if not finite[valid].all():
+            raise ValueError("X and Y cannot contain values that are nan or inf"\
+                             " where valid is True")
+    X = np.where(valid, X, 0)
+    Y = np.where(valid, Y, 0)
+    count = valid.sum(axis=1)
 
-    S = D.T @ D
+    # Normalise the data and move it to the origin
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mx = X.sum(axis=1) / count
+        my = Y.sum(axis=1) / count
+        sx = 0.5 * (np.where(valid, X, -np.inf).max(axis=1) - np.where(valid, X, np.inf).min(axis=1))
+        sy = 0.5 * (np.where(valid, Y, -np.inf).max(axis=1) - np.where(valid, Y, np.inf).min(axis=1))
+        x = (X - mx[:, np.newaxis]) / sx[:, np.newaxis]
+        y = (Y - my[:, np.newaxis]) / sy[:, np.newaxis]
+
+    # Construct design matrix and scatter matrix. Padding contributes nothing
+    D = np.stack([x*x, x*y, y*y, x, y, np.ones(X.shape)], axis=2)
+    D[~valid] = 0
+    S = np.swapaxes(D, 1, 2) @ D
 
     # Construct contraint matrix
     C = np.zeros((6, 6))
@@ -99,22 +164,30 @@ def fit_ellipse(X, Y):
     C[0, 2] = -2
     # Solve eigensystem
     # Break into blocks
-    tmpA = S[:3, :3]
-    tmpB = S[:3, 3:]
-    tmpC = S[3:, 3:]
+    tmpA = S[:, :3, :3]
+    tmpB = S[:, :3, 3:]
+    tmpC = S[:, 3:, 3:]
     tmpD = C[:3, :3]
-    tmpE = np.linalg.inv(tmpC) @ tmpB.T
+
+    # Sets for which fit_ellipse would fail are replaced by a solvable problem
+    # and set to NaN afterwards
+    good = np.isfinite(S).all(axis=(1, 2)) & (count > 0)
+    good[good] = np.linalg.det(tmpC[good]) != 0
+    tmpA = np.where(good[:, np.newaxis, np.newaxis], tmpA, np.eye(3))
+    tmpB = np.where(good[:, np.newaxis, np.newaxis], tmpB, 0)
+    tmpC = np.where(good[:, np.newaxis, np.newaxis], tmpC, np.eye(3))
+    tmpE = np.linalg.inv(tmpC) @ np.swapaxes(tmpB, 1, 2)
 
     eval_x, evec_x = np.linalg.eig(np.linalg.inv(tmpD) @ (tmpA - (tmpB@tmpE)))
 
     # Find the positive eigenvalue (as det(tmpD) < 0)
-    idx = np.argmax(np.logical_and(np.real(eval_x) < 1e-8, np.isfinite(eval_x)))
-    vec_x = np.real(evec_x[:, idx]) # vector associated with idx
-    vec_y = -tmpE @ vec_x
-    A = np.concatenate((vec_x, vec_y))
+    idx = np.argmax(np.logical_and(np.real(eval_x) < 1e-8, np.isfinite(eval_x)), axis=1)
+    vec_x = np.real(np.take_along_axis(evec_x, idx[:, np.newaxis, np.newaxis], axis=2)[..., 0])
+    vec_y = -(tmpE @ vec_x[:, :, np.newaxis])[:, :, 0]
+    A = np.concatenate((vec_x, vec_y), axis=1).T
 
     # Un-normalise
-    par = np.zeros(6)
+    par = np.zeros((6, X.shape[0]))
     par[0] = A[0] * sy * sy
     par[1] = A[1] * sx * sy
     par[2] = A[2] * sx * sx
@@ -122,30 +195,32 @@ def fit_ellipse(X, Y):
     par[4] = (-A[1]*sx*sy*mx) - (2*A[2]*sx*sx*my) + (A[4]*sx*sx*sy)
     par[5] = (A[0]*sy*sy*mx*mx) + (A[1]*sx*sy*mx*my) + (A[2]*sx*sx*my*my) \
                 - (A[3]*sx*sy*sy*mx) - (A[4]*sx*sx*sy*my) + (A[5]*sx*sx*sy*sy)
-
-    # Geometric radii and centres 
-    theta_rad = 0.5*np.arctan2(par[1], par[0]-par[2])
-    cos_t = np.cos(theta_rad)
-    sin_t = np.sin(theta_rad)
-    sin2 = sin_t * sin_t
-    cos2 = cos_t * cos_t
-    Ao = par[5]
-    Au = (par[3] * cos_t) + (par[4] * sin_t)
-    Av = (-par[3] * sin_t) + (par[4] * cos_t)
-    Auu = (par[0] * cos2) + (par[2] * sin2) + (par[1] * cos_t * sin_t)
-    Avv = (par[0] * sin2) + (par[2] * cos2) - (par[1] * cos_t * sin_t)
-
-    tu_centre = -Au / (2*Auu)
-    tv_centre = -Av / (2*Avv)
-    w_centre = Ao - (Auu*tu_centre*tu_centre) - (Avv*tv_centre*tv_centre)
-
-    x_centre = (tu_centre * cos_t) - (tv_centre * sin_t)
-    y_centre = (tu_centre * sin_t) + (tv_centre * cos_t)
-
-    Ru = -w_centre / Auu
-    Rv = -w_centre / Avv
-
-    Ru = np.sqrt(np.abs(Ru)) * np.sign(Ru)
-    Rv = np.sqrt(np.abs(Rv)) * np.sign(Rv)
+    par[:, ~good] = np.nan
+
+    # Geometric radii and centres
+    with np.errstate(divide="ignore", invalid="ignore"):
+        theta_rad = 0.5*np.arctan2(par[1], par[0]-par[2])
+        cos_t = np.cos(theta_rad)
+        sin_t = np.sin(theta_rad)
+        sin2 = sin_t * sin_t
+        cos2 = cos_t * cos_t
+        Ao = par[5]
+        Au = (par[3] * cos_t) + (par[4] * sin_t)
+        Av = (-par[3] * sin_t) + (par[4] * cos_t)
+        Auu = (par[0] * cos2) + (par[2] * sin2) + (par[1] * cos_t * sin_t)
+        Avv = (par[0] * sin2) + (par[2] * cos2) - (par[1] * cos_t * sin_t)
+
+        tu_centre = -Au / (2*Auu)
+        tv_centre = -Av / (2*Avv)
+        w_centre = Ao - (Auu*tu_centre*tu_centre) - (Avv*tv_centre*tv_centre)
+
+        x_centre = (tu_centre * cos_t) - (tv_centre * sin_t)
+        y_centre = (tu_centre * sin_t) + (tv_centre * cos_t)
+
+        Ru = -w_centre / Auu
+        Rv = -w_centre / Avv
+
+        Ru = np.sqrt(np.abs(Ru)) * np.sign(Ru)
+        Rv = np.sqrt(np.abs(Rv)) * np.sign(Rv)
 
     return x_centre, y_centre, Ru, Rv, theta_rad
@@ -3,21 +3,26 @@ Python version of Matlab's normxcorr2_general
 
 This is a Python adaption of code found at
 https://se.mathworks.com/matlabcentral/fileexchange/29005-generalized-normalized-cross-correlation
-Since we use it for autocorrelograms exclusively some input arguments of the
-original function have been dropped.
+Some input arguments of the original function have been dropped, and the
+template must have the same shape as the array.
 """
 
 from __future__ import division
 
+import collections
+import functools
+
 import numpy as np
-import numpy.matlib  # Not included in the default numpy namespace
+import scipy.fft
 from scipy.signal import convolve2d
 
+import opexebo.defaults as default
+
 REQUIRED_OVERLAP_PIXELS = 0
 
 
-def normxcorr2_general(array):
-    """Calculate spatial autocorrelation.
+def normxcorr2_general(array, template=None, **kwargs):
+    """Calculate spatial autocorrelation, or cross-correlation.
 
     Python implementation of the Matlab `generalized-normalized cross correlation`
     function, adapted by Vadim Frolov. Some generality was abandoned in the adaption
@@ -25,30 +30,143 @@ def normxcorr2_general(array):
     
     For the original function, see https://se.mathworks.com/matlabcentral/fileexchange/29005-generalized-normalized-cross-correlation
 
+    A stack of arrays may be provided, in which case each is autocorrelated
+    independently. The cross-correlation terms of the whole stack are then
+    calculated with a single batched real FFT, and the overlap counts, which
+    depend only on the array shape, are shared between all arrays.
+
     Parameters
     ----------
-    array: NxM matrix
+    array: NxM matrix, or KxNxM stack of matrices
         firing array. array is not necessary a numpy array. Must not contain NaNs!
+    template: NxM matrix, or KxNxM stack of matrices, optional
+        If provided, calculate the cross-correlation of `array` with
+        `template`, rather than the autocorrelation of `array`. Must have
+        the same shape as `array`, and must not contain NaNs. Default None
+    workers: int, optional
+        Number of threads used by `scipy.fft`. Negative values count back
+        from the number of CPUs, i.e. -1 uses all CPUs. Default 1
 
     Returns
     -------
     np.ndarray
-        Resulting correlation matrix
+        Resulting correlation matrix, or KxN'xM' stack of correlation matrices
+
+    See Also
+    --------
+    normxcorr2_pairwise
     """
 
+    array = _check_array(array, "array")
+    if template is not None:
+        template = _check_array(template, "template")
+        if template.shape != array.shape:
+            raise ValueError("template must have the same shape as array. You"\
+                             f" provided {template.shape} and {array.shape}")
+
+    workers = kwargs.get("workers", default.fft_workers)
+
+    A = _shift_data(array)
+    T = A if template is None else _shift_data(template)
+
+    setup = _fft_setup(A.shape[-2:])
+    number_of_overlap_pixels = setup.number_of_overlap_pixels
+
+    local_sum_A, denom_A = _local_terms(A, number_of_overlap_pixels)
+
+    # Flip T in both dimensions so that its correlation can be more easily
+    # handled. The local sums span the whole array, so the local sums of the
+    # flipped T are the flipped local sums of T
+    if template is None:
+        local_sum_T, denom_T = local_sum_A, denom_A
+    else:
+        local_sum_T, denom_T = _local_terms(T, number_of_overlap_pixels)
+    local_sum_T = local_sum_T[..., ::-1, ::-1]
+    denom_T = denom_T[..., ::-1, ::-1]
+
+    # For a stack, the FFT is always the faster method
+    if A.ndim == 2 and not setup.use_fft:
+        xcorr_TA = convolve2d(np.rot90(T, 2), A)
+    elif template is None:
+        xcorr_TA = _freqautocorr(A, setup, workers)
+    else:
+        xcorr_TA = _freqxcorr(T, A, setup, workers)
+    del A, T
+
+    return _normalise(xcorr_TA, local_sum_A, local_sum_T, denom_A, denom_T,
+                      number_of_overlap_pixels)
+
+
+def normxcorr2_pairwise(arrays, **kwargs):
+    """Calculate the cross-correlation of every pair of arrays in a stack.
+
+    Equivalent to calling `normxcorr2_general(arrays[i], arrays[j])` for
+    every pair `i < j`, but the padded spectrum and local sums of each array
+    are calculated only once, so each cross-correlation costs only a spectrum
+    product and one inverse FFT.
+
+    The cross-correlations are generated one at a time, so that the memory
+    required does not grow with the number of pairs.
+
+    Parameters
+    ----------
+    arrays: KxNxM stack of matrices
+        Must not contain NaNs!
+    workers: int, optional
+        Number of threads used by `scipy.fft`. Default 1
+
+    Yields
+    ------
+    i: int
+        Index of the array
+    j: int
+        Index of the template, `j > i`
+    C: np.ndarray
+        Cross-correlation matrix of `arrays[i]` with `arrays[j]`
+
+    See Also
+    --------
+    normxcorr2_general
+    """
+    arrays = _check_array(arrays, "arrays")
+    if arrays.ndim != 3:
+        raise ValueError("arrays must be a 3D stack of 2D arrays. You provided"\
+                         f" a {arrays.ndim}D array")
+    workers = kwargs.get("workers", default.fft_workers)
+    A = _shift_data(arrays)
+    setup = _fft_setup(A.shape[-2:])
+    number_of_overlap_pixels = setup.number_of_overlap_pixels
+    local_sums, denoms = _local_terms(A, number_of_overlap_pixels)
+    spectra = scipy.fft.rfft2(A, s=setup.fft_shape, workers=workers)
+    del A
+
+    for i in range(arrays.shape[0] - 1):
+        for j in range(i + 1, arrays.shape[0]):
+            xcorr_TA = scipy.fft.irfft2(spectra[i] * np.conj(spectra[j]),
+                                        s=setup.fft_shape, workers=workers)
+            xcorr_TA = _circular_to_full(xcorr_TA, setup)
+            C = _normalise(xcorr_TA, local_sums[i], local_sums[j, ::-1, ::-1],
+                           denoms[i], denoms[j, ::-1, ::-1], number_of_overlap_pixels)
+            yield i, j, C
+
+
+def _check_array(array, name):
+    """Convert to a numpy array and check that there are no NaN values"""
     if not isinstance(array, np.ndarray):
         array = np.array(array)
+    if array.ndim not in (2, 3):
+        raise ValueError(f"Input {name} must be 2D, or a 3D stack of 2D arrays."\
+                         f" You provided a {array.ndim}D array")
     if not np.sum(np.isfinite(array)) == array.size:
-        raise ValueError("Input array contains NaN values.")
-
-    
-    A = _shift_data(array)
-    T = _shift_data(array)
+        raise ValueError(f"Input {name} contains NaN values.")
+    return array
 
-    number_of_overlap_pixels = _local_sum(np.ones(A.shape), T.shape[0], T.shape[1])
 
-    local_sum_A = _local_sum(A, T.shape[0], T.shape[1])
-    local_sum_A2 = _local_sum(A*A, T.shape[0], T.shape[1])
+def _local_terms(A, number_of_overlap_pixels):
+    """Local sums of A, and the (non-negative) local sums of squared deviations"""
+    m, n = A.shape[-2:]
+    local_sum_A = _local_sum(A, m, n)
+    local_sum_A2 = _local_sum(A*A, m, n)
 
     # Note: diff_local_sums should be nonnegative, but it may have negative
     # values due to round off errors. Below, we use max to ensure the radicand
@@ -57,27 +175,13 @@ def normxcorr2_general(array):
     del local_sum_A2
 
     denom_A = np.maximum(diff_local_sums_A, 0)
-    del diff_local_sums_A
+    return local_sum_A, denom_A
 
-    # Flip T in both dimensions so that its correlation can be more easily
-    # handled.
-    rotatedT = np.rot90(T, 2)
-    local_sum_T = _local_sum(rotatedT, A.shape[0], A.shape[1])
-    local_sum_T2 = _local_sum(rotatedT*rotatedT, A.shape[0], A.shape[1])
-    del rotatedT
-
-    diff_local_sums_T = (local_sum_T2 - np.power(local_sum_T, 2) / number_of_overlap_pixels)
-    del local_sum_T2
-    denom_T = np.maximum(diff_local_sums_T, 0)
-    del diff_local_sums_T
 
+def _normalise(xcorr_TA, local_sum_A, local_sum_T, denom_A, denom_T, number_of_overlap_pixels):
+    """Normalised correlation from the cross-correlation and local sums"""
     denom = np.sqrt(denom_T * denom_A)
-    del denom_T, denom_A
-
-    xcorr_TA = _xcorr2_fast(T, A)
-    del A, T
     numerator = xcorr_TA - local_sum_A * local_sum_T / number_of_overlap_pixels
-    del xcorr_TA, local_sum_A, local_sum_T
 
     # denom is the sqrt of the product of positive numbers so it must be
     # positive or zero.  Therefore, the only danger in dividing the numerator
@@ -85,9 +189,8 @@ def normxcorr2_general(array):
     # input parsing; so denom is only zero where denom_A is zero, and in these
     # locations, C is also zero.
     C = np.zeros(numerator.shape)
-    tol = 1000 * np.spacing(np.max(np.abs(denom)))
-    i_nonzero = (denom > tol)
-    C[i_nonzero] = numerator[i_nonzero] / denom[i_nonzero]
+    tol = 1000 * np.spacing(np.max(np.abs(denom), axis=(-2, -1), keepdims=True))
+    np.divide(numerator, denom, out=C, where=(denom > tol))
     del numerator, denom
 
     # Remove the border values since they result from calculations using very
@@ -96,46 +199,83 @@ def normxcorr2_general(array):
     if REQUIRED_OVERLAP_PIXELS > np.max(number_of_overlap_pixels):
         raise ValueError("ERROR: REQUIRED_OVERLAP_PIXELS")
 
-    C[number_of_overlap_pixels < REQUIRED_OVERLAP_PIXELS] = 0
+    C[..., number_of_overlap_pixels < REQUIRED_OVERLAP_PIXELS] = 0
     return C
 
 
-def _xcorr2_fast(T, A):
-    T_size = T.shape
-    A_size = A.shape
-    outsize = np.array(A.shape) + np.array(T.shape) - 1
+_FFTSetup = collections.namedtuple("_FFTSetup",
+                                   ["shape", "outsize", "fft_shape",
+                                    "number_of_overlap_pixels", "use_fft"])
 
-    # Figure out when to use spatial domain vs. freq domain
-    conv_time = _time_conv2(T_size, A_size)  # 1 conv2
-    fft_time = 3*_time_fft2(outsize)  # 2 fft2 + 1 ifft2
 
-    if conv_time < fft_time:
-        cross_corr = convolve2d(np.rot90(T, 2), A)
-    else:
-        cross_corr = _freqxcorr(T, A, outsize)
+@functools.lru_cache(maxsize=default.fft_setup_cache_size)
+def _fft_setup(shape):
+    """Set up for the correlation of arrays of a given shape
 
-    return cross_corr
+    Everything here depends only on the shape of the arrays, and not on their
+    values, so it is cached (least-recently-used) and shared between calls.
 
-
-def _freqxcorr(a, b, outsize):
+    Returns
+    -------
+    _FFTSetup
+        shape: (m, n) shape of the arrays
+        outsize: (2m-1, 2n-1) shape of the full correlation
+        fft_shape: padded shape for the FFT, the smallest size not less than
+            `outsize` that is a product of 2s, 3s and 5s
+        number_of_overlap_pixels: (2m-1, 2n-1) read-only array, the number of
+            overlapping pixels at each lag
+        use_fft: whether the FFT is expected to be faster than direct
+            convolution for a single 2D array
+    """
+    m, n = shape
+    outsize = (2*m - 1, 2*n - 1)
     # Find the next largest size that is a multiple of a combination of 2, 3,
     # and/or 5.  This makes the FFT calculation much faster.
-    optimalSize = np.zeros((2, 1))
-    optimalSize[0] = _find_closest_valid_dimension(outsize[0])
-    optimalSize[1] = _find_closest_valid_dimension(outsize[1])
-    optimalSize = optimalSize.squeeze()
-    optimalSize = optimalSize.astype(np.integer)
-
-    # Calculate correlation in frequency domain
-    rot_version = np.rot90(a, 2)
-    Fa = np.fft.fft2(rot_version, s=(optimalSize[0], optimalSize[1]))
-    Fb = np.fft.fft2(b, s=(optimalSize[0], optimalSize[1]))
-    xcorr_ab = np.real(np.fft.ifft2(Fa * Fb))
-
-    xcorr_ab = xcorr_ab[0:outsize[0], 0:outsize[1]]
+    fft_shape = tuple(scipy.fft.next_fast_len(size, real=True) for size in outsize)
+    number_of_overlap_pixels = _local_sum(np.ones((m, n)), m, n)
+    number_of_overlap_pixels.setflags(write=False)
+
+    # Figure out when to use spatial domain vs. freq domain
+    conv_time = _time_conv2(shape, shape)  # 1 conv2
+    fft_time = 3*_time_fft2(outsize)  # 2 fft2 + 1 ifft2
+    return _FFTSetup(tuple(shape), outsize, fft_shape, number_of_overlap_pixels,
+                     fft_time <= conv_time)
+
+
+def _freqxcorr(a, b, setup, workers=None):
+    # Calculate correlation in frequency domain. Inputs are real, so use the
+    # real FFT over the last two axes, which handles stacks of arrays in a
+    # single batched transform
+    rot_version = a[..., ::-1, ::-1]
+    Fa = scipy.fft.rfft2(rot_version, s=setup.fft_shape, workers=workers)
+    Fb = scipy.fft.rfft2(b, s=setup.fft_shape, workers=workers)
+    xcorr_ab = scipy.fft.irfft2(Fa * Fb, s=setup.fft_shape, workers=workers)
+
+    xcorr_ab = xcorr_ab[..., 0:setup.outsize[0], 0:setup.outsize[1]]
     return xcorr_ab
 
 
+def _freqautocorr(a, setup, workers=None):
+    """Full autocorrelation of each array in a stack, over the last two axes
+
+    Equivalent to `_freqxcorr(a, a, setup)`, but requires only one forward
+    transform: the spectrum of the flipped array is the complex conjugate of
+    the spectrum of the array, up to a circular shift
+    """
+    Fa = scipy.fft.rfft2(a, s=setup.fft_shape, workers=workers)
+    Fa *= np.conj(Fa)
+    return _circular_to_full(scipy.fft.irfft2(Fa, s=setup.fft_shape, workers=workers), setup)
+
+
+def _circular_to_full(xcorr, setup):
+    """Convert a circular correlation (computed with sufficient padding) into
+    the full correlation. Negative lags wrap around to the end of the circular
+    result"""
+    lags = (setup.shape[0] - 1, setup.shape[1] - 1)
+    xcorr = np.roll(xcorr, lags, axis=(-2, -1))
+    return xcorr[..., 0:setup.outsize[0], 0:setup.outsize[1]]
+
+
 def _time_conv2(obssize, refsize):
     # K was empirically calculated by the commented-out code above.
     K = 2.7e-8
@@ -179,16 +319,18 @@ def _local_sum(A, m, n):
     
     As it is currently called (2021-04-12), the `else` case appears to never
     be invoked
+
+    Sums are taken over the last two axes of A, so a stack of arrays is
+    handled in one pass
     """
-    if m == A.shape[0] and n == A.shape[1]:
-        s = np.cumsum(A, axis=0)
-        secondPart = np.matlib.repmat(s[-1, :], m-1, 1) - s[0:-1, :]
-        c = np.concatenate((s, secondPart), axis=0)
-        s = np.cumsum(c, axis=1)
+    if m == A.shape[-2] and n == A.shape[-1]:
+        s = np.cumsum(A, axis=-2)
+        secondPart = s[..., -1:, :] - s[..., 0:-1, :]
+        c = np.concatenate((s, secondPart), axis=-2)
+        s = np.cumsum(c, axis=-1)
         del c
-        lastColumn = s[:, -1].reshape((s.shape[0], 1))
-        secondPart = np.matlib.repmat(lastColumn, 1, n-1) - s[:, 0:-1]
-        local_sum_A = np.concatenate((s, secondPart), axis=1)
+        secondPart = s[..., -1:] - s[..., 0:-1]
+        local_sum_A = np.concatenate((s, secondPart), axis=-1)
     else:
         # breal the padding into parts to save on memory
         B = np.zeros((A.shape[0] + 2*m, A.shape[1]))
@@ -210,34 +352,10 @@ def _shift_data(A):
     """
     Convert array to type Float, and shift the data range to be greater than zero
     """
-    B = A.astype(np.float)
+    B = A.astype(float)
 
     if not np.issubdtype(A.dtype, np.unsignedinteger):
-        min_B = np.min(B)
-        if min_B < 0:
-            B -= min_B
+        # Shift each array in a stack independently
+        min_B = np.min(B, axis=(-2, -1), keepdims=True)
+        B -= np.minimum(min_B, 0)
     return B
-
-
-def _find_closest_valid_dimension(n):
-
-    # Find the closest valid dimension above the desired dimension.  This
-    # will be a combination of 2s, 3s, and 5s.
-
-    # Incrementally add 1 to the size until
-    # we reach a size that can be properly factored.
-    new_number = n
-    result = 0
-    new_number -= 1
-    while not result == 1:
-        new_number += 1
-        result = _factorize_number(new_number)
-
-    return new_number
-
-
-def _factorize_number(n):
-    for ifac in np.array([2, 3, 5]):
-        while np.fmod(n, ifac) == 0:
-            n = n / ifac
-    return n
@@ -0,0 +1,159 @@
+"""
+Provide function for masked normalised cross-correlation
+"""
+
+import numpy as np
+import scipy.fft
+
+import opexebo.defaults as default
+from opexebo.general.normxcorr2_general import _fft_setup, _circular_to_full
+
+
+def normxcorr2_masked(array, template=None, **kwargs):
+    """Calculate the masked normalised autocorrelation, or cross-correlation.
+
+    Invalid bins (NaN, or masked in a MaskedArray) are excluded entirely: at
+    each lag, the correlation is the Pearson correlation coefficient between
+    only those pairs of bins that are valid in both the array and the shifted
+    template. This differs from `normxcorr2_general`, which requires invalid
+    bins to be filled with a value (typically zero) beforehand, and includes
+    them in the local sums.
+
+    The overlap counts, local sums and local sums of squares are all
+    calculated from the validity masks with FFTs, following Padfield (2012).
+    All terms share the same padded FFT size, and each array requires only
+    three forward transforms.
+
+    Parameters
+    ----------
+    array: np.ndarray or np.ma.MaskedArray
+        NxM matrix, or KxNxM stack of matrices
+    template: np.ndarray or np.ma.MaskedArray, optional
+        If provided, calculate the cross-correlation of `array` with
+        `template`, rather than the autocorrelation of `array`. Must have the
+        same shape as `array`. Default None
+
+    Other Parameters
+    ----------------
+    mask: np.ndarray, optional
+        Boolean array, True at invalid bins of `array`. Combined with NaN
+        values and the mask of a MaskedArray
+    template_mask: np.ndarray, optional
+        As `mask`, for `template`
+    min_overlap: int, optional
+        Lags at which fewer than this number of valid bins overlap are set to
+        zero. Default 0
+    workers: int, optional
+        Number of threads used by `scipy.fft`. Default 1
+
+    Returns
+    -------
+    np.ndarray
+        Resulting correlation matrix, (2N-1)x(2M-1), or a stack of correlation
+        matrices. Values lie in [-1, 1], and are zero where the correlation
+        cannot be calculated
+
+    See Also
+    --------
+    normxcorr2_general
+
+    Notes
+    -----
+    D. Padfield, "Masked Object Registration in the Fourier Domain", IEEE
+    Transactions on Image Processing, 21(5), 2706-2718 (2012)
+
+    Copyright (C) 2021 by Simon Ball
+    """
+    min_overlap = kwargs.get("min_overlap", 0)
+    workers = kwargs.get("workers", default.fft_workers)
+
+    A, valid_A = _prepare(array, kwargs.get("mask", None), "array")
+    if template is None:
+        T, valid_T = A, valid_A
+    else:
+        T, valid_T = _prepare(template, kwargs.get("template_mask", None), "template")
+        if T.shape != A.shape:
+            raise ValueError("template must have the same shape as array. You"\
+                             f" provided {T.shape} and {A.shape}")
+
+    setup = _fft_setup(A.shape[-2:])
+
+    def spectrum(values):
+        return scipy.fft.rfft2(values, s=setup.fft_shape, workers=workers)
+
+    F_valid_A = spectrum(valid_A)
+    F_A = spectrum(A)
+    F_A2 = spectrum(A * A)
+    if template is None:
+        F_valid_T, F_T, F_T2 = F_valid_A, F_A, F_A2
+    else:
+        F_valid_T, F_T, F_T2 = spectrum(valid_T), spectrum(T), spectrum(T * T)
+
+    # Each term is the correlation of a template term with an array term.
+    # For autocorrelation, the template terms are the array terms flipped
+    # through the origin, so only four inverse transforms are needed
+    F_valid_T = np.conj(F_valid_T)
+    products = [F_valid_T * F_valid_A, F_valid_T * F_A, F_valid_T * F_A2, np.conj(F_T) * F_A]
+    if template is not None:
+        products += [np.conj(F_T) * F_valid_A, np.conj(F_T2) * F_valid_A]
+    terms = scipy.fft.irfft2(np.stack(products), s=setup.fft_shape, workers=workers)
+    terms = _circular_to_full(terms, setup)
+    if template is None:
+        number_of_overlap_pixels, sum_A, sum_A2, sum_TA = terms
+        sum_T = sum_A[..., ::-1, ::-1]
+        sum_T2 = sum_A2[..., ::-1, ::-1]
+    else:
+        number_of_overlap_pixels, sum_A, sum_A2, sum_TA, sum_T, sum_T2 = terms
+    del terms, products
+
+    # Overlap counts are integers, up to round-off in the FFT
+    number_of_overlap_pixels = np.round(number_of_overlap_pixels)
+    valid = number_of_overlap_pixels > max(min_overlap, 0)
+    n = np.where(valid, number_of_overlap_pixels, 1)
+
+    numerator = sum_TA - sum_A * sum_T / n
+    var_A = np.maximum(sum_A2 - sum_A * sum_A / n, 0)
+    var_T = np.maximum(sum_T2 - sum_T * sum_T / n, 0)
+    denom = np.sqrt(var_A * var_T)
+
+    # Round-off in the FFT is relative to the largest terms, rather than to
+    # the local terms, so the tolerance is correspondingly larger than in
+    # normxcorr2_general
+    tol = 1e3 * np.finfo(float).eps * np.max(denom, axis=(-2, -1), keepdims=True)
+    C = np.zeros(numerator.shape)
+    np.divide(numerator, denom, out=C, where=valid & (denom > tol))
+    return np.clip(C, -1, 1)
+
+
+#########################################################
+################        Helper Functions
+#########################################################
+
+
+def _prepare(array, mask, name):
+    """Convert to a float array, with invalid values set to zero, and the
+    validity mask as float. Each array in a stack is shifted by the mean of
+    its valid values to limit round-off in the FFT"""
+    if isinstance(array, np.ma.MaskedArray):
+        invalid = np.ma.getmaskarray(array)
+        array = array.data
+    else:
+        array = np.asarray(array)
+        invalid = np.zeros(array.shape, dtype=bool)
+    if array.ndim not in (2, 3):
+        raise ValueError(f"Input {name} must be 2D, or a 3D stack of 2D arrays."\
+                         f" You provided a {array.ndim}D array")
+    array = array.astype(float)
+    invalid = invalid | ~np.isfinite(array)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != array.shape:
+            raise ValueError(f"The mask of {name} must have the same shape as {name}."\
+                             f" You provided {mask.shape} and {array.shape}")
+        invalid = invalid | mask
+    valid = (~invalid).astype(float)
+    array[invalid] = 0
+    count = np.maximum(valid.sum(axis=(-2, -1), keepdims=True), 1)
+    array -= array.sum(axis=(-2, -1), keepdims=True) / count
+    array *= valid
+    return array, valid
@@ -1,6 +1,7 @@
 import numpy as np
 import opexebo.defaults as default
-from skimage import measure, morphology
+from skimage import morphology, segmentation
+from scipy import ndimage
 from scipy.ndimage import distance_transform_cdt
 
 
@@ -13,39 +14,57 @@ from scipy.ndimage import distance_transform_cdt
 
 
 def peak_search(image, **kwargs):
-    """Given a 1D or 2D array, return a list of co-ordinates of the local 
-    maxima or minima
+    """Given a 2D array, or a 3D stack of 2D arrays, return a list of
+    co-ordinates of the local maxima or minima
     
     Multiple searching techniques are provided:
         
         * `default`: uses `skimage.morphology.get_maxima`
         * `sep`: uses the Python wrapper to the Source Extractor astronomy tool
           to identify peaks
+        * `ndimage`: a reimplementation of the thresholding and deblending of
+          `sep` with `scipy.ndimage`, without the dependency on `sep`
     
     Parameters
     ----------
     image: np.ndarray
-        1D or 2D array of data
-    search_method : str, optional, {"default", "sep"}
+        2D array of data, or (N, H, W) stack of N 2D arrays. Each array in a
+        stack is searched independently
+    search_method : str, optional, {"default", "sep", "ndimage"}
     mask : np.ndarray, optional
-        Array of masked locations in the image with the same dimensions.
+        Array of masked locations in the image with the same dimensions, or,
+        for a stack, with the dimensions of a single array in the stack.
         Locations where the mask value is True are ignored for the purpose of
         searching.
     maxima: bool, optional
         [`default` search method only] Define whether to search for maxima or
         minima in the provided array
     null_background: bool
-        [`sep` search method only] Set the image background to zero for
+        [`sep` and `ndimage` search methods only] Set the image background to zero for
         calculation purposes rather than attempt to calculate a background
         gradient. This should generally be True, as our images are not directly
         comparable to standard telescope output
     threshold : float, optional
-        [`sep` search method only] Threshold for identifiying maxima area
+        [`sep` and `ndimage` search methods only] Threshold for identifiying
+        maxima area, relative to the background noise
+    deblend_nthresh : int, optional
+        [`ndimage` search method only] Number of thresholds used for
+        deblending. Default 32
+    deblend_cont : float, optional
+        [`ndimage` search method only] Minimum fraction of the flux of an
+        object that a branch must contain to be deblended as a separate
+        object. Default 0.005
+    min_area : int, optional
+        [`ndimage` search method only] Objects with fewer pixels are
+        discarded. Default 5
     
     Returns
     -------
-    peak_coords: tuple
-        Co-ordinates of peaks, in the form ((x0, x1, x2...), (y0, y1, y2...))
+    peak_coords: np.ndarray
+        Co-ordinates of peaks, in the form [[y0, x0], [y1, x1], ...]
+        For a stack, a single table of the peaks of all arrays, in the form
+        [[n0, y0, x0], [n1, y1, x1], ...], where n is the index of the array
+        in the stack, and identical to stacking the results for each array
     
     
     Notes
@@ -56,6 +75,9 @@ def peak_search(image, **kwargs):
     search_method = kwargs.get("search_method", default.search_method)
     get_maxima = kwargs.get("maxima", True)
     
+    if np.ndim(image) not in (2, 3):
+        raise ValueError("image must be a 2D array, or an (N, H, W) stack of 2D"\
+                         f" arrays. You provided a {np.ndim(image)}D array")
     if search_method not in default.all_methods:
         raise ValueError("Keyword 'search_method' must be left blank or given a"\
                     " value from the following list: %s. You provided '%s'."\
@@ -66,8 +88,12 @@ def peak_search(image, **kwargs):
         
     if search_method == default.search_method:
         peak_coords = _peak_search_skimage(image, **kwargs)
+    elif np.ndim(image) == 3:
+        peak_coords = _peak_search_per_image(image, **kwargs)
     elif search_method == "sep":
         peak_coords = _peak_search_sep_wrapper(image, **kwargs)
+    elif search_method == "ndimage":
+        peak_coords = _peak_search_ndimage(image, **kwargs)
     else:
         raise NotImplementedError("The search method you have requested (%s) is"\
                                   " not yet implemented" % search_method)
@@ -94,41 +120,65 @@ def _peak_search_skimage(image, **kwargs):
     
     Since the mask is a ahrd-edged area, if there is even a slight rise just
     outside it, spurious peaks can be detected. Therefore, we automatically reject
-    any peaks for a short distance outside the actual mask
+    any peaks for a short distance outside the actual mask. Rejected peaks are
+    returned as [0, 0]
     
+    A stack of images is searched in one pass: every structuring element is
+    confined to a single image, and the centroids are found by labelled
+    reductions over the whole stack. The result for each image is identical
+    to searching that image alone
     '''
     connectivity = 2
     get_maxima = kwargs.get("maxima", True)
     mask = kwargs.get("mask", np.zeros(image.shape, dtype=bool))
-    image_copy = image.copy()
+    is_stack = image.ndim == 3
+    if not is_stack:
+        image = image[np.newaxis]
+    mask = np.broadcast_to(mask, image.shape)
+
+    # Neighbourhood of connectivity 2 within each image, and none across the stack
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = True
+
     if get_maxima:
-        image_copy[mask] = np.nanmin(image_copy)
-        regionalMaxMap = morphology.local_maxima(image_copy, connectivity=connectivity, allow_borders=True)
+        fill = np.nanmin(image, axis=(1, 2), keepdims=True)
+        image_copy = np.where(mask, fill, image)
+        regionalMaxMap = morphology.local_maxima(image_copy, footprint=structure, allow_borders=True)
     else:
-        image_copy[mask] = np.nanmax(image_copy)
-        regionalMaxMap = morphology.local_minima(image_copy, connectivity=connectivity, allow_borders=True)
-    labelled_max = measure.label(regionalMaxMap, connectivity=connectivity)
-    regions = measure.regionprops(labelled_max)
-    peak_coords = np.zeros(shape=(len(regions), 2), dtype=np.int)
-    
-    distance_from_mask = distance_transform_cdt(image_copy * (1-mask))
+        fill = np.nanmax(image, axis=(1, 2), keepdims=True)
+        image_copy = np.where(mask, fill, image)
+        regionalMaxMap = morphology.local_minima(image_copy, footprint=structure, allow_borders=True)
+    labelled_max, num = ndimage.label(regionalMaxMap, structure=structure)
 
-    for i, props in enumerate(regions):
-        y0, x0 = props.centroid
-        peak = np.array([y0, x0])
+    # Centroid of each region, from the sums of the co-ordinates of its members
+    labels = labelled_max.ravel()
+    counts = np.bincount(labels, minlength=num+1)[1:]
+    centroids = np.stack([np.bincount(labels, weights=coords.ravel(), minlength=num+1)[1:]
+                          for coords in np.indices(image.shape)], axis=1) / counts[:, np.newaxis]
 
-        # ensure that there are no peaks off the map (due to rounding)
-        peak[peak < 0] = 0
-        for j in range(image_copy.ndim):
-            if peak[j] > image_copy.shape[j]:
-                peak[j] = image_copy.shape[j] - 1
-        
-        peak_index = tuple(np.round(peak, 0).astype(int)) # indexing with a floating point array sucks, so convert to a more convenient form
-        if distance_from_mask[peak_index] > 2*connectivity:
-            peak_coords[i, :] = peak
+    distance_from_mask = distance_transform_cdt(image_copy * (1-mask), metric=structure)
+    peak_index = tuple(np.round(centroids, 0).astype(int).T)
+    good = distance_from_mask[peak_index] > 2*connectivity
+
+    peak_coords = np.zeros(shape=(num, 3), dtype=int)
+    peak_coords[:, 0] = centroids[:, 0]
+    peak_coords[good, 1:] = centroids[good, 1:]
+    if not is_stack:
+        peak_coords = peak_coords[:, 1:]
     return peak_coords
 
 
+def _peak_search_per_image(image, **kwargs):
+    '''Search each array of a stack in turn, for the search methods that do
+    not handle stacks directly'''
+    mask = np.broadcast_to(kwargs.pop("mask", np.zeros(image.shape[1:], dtype=bool)), image.shape)
+    peak_coords = [np.zeros((0, 3), dtype=int)]
+    for n, (array, array_mask) in enumerate(zip(image, mask)):
+        coords = peak_search(array, mask=array_mask, **kwargs)
+        peak_coords.append(np.column_stack((np.full(len(coords), n), coords)).astype(int))
+    return np.concatenate(peak_coords)
+
+
 def _peak_search_sep_wrapper(firing_map, **kwargs):
     ''' Wrapper around the 'sep' Peak Search method
     Because the 'sep' package is a nightmare to install, and not used for most
@@ -144,7 +194,8 @@ def _peak_search_sep_wrapper(firing_map, **kwargs):
     except ModuleNotFoundError:
         raise ModuleNotFoundError("The package 'sep' is missing from your system."\
                 " You can invoke an alternative algorithm that does not depend on"\
-                " 'sep' by assigning a different value to 'search_method'."\
+                " 'sep' by assigning a different value to 'search_method', such"\
+                " as 'ndimage', which follows the same approach as 'sep'."\
                 " Alternatively, install 'sep' on your system:"\
                 " 'pip install sep'")
     
@@ -182,7 +233,7 @@ def _peak_search_sep(firing_map, **kwargs):
     init_fields = sep.extract(tmp_firing_map-bkg, mask=tmp_mask, thresh=threshold, \
                           err=bkg.globalrms)
 
-    peak_coords = np.zeros(shape=(len(init_fields), 2), dtype=np.int)
+    peak_coords = np.zeros(shape=(len(init_fields), 2), dtype=int)
 
     for i, props in enumerate(init_fields):
         peak = np.array([props['y'], props['x']])
@@ -194,4 +245,125 @@ def _peak_search_sep(firing_map, **kwargs):
                 peak[j] = firing_map.shape[j] - 1
 
         peak_coords[i, :] = peak
-    return peak_coords
\ No newline at end of file
+    return peak_coords
+
+
+def _peak_search_ndimage(firing_map, **kwargs):
+    '''Peak search following the approach of sep, built on scipy.ndimage
+
+    * Pixels above the detection threshold are labelled into objects
+      (8-connected). Objects with fewer than min_area pixels are discarded
+    * Each object is deblended over deblend_nthresh thresholds between the
+      detection threshold and its peak, spaced exponentially as in sep
+      (linearly, if the detection threshold is not positive). A branch of
+      the object counts if it contains at least deblend_cont of the object's
+      flux, and the branches with no further branches are the sources
+    * Each object is divided between its sources by watershed, and the peak
+      co-ordinates are the flux-weighted centroids of the divisions, rounded
+      to the nearest bin
+
+    Every step operates on all objects at once; the only loop is over the
+    deblending thresholds.
+
+    As in _peak_search_sep, the threshold is relative to the rms of the
+    background, so with the default null_background=True, every pixel above
+    zero is detected
+    '''
+    mask = kwargs.get("mask", np.zeros(firing_map.shape, dtype=bool))
+    null_background = kwargs.get("null_background", True)
+    threshold = kwargs.get("threshold", 0.2)
+    nthresh = kwargs.get("deblend_nthresh", default.deblend_nthresh)
+    cont = kwargs.get("deblend_cont", default.deblend_cont)
+    min_area = kwargs.get("min_area", default.peak_min_area)
+
+    image = np.array(firing_map, dtype=float)
+    mask = np.asarray(mask, dtype=bool) | np.isnan(image)
+    if null_background:
+        bkg, rms = 0., 0.
+    else:
+        bkg, rms = _background(image, mask)
+    image = image - bkg
+    image[mask] = 0
+    thresh = threshold * rms
+    structure = np.ones((3, ) * image.ndim, dtype=bool)
+
+    objects, num = ndimage.label((image > thresh) & ~mask, structure=structure)
+    index = np.arange(1, num + 1)
+    areas = np.bincount(objects.ravel(), minlength=num + 1)
+    areas[0] = 0
+    objects[areas[objects] < min_area] = 0
+    if not np.any(objects):
+        return np.zeros((0, image.ndim), dtype=int)
+
+    # Per-object quantities, indexed by object label
+    object_flux = np.zeros(num + 1)
+    object_flux[1:] = ndimage.sum(image, objects, index)
+    object_peak = np.zeros(num + 1)
+    object_peak[1:] = ndimage.maximum(image, objects, index)
+    step = np.arange(nthresh)[:, np.newaxis] / nthresh
+    if thresh > 0:
+        levels = thresh * (object_peak / thresh) ** step
+    else:
+        levels = thresh + (object_peak - thresh) * step
+    object_flux_px = object_flux[objects]
+
+    # Deblend: follow the significant branches up through the thresholds.
+    # Branches with no significant branches above them are the sources
+    sources = np.zeros(image.shape, dtype=int)
+    num_sources = 0
+    previous = None
+    for k in range(nthresh):
+        branches, num_branches = ndimage.label(objects.astype(bool) & (image >= levels[k][objects]),
+                                               structure=structure)
+        flux = np.bincount(branches.ravel(), weights=image.ravel(), minlength=num_branches+1)
+        total = np.zeros(num_branches + 1)
+        total[branches.ravel()] = object_flux_px.ravel()
+        significant = (flux >= cont * total)
+        significant[0] = False
+        if previous is not None:
+            prev_branches, prev_significant = previous
+            # Number of significant branches above each previous branch
+            parent = np.zeros(num_branches + 1, dtype=int)
+            parent[branches.ravel()] = prev_branches.ravel()
+            children = np.bincount(parent[significant], minlength=prev_significant.size)
+            num_sources = _add_sources(sources, num_sources, prev_branches,
+                                       prev_significant & (children == 0))
+        previous = (branches, significant)
+    num_sources = _add_sources(sources, num_sources, *previous)
+
+    labels = segmentation.watershed(-image, markers=sources, mask=objects.astype(bool),
+                                    connectivity=2)
+    centroids = ndimage.center_of_mass(np.maximum(image, 0), labels,
+                                       np.arange(1, num_sources + 1))
+    peak_coords = np.round(np.array(centroids, dtype=float).reshape(-1, image.ndim))
+    peak_coords = np.clip(np.nan_to_num(peak_coords), 0, np.array(image.shape) - 1)
+    return peak_coords.astype(int)
+
+
+def _add_sources(sources, num_sources, branches, is_source):
+    '''Label the branches flagged in is_source as new sources'''
+    lut = np.zeros(is_source.size, dtype=int)
+    lut[is_source] = np.arange(num_sources + 1, num_sources + 1 + np.count_nonzero(is_source))
+    new = lut[branches]
+    sources[new > 0] = new[new > 0]
+    return num_sources + np.count_nonzero(is_source)
+
+
+def _background(image, mask):
+    '''Global background level and rms, following SExtractor: the unmasked
+    values are sigma-clipped at 3 sigma about the median, and the mode is
+    estimated as 2.5*median - 1.5*mean, unless the distribution is too
+    skewed, in which case the median is used'''
+    values = image[~mask]
+    if values.size == 0:
+        return 0., 0.
+    for _ in range(100):
+        median, std = np.median(values), np.std(values)
+        keep = np.abs(values - median) <= 3 * std
+        if keep.all() or not keep.any():
+            break
+        values = values[keep]
+    mean, median, std = np.mean(values), np.median(values), np.std(values)
+    if std > 0 and abs(mean - median) / std >= 0.3:
+        return median, std
+    return 2.5 * median - 1.5 * mean, std
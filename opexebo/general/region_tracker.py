@@ -0,0 +1,164 @@
+"""Provide class for tracking the growth of a thresholded region"""
+
+import numpy as np
+from scipy import ndimage
+from skimage import morphology
+
+
+class RegionTracker:
+    '''
+    Track the region of an image connected to a seed as a threshold is lowered.
+
+    For a threshold `t`, the region is the set of pixels with value `>= t`
+    that are connected (vertically or horizontally) to `seed`. Lowering the
+    threshold only ever adds pixels to the region, so the region at every
+    threshold is described by a single value per pixel: the highest threshold
+    at which the pixel joins the region. This is the greyscale reconstruction
+    (by dilation) of the seed under the image, found for all pixels at once.
+
+    A hole is a group of (vertically or horizontally) connected pixels outside
+    the region that does not reach the edge of the image, and that contains at
+    least one pixel which is not ignored. These are the holes that
+    `scipy.ndimage.binary_fill_holes` would fill. A pixel outside the region
+    is in a hole until the threshold exceeds the lowest pass, over pixels
+    outside the region, to the edge of the image. This is found for all
+    pixels at once by reconstruction (by erosion) from the edge.
+
+    Only the pixels connected to the seed down to `floor`, plus a margin of
+    one pixel, are considered. The tracker is built once per image: it may be
+    moved to another seed with `reseed`, and the image modified with `update`.
+    The region is then tracked again when next queried. After that, the area,
+    pixels, number of holes and Euler number of the region at any threshold
+    are found without further image processing, except to count the holes
+    when there are any.
+
+    Parameters
+    ----------
+    image: np.ndarray
+        2D image, without NaN values
+    seed: array-like
+        [row, col] of the pixel from which the region grows
+
+    Other Parameters
+    ----------------
+    floor: float
+        Lowest threshold that will be queried. Pixels are only considered
+        down to this value, limiting the cost for regions much smaller than
+        the image. Default -inf
+    ignore: np.ndarray
+        Boolean array, True at pixels that do not, by themselves, make a hole,
+        such as unvisited bins. Default None
+
+    Notes
+    -----
+    Copyright (C) 2021 by Simon Ball
+    '''
+
+    def __init__(self, image, seed, **kwargs):
+        floor = kwargs.get("floor", -np.inf)
+        ignore = kwargs.get("ignore", None)
+
+        image = np.array(image, dtype=float)
+        if image.ndim != 2:
+            raise ValueError("image must be 2D. You provided a"\
+                             f" {image.ndim}D array")
+        if np.isnan(image).any():
+            raise ValueError("image cannot contain NaN values")
+        if ignore is None:
+            ignore = np.zeros(image.shape, dtype=bool)
+        elif np.shape(ignore) != image.shape:
+            raise ValueError("ignore must have the same shape as image. You"\
+                             f" provided {np.shape(ignore)} and {image.shape}")
+        self.shape = image.shape
+        self._image = image
+        self._ignore = np.asarray(ignore, dtype=bool)
+        self.reseed(seed, floor)
+
+    def reseed(self, seed, floor=None):
+        '''Track the region grown from `seed` instead, optionally with a new
+        `floor`'''
+        self.seed = tuple(seed)
+        if floor is not None:
+            self.floor = floor
+        self._tracked = None
+
+    def update(self, pixels, values):
+        '''Set the image at `pixels` (any index accepted by a numpy array) to
+        `values`, e.g. to raise a region that has already been accounted for'''
+        self._image[pixels] = values
+        self._tracked = None
+
+    def area(self, threshold):
+        '''Number of pixels in the region at `threshold`'''
+        self._check(threshold)
+        return np.count_nonzero(self._track()[1] >= threshold)
+
+    def pixels(self, threshold):
+        '''Flat (C order) indices of the pixels of the region at `threshold`'''
+        self._check(threshold)
+        window, joins, _, _ = self._track()
+        rows, cols = np.nonzero(joins >= threshold)
+        return np.ravel_multi_index((rows + window[0].start, cols + window[1].start),
+                                    self.shape)
+
+    def holes(self, threshold):
+        '''Number of holes in the region at `threshold`'''
+        self._check(threshold)
+        _, joins, passes, counts = self._track()
+        outside = (joins < threshold) & (passes >= threshold)
+        if not np.any(outside & counts):
+            return 0
+        labels, _ = ndimage.label(outside)
+        return np.unique(labels[outside & counts]).size
+
+    def euler_number(self, threshold):
+        '''Euler number of the region at `threshold`: one, less the number of
+        holes. Zero if the region is empty'''
+        if self.area(threshold) == 0:
+            return 0
+        return 1 - self.holes(threshold)
+
+    #########################################################
+    ################        Helper Functions
+    #########################################################
+
+    def _check(self, threshold):
+        '''Thresholds below the floor cannot be answered'''
+        if threshold < self.floor:
+            raise ValueError(f"threshold ({threshold}) is below the floor of the"\
+                             f" tracker ({self.floor})")
+
+    def _track(self):
+        '''Window around the region at the floor and, over the window, the
+        threshold at which each pixel joins the region, the threshold up to
+        which each pixel is in a hole, and which pixels count towards a hole'''
+        if self._tracked is not None:
+            return self._tracked
+        above = self._image >= self.floor
+        above[self.seed] = True
+        labels, _ = ndimage.label(above)
+        reached = labels == labels[self.seed]
+        rows, cols = np.nonzero(reached)
+        window = (slice(max(rows.min() - 1, 0), rows.max() + 2),
+                  slice(max(cols.min() - 1, 0), cols.max() + 2))
+        reached = reached[window]
+        values = self._image[window]
+
+        # Pixels not reached down to the floor never join the region
+        lowest = values.min() - 1
+        values = np.where(reached, values, lowest)
+        cross = ndimage.generate_binary_structure(2, 1)
+        marker = np.full(values.shape, lowest)
+        seed = (self.seed[0] - window[0].start, self.seed[1] - window[1].start)
+        marker[seed] = values[seed]
+        joins = morphology.reconstruction(marker, values, footprint=cross)
+
+        # Threshold of the lowest pass from each pixel to the edge of the
+        # window. Pixels beyond the window are never in the region
+        marker = np.full(values.shape, joins.max())
+        marker[[0, -1], :] = joins[[0, -1], :]
+        marker[:, [0, -1]] = joins[:, [0, -1]]
+        passes = morphology.reconstruction(marker, joins, method="erosion",
+                                           footprint=cross)
+        self._tracked = (window, joins, passes, ~self._ignore[window])
+        return self._tracked
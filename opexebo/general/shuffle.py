@@ -45,6 +45,10 @@ def shuffle(times, offset_lim, iterations, **kwargs):
         If no values are provided, then the first and last spike times
         are used. This is not desirable behaviour, since it will then guarantee 
         that in the shuffled output, two spikes will occur simultaneously
+    seed: int, optional
+        Seed of the pseudorandom number generator, so that the same offsets are
+        drawn on every call. If not provided, a new seed is taken from the
+        operating system on every call
     debug: bool, optional
         Enable additional debugging output
     
@@ -73,6 +77,7 @@ def shuffle(times, offset_lim, iterations, **kwargs):
     if np.isnan(times).any():
         raise ValueError("You have NaN values in your times array")
     debug = kwargs.get('debug', False)
+    seed = kwargs.get('seed', None)
     tr = kwargs.get('tracking_range', None)
     try:
         if tr is not None:
@@ -95,13 +100,13 @@ def shuffle(times, offset_lim, iterations, **kwargs):
                          % (offset_lim, t1-t0))
 
     
-    # Initialise Numpy's random number generator with a new seed based on the 
-    # user's local computer OS methods
+    # Initialise Numpy's random number generator with `seed`, or a new seed
+    # based on the user's local computer OS methods
     t_min = t0 + offset_lim
     t_max = t1 - offset_lim
     
     
-    increments = np.random.RandomState().rand(iterations) # Uniformmly distrbuted in [0, 1]
+    increments = np.random.RandomState(seed).rand(iterations) # Uniformmly distrbuted in [0, 1]
     increments = t_min + (increments * (t_max-t_min)) # uniformly distributed in [t_min, t_max]
     
     num_spikes = np.size(times)
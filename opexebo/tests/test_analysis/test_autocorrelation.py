@@ -29,3 +29,20 @@ def test_perfect_artificial_grid():
     )
     acorr = func(firing_map)
     return acorr
+
+
+def test_stack_matches_single():
+    firing_maps = np.random.rand(4, 40, 52)
+    firing_maps[2, 5:10, 7] = np.nan
+    acorrs = func(firing_maps)
+    assert acorrs.shape == (4, 71, 93)
+    for firing_map, acorr in zip(firing_maps, acorrs):
+        assert np.allclose(func(firing_map), acorr, rtol=0, atol=1e-10)
+
+
+def test_masked():
+    firing_map = np.ma.masked_where(np.random.rand(40, 40) > 0.7, np.random.rand(40, 40))
+    acorr = func(firing_map, masked=True)
+    assert acorr.shape == (71, 71)
+    assert np.isclose(acorr[35, 35], 1)
+    assert np.all(np.abs(acorr) <= 1)
@@ -3,6 +3,7 @@ import numpy as np
 import pytest
 
 from opexebo.analysis import border_coverage as func
+from opexebo.analysis import place_field
 from opexebo.analysis.border_coverage import _validate_keyword_walls as validate_func
 from opexebo.errors import ArgumentError
 
@@ -129,10 +130,55 @@ def test_central_field_square():
 def test_zero_fields_square():
     fields = []
     assert func(fields, "s") == 0
+    assert func(np.zeros((40, 40), dtype=int), "s") == 0
     print("test_zero_fields() passed")
     return True
 
 
+def test_label_map_square():
+    """An integer map of labelled fields gives the same coverage as the
+    equivalent list of binary field maps"""
+    labels = np.zeros((40, 40), dtype=int)
+    labels[:20, 0] = 1
+    labels[15:25, 15:25] = 2
+    labels[-1, 10:40] = 3
+    fields = [{kw_field_map: (labels == i).astype(float)} for i in (1, 2, 3)]
+    for walls in ("L", "T", "RB", "TRBL"):
+        for sw in (1, 8):
+            assert func(labels, "s", walls=walls, search_width=sw) \
+                == func(fields, "s", walls=walls, search_width=sw)
+    masked = np.ma.masked_where(labels == 1, labels)
+    assert func(masked, "s", walls="L") == 0
+    # Labels need not be consecutive
+    labels[labels == 3] = 5
+    assert func(labels, "s", walls="T") == func(fields, "s", walls="T")
+
+
+def test_walls_keyword_not_overridden_by_field():
+    """The `walls` keyword applies to every field dictionary, whatever other
+    keys it contains"""
+    fmap = np.zeros((40, 40))
+    fmap[:, 0] = 1
+    field = {kw_field_map: fmap, "walls": "l"}
+    assert func(field, "s", walls="R") == 0
+    assert func(field, "s", walls="L") == 1
+
+
+def test_place_field_map_square():
+    """The float `fields_map` returned by place_field is accepted directly"""
+    y, x = np.mgrid[0:40, 0:40]
+    rmap = 5 * np.exp(-((x - 1)**2 + (y - 20)**2) / 20) \
+        + 4 * np.exp(-((x - 25)**2 + (y - 28)**2) / 20)
+    rmap[rmap < 0.5] = 0
+    fields, fields_map = place_field(rmap, min_bins=5)
+    assert fields_map.dtype.kind == "f"
+    assert len(fields) == 2
+    expected = [{kw_field_map: f["map"]} for f in fields]
+    for walls in ("L", "T", "TRBL"):
+        assert func(fields_map, "s", walls=walls) == func(expected, "s", walls=walls)
+    assert func(fields_map, "s", walls="L") > 0
+
+
 
 ###############################################################################
 ################                Circular arenas
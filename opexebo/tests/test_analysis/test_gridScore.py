@@ -1,7 +1,15 @@
 """ Tests for grid score"""
+import numpy as np
+from scipy.stats import pearsonr
+from skimage import transform
+
 import opexebo.tests as th
+import pytest
+
 import opexebo
-from opexebo.analysis import grid_score as func
+import opexebo.errors as err
+from opexebo.analysis import grid_score as func, grid_score_stats
+from opexebo.analysis.grid_score import _stats_mask, _centre_field_radii, _findCentreRadius
 
 print("=== tests_analysis_grid_score ===")
 
@@ -26,5 +34,136 @@ def test_perfect_grid_cell():
     assert stats["grid_ellipse_aspect_ratio"] < 1.15
 
 
+def test_ring_correlations_match_pearson():
+    """The running-sum correlations must match a direct Pearson correlation
+    over the masked ring for every radius"""
+    from opexebo.analysis.grid_score import (_ring_correlations, _distance_map,
+        _gridness_radii, ROTATION_ANGLES)
+    acorr = np.random.rand(61, 61)
+    rotated = np.stack([transform.rotate(acorr, a, preserve_range=True, clip=False)
+                        for a in ROTATION_ANGLES])
+    distance = _distance_map(acorr.shape)
+    cfield_radius = 4
+    radii = _gridness_radii(cfield_radius, 30)
+    corr = _ring_correlations(acorr.reshape(1, -1), rotated.reshape(1, len(ROTATION_ANGLES), -1),
+                              distance.ravel(), np.array([cfield_radius]), radii)[0]
+    for i, radius in enumerate(radii):
+        mask = (distance > cfield_radius) & (distance < radius)
+        for j in range(len(ROTATION_ANGLES)):
+            expected, _ = pearsonr(acorr[mask], rotated[j][mask])
+            assert np.isclose(corr[j, i], expected, rtol=0, atol=1e-10)
+
+
+def test_polar_rotation_method():
+    """The polar rotation method is an approximation of the cartesian method:
+    scores are expected to agree closely, but not exactly"""
+    firing_map = th.generate_2d_map(
+        "rect",
+        1,
+        x=80,
+        y=80,
+        coverage=0.95,
+        fields=th.generate_hexagonal_grid_fields_dict(),
+    )
+    acorr = opexebo.analysis.autocorrelation(firing_map)
+    gs_cartesian, _ = func(acorr)
+    gs_polar, stats = func(acorr, rotation_method="polar")
+    assert abs(gs_polar - gs_cartesian) < 0.05
+    assert stats["grid_ellipse_aspect_ratio"] < 1.15
+    acorr = opexebo.analysis.autocorrelation(opexebo.general.smooth(np.random.rand(80, 80), 2))
+    gs_cartesian, _ = func(acorr)
+    gs_polar, _ = func(acorr, rotation_method="polar", polar_angle_step=0.5)
+    assert abs(gs_polar - gs_cartesian) < 0.05
+    with pytest.raises(err.ArgumentError):
+        func(acorr, rotation_method="spherical")
+    with pytest.raises(err.ArgumentError):
+        func(acorr, rotation_method="polar", polar_angle_step=7)
+
+
+def test_rotation_operator_matches_skimage():
+    """The cached rotation operator reproduces skimage.transform.rotate, and is
+    reused for autocorrelograms of the same shape"""
+    from opexebo.analysis.grid_score import _rotation_operator, ROTATION_ANGLES
+    image = np.random.rand(31, 44)
+    _rotation_operator.cache_clear()
+    operator, _ = _rotation_operator(image.shape, tuple(ROTATION_ANGLES), 1)
+    rotated = (operator @ image.ravel()).reshape(len(ROTATION_ANGLES), *image.shape)
+    for i, angle in enumerate(ROTATION_ANGLES):
+        expected = transform.rotate(image, angle, order=1, preserve_range=True)
+        assert np.allclose(rotated[i], expected, rtol=0, atol=1e-12)
+    _rotation_operator(image.shape, tuple(ROTATION_ANGLES), 1)
+    assert _rotation_operator.cache_info().hits == 1
+
+
+def test_lazy_stats():
+    firing_map = th.generate_2d_map(
+        "rect",
+        1,
+        x=80,
+        y=80,
+        coverage=0.95,
+        fields=th.generate_hexagonal_grid_fields_dict(),
+    )
+    acorr = opexebo.analysis.autocorrelation(firing_map)
+    gs, stats = func(acorr)
+    gs_lazy, stats_lazy = func(acorr, lazy_stats=True)
+    assert gs == gs_lazy
+    assert not stats_lazy.evaluated
+    assert stats_lazy["grid_spacing"] == stats["grid_spacing"]
+    assert stats_lazy.evaluated
+    assert set(stats_lazy) == set(stats)
+    assert np.allclose(stats_lazy["grid_ellipse"], stats["grid_ellipse"])
+
+
+def test_stats_stack_matches_single():
+    """Grid statistics of a stack are those of each autocorrelogram alone"""
+    acorrs = []
+    for i in range(3):
+        firing_map = th.generate_2d_map("rect", 1, x=80, y=80, coverage=0.95,
+                                        fields=th.generate_hexagonal_grid_fields_dict())
+        acorrs.append(opexebo.analysis.autocorrelation(firing_map))
+    acorrs = np.array(acorrs)
+    centre = -0.5 + np.array(acorrs.shape[1:])/2
+    masks = np.array([_stats_mask(acorr, 25, 5, centre) for acorr in acorrs])
+    stats = grid_score_stats(acorrs, masks, centre)
+    assert stats["grid_positions"].shape == (3, 6, 2)
+    for i, (acorr, mask) in enumerate(zip(acorrs, masks)):
+        single = grid_score_stats(acorr, mask, centre)
+        for key, value in single.items():
+            value = np.asarray(value, dtype=float)
+            expected = stats[key][i][tuple(slice(0, n) for n in value.shape)]
+            assert np.allclose(value, expected, equal_nan=True)
+
+
+def test_stats_invalid_is_a_copy():
+    """Modifying the statistics of an invalid autocorrelogram does not modify
+    those returned for the next one"""
+    acorr = np.zeros((41, 41))
+    mask = np.zeros((41, 41), dtype=bool)
+    stats = grid_score_stats(acorr, mask, np.array([20., 20.]))
+    stats["grid_spacings"][:] = 0
+    assert np.all(np.isnan(grid_score_stats(acorr, mask, np.array([20., 20.]))["grid_spacings"]))
+
+
+def test_centre_field_radii_match_place_field():
+    """The centre field radius of a stack is that found with place_field for
+    each autocorrelogram, including those passed back to place_field"""
+    rng = np.random.default_rng(0)
+    acorrs = []
+    for i in range(3):
+        firing_map = th.generate_2d_map("rect", 1, x=80, y=80, coverage=0.95,
+                                        fields=th.generate_hexagonal_grid_fields_dict())
+        acorrs.append(opexebo.analysis.autocorrelation(firing_map))
+    for i in range(3):
+        acorrs.append(opexebo.analysis.autocorrelation(rng.random((80, 80))))
+    acorrs = np.array(acorrs)
+    acorrs /= acorrs.max(axis=(1, 2))[:, np.newaxis, np.newaxis]
+    acorrs[-1] = -acorrs[-1]
+    acorrs[-1, 0, 0] = 1
+    acorrs[-2, 0, 0] = np.nan
+    expected = [np.floor(np.ravel(_findCentreRadius(acorr))[0]) for acorr in acorrs]
+    assert np.array_equal(_centre_field_radii(acorrs), expected)
+
+
 # if __name__ == '__main__':
 #    test_perfect_grid_cell()
@@ -0,0 +1,43 @@
+""" Tests for batched grid score"""
+import numpy as np
+import pytest
+
+import opexebo.tests as th
+import opexebo
+import opexebo.errors as err
+from opexebo.analysis import grid_score_batch as func
+
+print("=== tests_analysis_grid_score_batch ===")
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(err.ArgumentError):
+        func(np.random.rand(40, 40))
+
+
+def test_matches_grid_score():
+    acorrs = []
+    for i in range(2):
+        firing_map = th.generate_2d_map(
+            "rect",
+            1,
+            x=80,
+            y=80,
+            coverage=0.95,
+            fields=th.generate_hexagonal_grid_fields_dict(),
+        )
+        acorrs.append(opexebo.analysis.autocorrelation(firing_map))
+    acorrs.append(opexebo.analysis.autocorrelation(np.random.rand(80, 80)))
+    acorrs = np.array(acorrs)
+    scores, stats = func(acorrs, chunk_size=2)
+    assert scores.shape == (3,)
+    assert stats["grid_positions"].shape == (3, 6, 2)
+    for i, acorr in enumerate(acorrs):
+        gs, single_stats = opexebo.analysis.grid_score(acorr)
+        assert np.isclose(scores[i], gs, equal_nan=True)
+        assert np.isclose(stats["grid_spacing"][i], single_stats["grid_spacing"], equal_nan=True)
@@ -0,0 +1,73 @@
+""" Tests for grid score shuffling"""
+import numpy as np
+
+import opexebo
+from opexebo.analysis import grid_score_shuffle as func
+
+print("=== tests_analysis_grid_score_shuffle ===")
+
+
+###############################################################################
+################                HELPER FUNCTIONS
+###############################################################################
+
+
+def tracking(num_frames=20000, arena_size=80, seed=0):
+    rng = np.random.RandomState(seed)
+    times = np.arange(num_frames) * 0.02
+    steps = rng.randn(2, num_frames) * 1.5
+    positions = np.abs(np.cumsum(steps, axis=1)) % (2 * arena_size)
+    positions = np.where(positions > arena_size, 2 * arena_size - positions, positions)
+    speeds = np.full(num_frames, 10.)
+    return times, positions, speeds
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_null_distribution():
+    times, positions, speeds = tracking()
+    spike_times = np.sort(np.random.RandomState(1).choice(times, 2000, replace=False))
+    null, thresholds = func(spike_times, times, positions, speeds, 80,
+                            bin_width=4, limits=(0, 80, 0, 80), iterations=10,
+                            chunk_size=4)
+    assert null.shape == (10,)
+    assert set(thresholds) == {95, 99}
+    assert thresholds[95] <= thresholds[99] <= np.nanmax(null)
+
+
+def test_seed():
+    times, positions, speeds = tracking()
+    spike_times = np.sort(np.random.RandomState(1).choice(times, 2000, replace=False))
+    kwargs = dict(bin_width=4, limits=(0, 80, 0, 80), iterations=5, seed=3)
+    null_a, _ = func(spike_times, times, positions, speeds, 80, **kwargs)
+    null_b, _ = func(spike_times, times, positions, speeds, 80, **kwargs)
+    assert np.array_equal(null_a, null_b, equal_nan=True)
+
+
+def test_matches_single_unit_pipeline():
+    """Each score of the null distribution is the gridness score of the same
+    shifted spike train, found with rate_map, smooth, autocorrelation and
+    grid_score"""
+    times, positions, speeds = tracking()
+    spike_times = np.sort(np.random.RandomState(1).choice(times, 2000, replace=False))
+    kwargs = dict(bin_width=4, limits=(0, 80, 0, 80))
+    iterations, offset_lim, seed = 6, 20, 3
+    null, _ = func(spike_times, times, positions, speeds, 80, iterations=iterations,
+                   offset_lim=offset_lim, seed=seed, chunk_size=4, **kwargs)
+
+    shuffled, _ = opexebo.general.shuffle(spike_times, offset_lim, iterations,
+                                          tracking_range=times, seed=seed)
+    occupancy, _, _ = opexebo.analysis.spatial_occupancy(times, positions, speeds,
+                                                         80, **kwargs)
+    for score, shifted in zip(null, shuffled):
+        # Each spike takes the position and speed of the nearest tracking frame
+        frames = np.clip(np.round(shifted / 0.02).astype(int), 0, times.size - 1)
+        spikes_tracking = np.vstack((shifted, speeds[frames], positions[:, frames]))
+        rmap = opexebo.analysis.rate_map(occupancy, spikes_tracking, 80, **kwargs)
+        rmap = opexebo.general.smooth(rmap, 2)
+        acorr = opexebo.analysis.autocorrelation(rmap)
+        expected, _ = opexebo.analysis.grid_score(acorr)
+        assert np.isclose(score, expected, equal_nan=True)
@@ -0,0 +1,187 @@
+"""Tests for place_field_1d"""
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from opexebo.analysis import place_field_1d as func
+import opexebo.errors as err
+
+print("=== tests_analysis_placeField1d ===")
+
+
+###############################################################################
+################                HELPER FUNCTIONS
+###############################################################################
+
+
+def _random_maps(n, num_bins=200, seed=0):
+    rng = np.random.RandomState(seed)
+    x = np.arange(num_bins)
+    maps = np.zeros((n, num_bins))
+    for rmap in maps:
+        for _ in range(4):
+            centre, width = rng.rand() * num_bins, rng.rand() * 8 + 2
+            rmap += (rng.rand() * 10 + 0.5) * np.exp(-(x - centre)**2 / (2 * width**2))
+    maps[rng.rand(n, num_bins) > 0.97] = np.nan
+    return maps
+
+
+def _reference(rmap, threshold=0.2, min_bins=9, min_peak=1, min_mean=0.1):
+    '''Single map, one run of visited bins at a time'''
+    labels, num = ndimage.label(~np.isnan(rmap))
+    fields = []
+    for i in range(1, num + 1):
+        bins = np.flatnonzero(labels == i)
+        for start, stop in _reference_run(rmap[bins], threshold, min_bins, min_peak):
+            rates = rmap[bins[start:stop]]
+            if stop - start >= min_bins and rates.max() >= min_peak and rates.mean() >= min_mean:
+                fields.append((bins[start], bins[start] + stop - start,
+                               bins[start] + np.argmax(rates), rates.mean()))
+    return fields
+
+
+def _reference_run(x, threshold, min_bins, min_peak):
+    '''(start, stop) of the fields of every split peak, in a run of visited bins'''
+    def extent(p, left_level, right_level):
+        start, stop = p, p + 1
+        while start > 0 and x[start - 1] >= left_level:
+            start -= 1
+        while stop < x.size and x[stop] >= right_level:
+            stop += 1
+        return start, stop
+
+    # Peaks: the middle of each plateau higher than both neighbours
+    peaks = []
+    start = 0
+    while start < x.size:
+        stop = start + 1
+        while stop < x.size and x[stop] == x[start]:
+            stop += 1
+        if (start == 0 or x[start - 1] < x[start]) and (stop == x.size or x[stop] < x[start]):
+            peaks.append((start + stop - 1) // 2)
+        start = stop
+
+    split = []
+    for p in peaks:
+        # Saddle: the higher of the lowest points on the way to a higher peak
+        # on either side. None if there is no higher peak
+        saddle = -np.inf
+        for step in (-1, 1):
+            j = p + step
+            lowest = x[p]
+            while 0 <= j < x.size and x[j] <= x[p]:
+                lowest = min(lowest, x[j])
+                j += step
+            if 0 <= j < x.size:
+                saddle = max(saddle, lowest)
+        level = max(threshold * x[p], np.nextafter(saddle, np.inf))
+        start, stop = extent(p, level, level)
+        if saddle == -np.inf or (stop - start >= min_bins and x[p] >= min_peak):
+            split.append(p)
+
+    fields = []
+    for n, p in enumerate(split):
+        left = -np.inf if n == 0 else x[split[n - 1]:p].min()
+        right = -np.inf if n == len(split) - 1 else x[p:split[n + 1]].min()
+        level = threshold * x[p]
+        fields.append(extent(p, max(level, np.nextafter(left, np.inf)),
+                             max(level, np.nextafter(right, np.inf))))
+    return fields
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(err.ArgumentError):
+        func(np.ones((2, 3, 4)))
+    with pytest.raises(err.ArgumentError):
+        func(np.ones(40), threshold=0)
+
+
+def test_no_fields():
+    fields, fields_map = func(np.full(40, np.nan))
+    assert fields.size == 0
+    assert fields_map.shape == (40, )
+    fields, fields_map = func(np.zeros((3, 40)))
+    assert fields.size == 0
+    assert not fields_map.any()
+
+
+def test_single_field():
+    rmap = np.zeros(50)
+    rmap[10:22] = 5
+    rmap[15] = 8
+    fields, fields_map = func(rmap)
+    assert fields.size == 1
+    field = fields[0]
+    assert field["unit"] == 0 and field["field"] == 1
+    assert field["area"] == 12
+    assert np.array_equal(field["bbox"], [10, 22])
+    assert field["peak_coords"] == 15
+    assert field["centroid_coords"] == 15.5
+    assert field["mean_rate"] == 63 / 12
+    assert np.array_equal(np.flatnonzero(fields_map), np.arange(10, 22))
+
+
+def test_weak_field():
+    """A weak field is found alongside a strong one: each field is thresholded
+    relative to its own peak"""
+    x = np.arange(100)
+    rmap = 20 * np.exp(-(x - 25)**2 / 50) + 3 * np.exp(-(x - 75)**2 / 50)
+    fields, fields_map = func(rmap)
+    assert fields.size == 2
+    assert np.array_equal(fields["peak_coords"], [25, 75])
+    assert np.allclose(fields["peak_rate"], [20, 3])
+    # The weak field, below 20% of the strong peak, has the same extent as
+    # the strong one
+    assert fields["area"][0] == fields["area"][1]
+    assert np.array_equal(fields["bbox"][1] - 50, fields["bbox"][0])
+    assert np.all(fields_map[fields["bbox"][1][0]:fields["bbox"][1][1]] == 2)
+
+
+def test_high_valley():
+    """Two fields joined by a valley above the threshold are separated at the
+    lowest bin between them"""
+    x = np.arange(100)
+    rmap = 10 * np.exp(-(x - 35)**2 / 200) + 8 * np.exp(-(x - 65)**2 / 200)
+    valley = 35 + np.argmin(rmap[35:65])
+    assert rmap[valley] > 0.2 * rmap.max()
+    fields, fields_map = func(rmap)
+    assert fields.size == 2
+    assert np.array_equal(fields["peak_coords"], [35, 65])
+    assert fields["bbox"][0][1] == valley
+    assert fields["bbox"][1][0] == valley + 1
+    assert fields_map[valley] == 0
+    # Noise on the flank of a field does not split it
+    noisy = rmap.copy()
+    noisy[45] += 0.5
+    noisy_fields, _ = func(noisy)
+    assert noisy_fields.size == 2
+    assert np.array_equal(noisy_fields["bbox"], fields["bbox"])
+
+
+def test_matches_reference():
+    maps = _random_maps(30)
+    fields, fields_map = func(maps)
+    assert fields_map.shape == maps.shape
+    for unit, rmap in enumerate(maps):
+        expected = _reference(rmap)
+        found = fields[fields["unit"] == unit]
+        assert found.size == len(expected)
+        assert np.array_equal(found["field"], np.arange(1, found.size + 1))
+        for field, (start, stop, peak, mean) in zip(found, expected):
+            assert np.array_equal(field["bbox"], [start, stop])
+            assert field["peak_coords"] == peak
+            assert np.isclose(field["mean_rate"], mean)
+            assert np.all(fields_map[unit, start:stop] == field["field"])
+        assert np.count_nonzero(fields_map[unit]) == found["area"].sum()
+    # A stack gives the same result as each map in turn, and masked bins are
+    # treated as NaN bins
+    single, single_map = func(maps[4])
+    assert np.array_equal(single_map, fields_map[4])
+    masked, masked_map = func(np.ma.masked_invalid(maps))
+    assert np.array_equal(masked, fields)
+    assert np.array_equal(masked_map, fields_map)
@@ -0,0 +1,55 @@
+"""Tests for place_field_batch"""
+import numpy as np
+import pytest
+
+from opexebo.analysis import place_field, place_field_batch as func
+import opexebo.errors as err
+
+print("=== tests_analysis_placeFieldBatch ===")
+
+
+###############################################################################
+################                HELPER FUNCTIONS
+###############################################################################
+
+
+def _random_maps(n, seed=0):
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[:40, :40]
+    maps = np.zeros((n, 40, 40))
+    for fmap in maps:
+        for _ in range(6):
+            cy, cx = rng.rand(2) * 40
+            s = rng.rand() * 3 + 1.5
+            fmap += (rng.rand() * 10 + 2) * np.exp(-((y-cy)**2 + (x-cx)**2) / (2*s*s))
+        fmap[fmap < 0.5] = 0
+    return maps
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(err.ArgumentError):
+        func(np.ones((40, 40)))
+    with pytest.raises(err.ArgumentError):
+        func(np.ones((2, 40, 40)), pool="cluster")
+
+
+@pytest.mark.parametrize("workers, pool", [(1, "thread"), (2, "thread"), (2, "process")])
+def test_matches_place_field(workers, pool):
+    maps = _random_maps(5)
+    table, labels = func(maps, workers=workers, pool=pool, chunk_size=2)
+    assert labels.shape == maps.shape
+    for n, fmap in enumerate(maps):
+        fields, fields_map = place_field(fmap)
+        rows = table[table["unit"] == n]
+        assert np.array_equal(labels[n], fields_map)
+        assert rows.size == len(fields)
+        for row, field in zip(rows, fields):
+            assert row["area"] == field["area"]
+            assert np.array_equal(row["peak_coords"], field["peak_coords"])
+            assert np.isclose(row["mean_rate"], field["mean_rate"])
+            assert np.array_equal(labels[n] == row["field"], field["map"].astype(bool))
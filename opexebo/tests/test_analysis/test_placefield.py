@@ -2,7 +2,7 @@
 import numpy as np
 import pytest
 
-from opexebo.analysis import place_field as func
+from opexebo.analysis import place_field as func, place_field_map
 import opexebo.errors as err
 
 print("=== tests_analysis_placeField ===")
@@ -58,3 +58,55 @@ def test_unchanging_ratemap():
     assert np.array_equal(fmap, fmap_original)
     print("test_unchanging_ratemap() passed")
     return True
+
+
+@pytest.mark.parametrize("field_method", ["max_tree", "incremental"])
+def test_field_method_matches_threshold(field_method):
+    """The max_tree and incremental field methods should find exactly the
+    same fields as the default thresholding method"""
+    rng = np.random.RandomState(0)
+    y, x = np.mgrid[:50, :50]
+    for _ in range(3):
+        fmap = np.zeros((50, 50))
+        for _ in range(8):
+            cy, cx = rng.rand(2) * 50
+            s = rng.rand() * 3 + 1.5
+            fmap += (rng.rand() * 10 + 2) * np.exp(-((y-cy)**2 + (x-cx)**2) / (2*s*s))
+        fmap += rng.rand(50, 50) * 0.3
+        fmap[fmap < 0.5] = 0
+        fmap[:6, :6] = np.nan
+        fields, fields_map = func(fmap)
+        fields_other, fields_map_other = func(fmap, field_method=field_method)
+        assert len(fields) > 0
+        assert np.array_equal(fields_map, fields_map_other)
+    with pytest.raises(err.ArgumentError):
+        func(fmap, field_method="watershed")
+
+
+def test_compact_output():
+    """The compact output holds the same fields as the default output"""
+    rng = np.random.RandomState(0)
+    y, x = np.mgrid[:40, :40]
+    fmap = np.zeros((40, 40))
+    for _ in range(6):
+        cy, cx = rng.rand(2) * 40
+        s = rng.rand() * 3 + 1.5
+        fmap += (rng.rand() * 10 + 2) * np.exp(-((y-cy)**2 + (x-cx)**2) / (2*s*s))
+    fmap[fmap < 0.5] = 0
+    fields, fields_map = func(fmap)
+    compact, labels = func(fmap, output="compact")
+    assert labels.dtype == np.uint8
+    assert np.array_equal(labels, fields_map)
+    assert compact.size == len(fields) > 0
+    # The dict output reports the area as a float
+    assert all(isinstance(field["area"], float) for field in fields)
+    for row, field in zip(compact, fields):
+        for key in ("area", "peak_coords", "centroid_coords", "bbox", "mean_rate", "peak_rate"):
+            assert np.allclose(row[key], field[key])
+        field_map, coords = place_field_map(labels, row)
+        assert np.array_equal(field_map, field["map"])
+        assert np.array_equal(coords, field["coords"])
+    empty, labels = func(np.zeros((40, 40)), output="compact")
+    assert empty.size == 0 and labels.dtype == np.uint8
+    with pytest.raises(err.ArgumentError):
+        func(fmap, output="list")
@@ -102,13 +102,71 @@ def test_2d_bin_edges():
     hist, edges = func(pos, arena_size=arena_size, limits=limits, bin_edges=bin_edges)
     for i in range(2):
         assert np.array_equal(edges[i], bin_edges[i])
-    # Also test that passing in an array instead of a list works:
-    bin_edges = np.array(bin_edges)
+    # Also test that passing in an array instead of a list works. The edges
+    # differ in length, so this is an array of objects
+    bin_edges = np.array(bin_edges, dtype=object)
     hist, edges = func(pos, arena_size=arena_size, limits=limits, bin_edges=bin_edges)
     for i in range(2):
         assert np.array_equal(edges[i], bin_edges[i])
 
 
+def test_1d_bin_edges():
+    pos = np.random.rand(1000) * 80
+    bin_edges = np.arange(0, 81, 4.)
+    hist, edges = func(pos, arena_size=80, bin_edges=bin_edges, limits=(0, 81))
+    assert np.array_equal(edges, bin_edges)
+    assert np.array_equal(hist, np.histogram(pos, bins=bin_edges)[0])
+
+
+def test_invalid_bin_edges():
+    pos = np.random.rand(1000) * 80
+    # A tuple of bin numbers is not accepted for a 1D histogram
+    with pytest.raises(ValueError):
+        func(pos, arena_size=80, bin_number=(10, 12))
+    # Edges that do not increase monotonically
+    with pytest.raises(ValueError):
+        func(pos, arena_size=80, bin_edges=np.array([0., 40., 20., 80.]))
+    with pytest.raises(ValueError):
+        opexebo.general.spatial_bin_index(pos, np.array([80., 0.]))
+    with pytest.raises(ValueError):
+        opexebo.general.spatial_bin_index(pos, np.array([40.]))
+
+
+@pytest.mark.parametrize("uniform", [True, False])
+def test_spatial_bin_index_matches_histogram(uniform):
+    rng = np.random.RandomState(0)
+    # Rounded positions, so that many lie exactly on bin edges, and some
+    # outside the edges, or NaN
+    pos = np.round(rng.rand(2, 5000) * 84 - 2, 1)
+    pos[:, rng.rand(5000) > 0.95] = np.nan
+    if uniform:
+        x_edges, y_edges = np.linspace(0, 80, 33), np.linspace(0, 80, 21)
+    else:
+        x_edges, y_edges = np.sort(rng.rand(33)) * 80, np.sort(rng.rand(21)) * 80
+    index = opexebo.general.spatial_bin_index(pos, [x_edges, y_edges])
+    expected, _, _ = np.histogram2d(pos[1], pos[0], bins=(y_edges, x_edges))
+    counts = np.bincount(index[index >= 0], minlength=expected.size)
+    assert np.array_equal(counts.reshape(expected.shape), expected)
+    index = opexebo.general.spatial_bin_index(pos[0], x_edges)
+    counts = np.bincount(index[index >= 0], minlength=x_edges.size - 1)
+    assert np.array_equal(counts, np.histogram(pos[0], bins=x_edges)[0])
+
+
+def test_return_index():
+    pos = np.random.RandomState(1).rand(2, 1000) * 80
+    limits = (0, 80, 0, 80)
+    hist, edges, index = func(pos, arena_size=80, bin_width=4, limits=limits,
+                              return_index=True)
+    assert index.shape == (1000, )
+    counts = np.bincount(index[index >= 0], minlength=hist.size)
+    assert np.array_equal(counts.reshape(hist.shape), hist)
+    # A subset of the observations, without searching for bins again
+    subset, _ = func(pos[:, ::3], arena_size=80, bin_width=4, limits=limits)
+    sub_index = index[::3]
+    counts = np.bincount(sub_index[sub_index >= 0], minlength=hist.size)
+    assert np.array_equal(counts.reshape(hist.shape), subset)
+
+
 if __name__ == "__main__":
     test_invalid_inputs()
     test_2d_input()
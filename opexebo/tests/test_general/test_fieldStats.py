@@ -0,0 +1,60 @@
+""" Tests for field_stats"""
+import numpy as np
+import pytest
+from skimage import measure
+
+from opexebo.general import field_stats as func
+
+print("=== tests_general_field_stats ===")
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        func(np.random.rand(10, 10), np.zeros((10, 12), dtype=int))
+    with pytest.raises(ValueError):
+        func(np.random.rand(10, 10), -np.ones((10, 10), dtype=int))
+
+
+def test_no_fields():
+    fields = func(np.random.rand(10, 10), np.zeros((10, 10), dtype=int))
+    assert fields.size == 0
+
+
+def test_matches_regionprops():
+    rng = np.random.RandomState(0)
+    rate_map = rng.rand(30, 40)
+    labels = measure.label(rate_map > 0.7, connectivity=1)
+    fields = func(rate_map, labels)
+    regions = measure.regionprops(labels, intensity_image=rate_map)
+    assert fields.size == len(regions)
+    for field, region in zip(fields, regions):
+        values = rate_map[labels == region.label]
+        assert field["field"] == region.label
+        assert field["area"] == region.area
+        assert np.array_equal(field["bbox"], region.bbox)
+        assert np.allclose(field["centroid_coords"], region.centroid)
+        assert np.isclose(field["mean_rate"], values.mean())
+        assert field["peak_rate"] == values.max()
+        assert rate_map[tuple(field["peak_coords"])] == values.max()
+
+
+def test_invalid_bins():
+    rate_map = np.array([[1., 5., np.nan, 0.],
+                         [2., 5., 3., 0.]])
+    labels = np.array([[1, 1, 1, 0],
+                       [1, 1, 1, 4]])
+    fields = func(rate_map, labels)
+    assert np.array_equal(fields["field"], [1, 4])
+    assert np.array_equal(fields["area"], [6, 1])
+    # NaN bins count towards the area, but not the rates. First peak is kept
+    assert np.array_equal(fields["peak_coords"][0], [0, 1])
+    assert fields["mean_rate"][0] == 16 / 5
+    masked = np.ma.masked_greater(rate_map, 4)
+    fields = func(masked, labels, index=[1])
+    assert fields["peak_rate"][0] == 3
+    assert fields["mean_rate"][0] == 2
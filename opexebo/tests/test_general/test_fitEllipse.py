@@ -0,0 +1,50 @@
+""" Tests for fit_ellipse"""
+import numpy as np
+import pytest
+
+from opexebo.general import fit_ellipse, fit_ellipse_batch as func
+
+print("=== tests_general_fit_ellipse ===")
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        func(np.zeros((3, 6)), np.zeros((3, 5)))
+    with pytest.raises(ValueError):
+        func(np.full((3, 6), np.nan), np.zeros((3, 6)), np.ones((3, 6), dtype=bool))
+
+
+def test_matches_single():
+    rng = np.random.RandomState(0)
+    t = rng.rand(50, 9) * 2 * np.pi
+    X = 5 + (rng.rand(50, 1) * 10 + 1) * np.cos(t) + rng.randn(50, 9) * 0.2
+    Y = 3 + (rng.rand(50, 1) * 6 + 1) * np.sin(t) + rng.randn(50, 9) * 0.2
+    valid = np.arange(9) < rng.randint(6, 10, (50, 1))
+    result = np.column_stack(func(X, Y, valid))
+    for i in range(50):
+        expected = fit_ellipse(X[i, valid[i]], Y[i, valid[i]])
+        assert np.allclose(result[i], expected)
+    # Padding with NaN is equivalent to a mask
+    assert np.allclose(np.column_stack(func(np.where(valid, X, np.nan), Y)), result)
+
+
+def test_singular():
+    X = np.array([[1., 2, 3, 4, 5, 6], [1, 1, 1, 1, 1, 1]])
+    Y = np.array([[0., 1, 0, 2, 3, 1], [1, 2, 3, 4, 5, 6]])
+    result = np.column_stack(func(X, Y))
+    assert np.allclose(result[0], fit_ellipse(X[0], Y[0]))
+    assert np.isnan(result[1]).all()
+
+
+def test_exact_ellipse():
+    t = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+    theta = 0.3
+    X = 5 + 4 * np.cos(t) * np.cos(theta) - 2 * np.sin(t) * np.sin(theta)
+    Y = 3 + 4 * np.cos(t) * np.sin(theta) + 2 * np.sin(t) * np.cos(theta)
+    assert np.allclose(fit_ellipse(X, Y), (5, 3, 4, 2, theta))
+    assert np.isnan(fit_ellipse(np.ones(6), np.arange(6.))).all()
@@ -0,0 +1,80 @@
+""" Tests for normalised cross correlation"""
+import numpy as np
+import pytest
+from scipy.stats import pearsonr
+
+from opexebo.general import normxcorr2_general as func
+from opexebo.general import normxcorr2_pairwise
+
+print("=== tests_general_normxcorr2_general ===")
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        func(np.random.rand(10))
+    with pytest.raises(ValueError):
+        func(np.full((10, 10), np.nan))
+    with pytest.raises(ValueError):
+        func(np.random.rand(10, 10), np.random.rand(10, 12))
+
+
+def test_cross_correlation():
+    """At zero lag, the cross correlation is the Pearson correlation"""
+    a = np.random.rand(20, 25)
+    b = np.random.rand(20, 25)
+    C = func(a, b)
+    assert C.shape == (39, 49)
+    assert np.isclose(C[19, 24], pearsonr(a.ravel(), b.ravel())[0])
+    assert np.allclose(func(a, a), func(a))
+    stack = func(np.array([a, b]), np.array([b, a]))
+    assert np.allclose(stack[0], C)
+    assert np.allclose(stack[1], func(b, a))
+
+
+def _well_overlapped(shape, min_overlap=4):
+    """Lags at which at least `min_overlap` bins overlap. At the outermost lags
+    only one or two bins overlap, and the correlation is ill-conditioned"""
+    rows = shape[0] - np.abs(np.arange(1 - shape[0], shape[0]))
+    cols = shape[1] - np.abs(np.arange(1 - shape[1], shape[1]))
+    return np.outer(rows, cols) >= min_overlap
+
+
+def test_pairwise():
+    arrays = np.random.rand(4, 15, 18)
+    pairs = list(normxcorr2_pairwise(arrays))
+    assert [(i, j) for i, j, _ in pairs] == [(0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)]
+    good = _well_overlapped(arrays.shape[1:])
+    for i, j, C in pairs:
+        assert np.allclose(C[good], func(arrays[i], arrays[j])[good], rtol=0, atol=1e-10)
+
+
+def test_setup_cache():
+    from opexebo.general.normxcorr2_general import _fft_setup
+    _fft_setup.cache_clear()
+    a = np.random.rand(3, 17, 23)
+    C = func(a)
+    assert np.allclose(func(a, workers=2), C)
+    assert _fft_setup.cache_info().hits == 1
+    assert _fft_setup((17, 23)).fft_shape == (36, 45)
+
+
+def test_masked():
+    from opexebo.general import normxcorr2_masked
+    a = np.random.rand(20, 25)
+    b = np.random.rand(20, 25)
+    good = _well_overlapped(a.shape)
+    assert np.allclose(normxcorr2_masked(a)[good], func(a)[good], rtol=0, atol=1e-10)
+    assert np.allclose(normxcorr2_masked(a, b)[good], func(a, b)[good], rtol=0, atol=1e-10)
+    # At zero lag, only the valid bins contribute
+    a[3:6, 4:9] = np.nan
+    b = np.ma.masked_where(np.random.rand(20, 25) > 0.8, b)
+    C = normxcorr2_masked(a, b)
+    good = np.isfinite(a) & ~b.mask
+    assert np.isclose(C[19, 24], pearsonr(a[good], b.data[good])[0])
+    stack = normxcorr2_masked(np.array([a, a]), mask=np.zeros((2, 20, 25), dtype=bool))
+    assert np.allclose(stack[1], normxcorr2_masked(a))
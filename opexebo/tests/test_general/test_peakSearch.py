@@ -0,0 +1,81 @@
+""" Tests for peak_search"""
+import numpy as np
+import pytest
+
+from opexebo.general import peak_search as func
+
+print("=== tests_general_peak_search ===")
+
+
+###############################################################################
+################                HELPER FUNCTIONS
+###############################################################################
+
+
+def _blobs(shape, centres, amplitudes, widths):
+    y, x = np.indices(shape)
+    image = np.zeros(shape)
+    for (cy, cx), a, w in zip(centres, amplitudes, widths):
+        image += a * np.exp(-((y-cy)**2 + (x-cx)**2) / (2*w*w))
+    return image
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        func(np.random.rand(10, 10), search_method="unknown")
+    with pytest.raises(NotImplementedError):
+        func(np.random.rand(10, 10), search_method="ndimage", maxima=False)
+    for shape in ((10, ), (2, 2, 10, 10)):
+        for search_method in ("default", "ndimage"):
+            with pytest.raises(ValueError):
+                func(np.random.rand(*shape), search_method=search_method)
+
+
+def test_ndimage_deblend():
+    """Overlapping fields are deblended, isolated fields are found"""
+    centres = [(10, 12), (28, 35), (13, 18)]
+    image = _blobs((40, 50), centres, [1, 0.8, 0.5], [2, 2, 1.4])
+    peaks = func(image, search_method="ndimage")
+    assert sorted(map(tuple, peaks)) == sorted(centres)
+    # Each field is a separate object when the background is zero
+    image[image < 0.05] = 0
+    peaks = func(image, search_method="ndimage")
+    assert sorted(map(tuple, peaks)) == sorted(centres)
+    # A small branch is merged into its parent
+    peaks = func(image, search_method="ndimage", deblend_cont=0.5)
+    assert len(peaks) == 2
+
+
+def test_ndimage_mask_and_background():
+    centres = [(10, 12), (28, 35)]
+    image = _blobs((40, 50), centres, [1, 0.8], [2, 2])
+    image += 0.01 * np.random.RandomState(0).rand(*image.shape)
+    peaks = func(image, search_method="ndimage", null_background=False, threshold=3)
+    assert sorted(map(tuple, peaks)) == sorted(centres)
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[20:, 25:] = True
+    peaks = func(image, search_method="ndimage", null_background=False, threshold=3,
+                 mask=mask)
+    assert [tuple(p) for p in peaks] == [(10, 12)]
+    assert func(np.zeros((10, 10)), search_method="ndimage").shape == (0, 2)
+
+
+@pytest.mark.parametrize("search_method", ["default", "ndimage"])
+def test_stack(search_method):
+    """A stack gives the same peaks as each image alone, with the index of
+    the image in the first column"""
+    rng = np.random.RandomState(0)
+    stack = np.array([_blobs((40, 50), rng.rand(4, 2) * 40, rng.rand(4) + 0.5, [2]*4)
+                      for _ in range(5)])
+    mask = np.zeros((40, 50), dtype=bool)
+    mask[:, :8] = True
+    peaks = func(stack, search_method=search_method, mask=mask)
+    assert peaks.shape[1] == 3
+    for n, image in enumerate(stack):
+        expected = func(image, search_method=search_method, mask=mask)
+        assert np.array_equal(peaks[peaks[:, 0] == n, 1:], expected)
@@ -0,0 +1,77 @@
+""" Tests for RegionTracker"""
+import numpy as np
+import pytest
+from scipy import ndimage
+from skimage import morphology
+
+from opexebo.general import RegionTracker as func
+
+print("=== tests_general_region_tracker ===")
+
+
+###############################################################################
+################                MAIN TESTS
+###############################################################################
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        func(np.random.rand(10), (0, ))
+    with pytest.raises(ValueError):
+        func(np.full((10, 10), np.nan), (0, 0))
+    with pytest.raises(ValueError):
+        func(np.random.rand(10, 10), (0, 0), ignore=np.zeros((10, 12), dtype=bool))
+    with pytest.raises(ValueError):
+        func(np.random.rand(10, 10), (0, 0), floor=0.5).area(0.4)
+
+
+def test_ring():
+    image = np.zeros((7, 7))
+    image[1:6, 1:6] = 1
+    image[2:5, 2:5] = 2
+    image[3, 3] = 0.5
+    tracker = func(image, (2, 2))
+    assert tracker.area(2) == 8
+    assert tracker.holes(2) == 1
+    assert tracker.euler_number(2) == 0
+    assert tracker.area(0.5) == 25
+    assert tracker.euler_number(0.5) == 1
+    assert tracker.euler_number(3) == 0
+    # A hole of ignored pixels is not a hole
+    ignore = np.zeros(image.shape, dtype=bool)
+    ignore[3, 3] = True
+    assert func(image, (2, 2), ignore=ignore).holes(2) == 0
+
+
+def test_matches_thresholding():
+    rng = np.random.RandomState(0)
+    for _ in range(10):
+        image = ndimage.gaussian_filter(rng.rand(30, 35), 1.2)
+        ignore = rng.rand(30, 35) > 0.9
+        seed = np.unravel_index(np.argmax(image), image.shape)
+        floor = np.percentile(image, 20)
+        tracker = func(image, seed, floor=floor, ignore=ignore)
+        for threshold in np.linspace(floor, image.max(), 20):
+            labels = morphology.label(image >= threshold, connectivity=1)
+            region = labels == labels[seed]
+            holes = ndimage.binary_fill_holes(region) & ~region & ~ignore
+            assert tracker.area(threshold) == region.sum()
+            assert np.array_equal(np.sort(tracker.pixels(threshold)), np.flatnonzero(region))
+            assert (tracker.holes(threshold) > 0) == holes.any()
+
+
+def test_reseed_update():
+    """Moving and updating a tracker matches constructing a new one"""
+    rng = np.random.RandomState(1)
+    image = ndimage.gaussian_filter(rng.rand(25, 30), 1.5)
+    ignore = rng.rand(25, 30) > 0.9
+    tracker = func(image, (0, 0), ignore=ignore)
+    seed = np.unravel_index(np.argmax(image), image.shape)
+    tracker.reseed(seed)
+    raised = image.max() * 1.5
+    image[5:9, 10:15] = raised
+    tracker.update((slice(5, 9), slice(10, 15)), raised)
+    expected = func(image, seed, ignore=ignore)
+    for threshold in np.linspace(image.min(), image[seed], 15):
+        assert tracker.area(threshold) == expected.area(threshold)
+        assert tracker.holes(threshold) == expected.holes(threshold)
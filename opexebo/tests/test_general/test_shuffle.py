@@ -27,6 +27,18 @@ def test_output_structure():
     print("test_output_structure() passed")
 
 
+def test_seed():
+    """The same seed gives the same offsets"""
+    times = np.random.randint(0, 100, size=100)
+    tr = np.arange(111)
+    out_a, inc_a = func(times, 13, 20, tracking_range=tr, seed=5)
+    out_b, inc_b = func(times, 13, 20, tracking_range=tr, seed=5)
+    _, inc_c = func(times, 13, 20, tracking_range=tr, seed=6)
+    assert np.array_equal(inc_a, inc_b)
+    assert np.array_equal(out_a, out_b)
+    assert not np.array_equal(inc_a, inc_c)
+
+
 def WIP_test_consistent_offset():
     '''All the extra faff here is to deal with the fact that since times does
     not necessarily fill the entire tracking range. Information can be "lost"
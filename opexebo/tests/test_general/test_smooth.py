@@ -2,7 +2,7 @@
 import numpy as np
 import pytest
 
-from opexebo.general import smooth as func
+from opexebo.general import smooth as func, smooth_cache_info
 
 print("=== tests_general_smooth ===")
 
@@ -22,3 +22,86 @@ def test_invalid_inputs():
         func(d, sigma=2)
     print("test_invalid_inputs passed")
     return True
+
+
+def test_invalid_method():
+    with pytest.raises(ValueError):
+        func(np.ones((5, 5)), sigma=2, method="spline")
+
+
+@pytest.mark.parametrize("sigma", [0.2, 1, 2.2, 3])
+@pytest.mark.parametrize("circular", [False, True])
+def test_separable_matches_direct(sigma, circular):
+    rng = np.random.RandomState(0)
+    for shape in ((40, 40), (33, 57), (300, )):
+        data = rng.rand(*shape) * 5
+        nans = np.where(rng.rand(*shape) > 0.8, np.nan, data)
+        masked = np.ma.masked_array(data, rng.rand(*shape) > 0.8)
+        for d, kwargs in ((data, {}), (nans, {}), (masked, {}),
+                          (masked, {"mask_fill": np.nan})):
+            direct = func(d, sigma, circular=circular, method="direct", **kwargs)
+            separable = func(d, sigma, circular=circular, method="separable", **kwargs)
+            assert type(direct) == type(separable)
+            assert np.allclose(np.ma.getdata(direct), np.ma.getdata(separable),
+                               rtol=0, atol=1e-12)
+            assert np.array_equal(np.ma.getmaskarray(direct), np.ma.getmaskarray(separable))
+
+
+def test_invalid_axes():
+    d = np.ones((4, 5, 5))
+    for axes in (3, (1, 1), (1, 2.5), ()):
+        with pytest.raises(ValueError):
+            func(d, sigma=2, axes=axes)
+    with pytest.raises(NotImplementedError):
+        func(d, sigma=2, axes=(0, 1, 2), method="direct")
+
+
+@pytest.mark.parametrize("method", ["direct", "separable"])
+def test_axes_match_loop(method):
+    rng = np.random.RandomState(0)
+    stack = np.ma.masked_array(rng.rand(5, 30, 40) * 5, rng.rand(5, 30, 40) > 0.8)
+    smoothed = func(stack, 2, axes=(1, 2), method=method)
+    for i, rmap in enumerate(stack):
+        expected = func(rmap, 2, method=method)
+        assert np.array_equal(smoothed[i].data, expected.data)
+        assert np.array_equal(smoothed[i].mask, expected.mask)
+    rates = rng.rand(30, 200)
+    smoothed = func(rates, 3.5, axes=-1, method=method)
+    for i, rate in enumerate(rates):
+        assert np.allclose(smoothed[i], func(rate, 3.5, method=method), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("sigma", [1, 2.2, 12])
+@pytest.mark.parametrize("circular", [False, True])
+def test_fft_matches_separable(sigma, circular):
+    rng = np.random.RandomState(0)
+    for shape in ((40, 40), (7, 57), (300, )):
+        data = rng.rand(*shape) * 5
+        nans = np.where(rng.rand(*shape) > 0.8, np.nan, data)
+        masked = np.ma.masked_array(data, rng.rand(*shape) > 0.8)
+        for d, kwargs in ((data, {}), (nans, {}), (masked, {"mask_fill": np.nan})):
+            separable = func(d, sigma, circular=circular, method="separable", **kwargs)
+            for method in ("fft", "auto"):
+                other = func(d, sigma, circular=circular, method=method, **kwargs)
+                assert np.allclose(np.ma.getdata(separable), np.ma.getdata(other),
+                                   rtol=0, atol=1e-10)
+    # Bins with no valid neighbours are NaN, as for the other methods
+    data = np.full(100, np.nan)
+    data[:3] = 1
+    assert np.array_equal(np.isnan(func(data, 2, method="fft")),
+                          np.isnan(func(data, 2, method="separable")))
+
+
+def test_kernel_cache():
+    data = np.random.RandomState(0).rand(40, 40)
+    sigma = 1.2345
+    before = smooth_cache_info()
+    first = func(data, sigma, method="fft")
+    second = func(data, sigma, method="fft")
+    after = smooth_cache_info()
+    assert np.array_equal(first, second)
+    assert after["taps"].misses == before["taps"].misses + 1
+    assert after["spectra"].hits > before["spectra"].hits
+    func(data, sigma, method="direct")
+    func(data, sigma, method="direct")
+    assert smooth_cache_info()["kernels"].hits == after["kernels"].hits + 1